@@ -1,140 +1,136 @@
 from datetime import datetime
 import asyncio
 import httpx
-from exchange.pexchange import get_bot
+from exchange.pexchange import get_bot, get_async_client, configured_exchanges, configured_kis_numbers
 from exchange.utility import settings, log_message
-from typing import Dict, List
+from exchange.utility.fx import fx_rate
+from typing import Dict, List, Tuple
 import json
+import os
+import time
 import traceback
 
+# 동시에 조회할 KIS 계좌 수
+KIS_BALANCE_CONCURRENCY = int(os.getenv("KIS_BALANCE_CONCURRENCY", "5"))
+# 거래소별 자산 조회 제한 시간(초)
+CRYPTO_BALANCE_TIMEOUT = float(os.getenv("CRYPTO_BALANCE_TIMEOUT", "10"))
+
 
 class AssetMonitor:
     def __init__(self):
         self.webhook_url = settings.DISCORD_WEBHOOK_URL
         self.last_report_time = None
         
-    async def get_crypto_assets(self) -> Dict[str, Dict]:
-        """암호화폐 거래소 자산 조회"""
-        assets = {}
-        
-        # Binance
-        try:
-            if settings.BINANCE_KEY:
-                binance = get_bot("BINANCE")
-                balance = binance.client.fetch_balance()
-                assets["BINANCE"] = {
-                    "total_usdt": balance.get("USDT", {}).get("total", 0),
-                    "balances": {k: v for k, v in balance.get("total", {}).items() if v > 0}
-                }
-        except Exception as e:
-            log_message(f"Binance 자산 조회 실패: {str(e)}")
-            
-        # Upbit
-        try:
-            if settings.UPBIT_KEY:
-                upbit = get_bot("UPBIT")
-                balance = upbit.client.fetch_balance()
-                assets["UPBIT"] = {
-                    "total_krw": balance.get("KRW", {}).get("total", 0),
-                    "balances": {k: v for k, v in balance.get("total", {}).items() if v > 0}
-                }
-        except Exception as e:
-            log_message(f"Upbit 자산 조회 실패: {str(e)}")
-            
-        # Bithumb
-        try:
-            if settings.BITHUMB_KEY:
-                bithumb = get_bot("BITHUMB")
-                balance = bithumb.get_balance()
-                assets["BITHUMB"] = {
-                    "total_krw": float(balance.get("total_krw", 0)),
-                    "balances": {k.replace('total_', '').upper(): float(v) for k, v in balance.items() 
-                               if k.startswith("total_") and float(v) > 0}
-                }
-        except Exception as e:
-            log_message(f"Bithumb 자산 조회 실패: {str(e)}")
-            
-        # Bybit
-        try:
-            if settings.BYBIT_KEY:
-                bybit = get_bot("BYBIT")
-                balance = bybit.client.fetch_balance()
-                assets["BYBIT"] = {
-                    "total_usdt": balance.get("USDT", {}).get("total", 0),
-                    "balances": {k: v for k, v in balance.get("total", {}).items() if v > 0}
-                }
-        except Exception as e:
-            log_message(f"Bybit 자산 조회 실패: {str(e)}")
-            
-        # Bitget
-        try:
-            if settings.BITGET_KEY:
-                bitget = get_bot("BITGET")
-                balance = bitget.client.fetch_balance()
-                assets["BITGET"] = {
-                    "total_usdt": balance.get("USDT", {}).get("total", 0),
-                    "balances": {k: v for k, v in balance.get("total", {}).items() if v > 0}
-                }
-        except Exception as e:
-            log_message(f"Bitget 자산 조회 실패: {str(e)}")
-            
-        # OKX
+    async def fetch_crypto_balance(self, exchange_name: str) -> Dict:
+        if exchange_name == "BITHUMB":
+            bithumb = await asyncio.to_thread(get_bot, "BITHUMB")
+            balance = await asyncio.to_thread(bithumb.get_balance)
+            return {
+                "total_krw": float(balance.get("total_krw", 0)),
+                "balances": {k.replace('total_', '').upper(): float(v) for k, v in balance.items()
+                           if k.startswith("total_") and float(v) > 0}
+            }
+
+        balance = await get_async_client(exchange_name).fetch_balance()
+        balances = {k: v for k, v in balance.get("total", {}).items() if v and v > 0}
+        if exchange_name == "UPBIT":
+            return {"total_krw": balance.get("KRW", {}).get("total", 0), "balances": balances}
+        return {"total_usdt": balance.get("USDT", {}).get("total", 0), "balances": balances}
+
+    async def get_crypto_account(self, exchange_name: str) -> Dict:
+        """거래소 하나의 자산 조회 (시간 초과/실패도 상태와 지연시간을 함께 반환)"""
+        start = time.perf_counter()
         try:
-            if settings.OKX_KEY:
-                okx = get_bot("OKX")
-                balance = okx.client.fetch_balance()
-                assets["OKX"] = {
-                    "total_usdt": balance.get("USDT", {}).get("total", 0),
-                    "balances": {k: v for k, v in balance.get("total", {}).items() if v > 0}
-                }
+            assets = await asyncio.wait_for(
+                self.fetch_crypto_balance(exchange_name), CRYPTO_BALANCE_TIMEOUT
+            )
+            assets["status"] = "ok"
+        except asyncio.TimeoutError:
+            log_message(f"{exchange_name} 자산 조회 시간 초과 ({CRYPTO_BALANCE_TIMEOUT}초)")
+            assets = {"status": "timeout"}
         except Exception as e:
-            log_message(f"OKX 자산 조회 실패: {str(e)}")
-            
+            log_message(f"{exchange_name} 자산 조회 실패: {str(e)}")
+            assets = {"status": "error", "error": str(e)}
+        assets["latency_ms"] = round((time.perf_counter() - start) * 1000)
         return assets
+
+    async def get_crypto_assets(self) -> Dict[str, Dict]:
+        """암호화폐 거래소 자산 조회 (거래소별 병렬 조회)"""
+        exchange_names = configured_exchanges()
+        results = await asyncio.gather(
+            *(self.get_crypto_account(exchange_name) for exchange_name in exchange_names)
+        )
+        return dict(zip(exchange_names, results))
     
-    async def get_stock_assets(self) -> Dict[str, Dict]:
-        """주식 계좌 자산 조회 (개선된 KIS 모듈 사용)"""
-        assets = {}
-        for kis_num in range(1, 51):
+    async def get_exchange_rate(self) -> Tuple[float, bool]:
+        """리포트 한 번에 환율은 한 번만 조회 (프로세스 공용 환율 캐시)"""
+        rate = await asyncio.to_thread(fx_rate.get)
+        return rate["rate"], rate["is_fallback"]
+
+    async def get_stock_account(self, kis_num: int, exchange_rate: float,
+                                is_rate_fallback: bool, semaphore: asyncio.Semaphore) -> Dict | None:
+        """KIS 계좌 하나의 자산 조회 (공유 AsyncClient로 비동기 조회)"""
+        async with semaphore:
+            start = time.perf_counter()
             try:
-                if getattr(settings, f'KIS{kis_num}_KEY', None):
-                    bot = get_bot('KRX', kis_number=kis_num)
-                    if hasattr(bot, 'get_balance'):
-                        balance_data = bot.get_balance()
-                        
-                        # 데이터 추출
-                        domestic = balance_data.get("domestic_balance", {})
-                        overseas = balance_data.get("overseas_balance", {})
-                        exchange_rate = balance_data.get("exchange_rate", 1350.0)
-
-                        # 국내 자산
-                        dom_total_krw = domestic.get("total_krw", 0)
-                        dom_stocks = domestic.get("stocks", [])
-
-                        # 해외 자산
-                        ovs_total_usd = overseas.get("total_usd", 0)
-                        ovs_stocks = overseas.get("stocks", [])
-                        ovs_total_krw = ovs_total_usd * exchange_rate
-                        
-                        # 전체 ��산
-                        total_krw = dom_total_krw + ovs_total_krw
-                        all_stocks = dom_stocks + ovs_stocks
-                        
-                        if total_krw > 0:
-                            assets[f'KIS{kis_num}'] = {
-                                'total_krw': total_krw,
-                                'total_krw_dom': dom_total_krw,
-                                'total_usd_ovs': ovs_total_usd,
-                                'stocks_dom': dom_stocks,
-                                'stocks_ovs': ovs_stocks,
-                                'exchange_rate': exchange_rate,
-                                'is_rate_fallback': balance_data.get("is_rate_fallback", False)
-                            }
-                    else:
-                        log_message(f'KIS{kis_num}: get_balance 메서드가 없습니다')
+                bot = await asyncio.to_thread(get_bot, 'KRX', kis_number=kis_num)
+                if not hasattr(bot, 'get_balance_async'):
+                    log_message(f'KIS{kis_num}: get_balance_async 메서드가 없습니다')
+                    return None
+                balance_data = await bot.get_balance_async(exchange_rate, is_rate_fallback)
             except Exception as e:
                 log_message(f'KIS{kis_num} 자산 조회 실패: {str(e)}')
-        return assets
+                return None
+
+        # 데이터 추출
+        domestic = balance_data.get("domestic_balance", {})
+        overseas = balance_data.get("overseas_balance", {})
+        exchange_rate = balance_data.get("exchange_rate", exchange_rate)
+
+        # 국내 자산
+        dom_total_krw = domestic.get("total_krw", 0)
+        dom_stocks = domestic.get("stocks", [])
+
+        # 해외 자산
+        ovs_total_usd = overseas.get("total_usd", 0)
+        ovs_stocks = overseas.get("stocks", [])
+        ovs_total_krw = ovs_total_usd * exchange_rate
+
+        # 전체 자산
+        total_krw = dom_total_krw + ovs_total_krw
+        if total_krw <= 0:
+            return None
+
+        timing = balance_data.get("timing", {})
+        timing["total"] = round(time.perf_counter() - start, 3)
+        return {
+            'total_krw': total_krw,
+            'total_krw_dom': dom_total_krw,
+            'total_usd_ovs': ovs_total_usd,
+            'stocks_dom': dom_stocks,
+            'stocks_ovs': ovs_stocks,
+            'exchange_rate': exchange_rate,
+            'is_rate_fallback': balance_data.get("is_rate_fallback", False),
+            'timing': timing
+        }
+
+    async def get_stock_assets(self) -> Dict[str, Dict]:
+        """주식 계좌 자산 조회 (개선된 KIS 모듈 사용, 계좌별 병렬 조회)"""
+        kis_numbers = configured_kis_numbers()
+        if not kis_numbers:
+            return {}
+
+        exchange_rate, is_rate_fallback = await self.get_exchange_rate()
+        semaphore = asyncio.Semaphore(KIS_BALANCE_CONCURRENCY)
+        results = await asyncio.gather(*(
+            self.get_stock_account(kis_num, exchange_rate, is_rate_fallback, semaphore)
+            for kis_num in kis_numbers
+        ))
+        return {
+            f'KIS{kis_num}': result
+            for kis_num, result in zip(kis_numbers, results)
+            if result
+        }
 
     def format_asset_message(self, crypto_assets: Dict, stock_assets: Dict) -> Dict:
         """디스코드 메시지 포맷팅 (개선된 KIS 데이터 반영)"""
@@ -152,7 +148,9 @@ class AssetMonitor:
             crypto_field = {"name": "🪙 암호화폐 거래소", "value": "", "inline": False}
             for exchange, data in crypto_assets.items():
                 value_lines = [f"**{exchange}**"]
-                if "total_krw" in data:
+                if data.get("status", "ok") != "ok":
+                    value_lines.append(f"⚠️ 조회 실패 ({data['status']})")
+                elif "total_krw" in data:
                     value_lines.append(f"총 자산: {data['total_krw']:,.0f} KRW")
                 else:
                     value_lines.append(f"총 자산: {data.get('total_usdt', 0):,.2f} USDT")
@@ -212,8 +210,9 @@ class AssetMonitor:
     async def report_assets(self):
         """자산 현황 리포트"""
         try:
-            crypto_assets = await self.get_crypto_assets()
-            stock_assets = await self.get_stock_assets()
+            crypto_assets, stock_assets = await asyncio.gather(
+                self.get_crypto_assets(), self.get_stock_assets()
+            )
             
             if crypto_assets or stock_assets:
                 message = self.format_asset_message(crypto_assets, stock_assets)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+POA Bot 핫패스 마이크로벤치마크
+
+사용법:
+    python benchmark.py registry
+    python benchmark.py kis_order
+    python benchmark.py db_contention
+"""
+import timeit
+import fire
+
+
+def report(name: str, seconds: float, number: int):
+    print(f"{name:<40} {seconds / number * 1_000_000:>10.3f} us/op")
+
+
+def registry(number: int = 100_000):
+    """get_bot 조회 비용: 예전 Exchange(**payload).dict() 방식 vs ClientRegistry"""
+    from pydantic import create_model
+    from exchange.pexchange import (
+        ClientRegistry,
+        Binance,
+        Upbit,
+        Bithumb,
+        Bybit,
+        Bitget,
+        Okx,
+        ImprovedKoreaInvestment,
+    )
+
+    classes = {
+        "UPBIT": Upbit,
+        "BINANCE": Binance,
+        "BITHUMB": Bithumb,
+        "BYBIT": Bybit,
+        "BITGET": Bitget,
+        "OKX": Okx,
+    } | {f"KIS{i}": ImprovedKoreaInvestment for i in range(1, 51)}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    # 변경 전 pexchange.Exchange 와 같은 56개 필드 모델
+    Exchange = create_model(
+        "Exchange",
+        __config__=Config,
+        **{key: (cls | None, None) for key, cls in classes.items()},
+    )
+
+    # 네트워크 없이 인스턴스만 생성
+    payload = {
+        key: cls.__new__(cls)
+        for key, cls in classes.items()
+        if key in ("BINANCE", "UPBIT", "KIS1", "KIS2")
+    }
+    clients = ClientRegistry()
+    for key, client in payload.items():
+        clients.get_or_create(key, lambda client=client: client)
+
+    before = timeit.timeit(lambda: Exchange(**payload).dict()["BINANCE"], number=number)
+    after = timeit.timeit(lambda: clients.get_or_create("BINANCE", None), number=number)
+    report("Exchange(**payload).dict()[name]", before, number)
+    report("ClientRegistry.get_or_create(name)", after, number)
+    print(f"{before / after:.0f}x")
+
+
+def kis_order(number: int = 100_000):
+    """KIS 주문 헤더/바디 생성 비용: 예전 pydantic 모델 방식 vs 미리 만든 템플릿"""
+    import copy
+    from exchange.stock.kis_improved import ImprovedKoreaInvestment
+    from exchange.stock.schemas import (
+        AccountInfo,
+        KoreaBuyOrderHeaders,
+        KoreaMarketOrderBody,
+        UsaBuyOrderHeaders,
+        UsaOrderBody,
+        UsaOrderType,
+        ExchangeCode,
+    )
+
+    # 네트워크/DB 없이 템플릿만 준비
+    bot = ImprovedKoreaInvestment.__new__(ImprovedKoreaInvestment)
+    bot.key, bot.secret = "appkey", "appsecret"
+    bot.account_number, bot.account_code = "12345678", "01"
+    bot.access_token = "token"
+    bot.order_exchange_code = {
+        "NASDAQ": ExchangeCode.NASDAQ,
+        "NYSE": ExchangeCode.NYSE,
+        "AMEX": ExchangeCode.AMEX,
+    }
+    bot._compile_order_templates()
+
+    base_headers = {"authorization": "Bearer token", "appkey": "appkey", "appsecret": "appsecret", "custtype": "P"}
+    base_order_body = AccountInfo(CANO="12345678", ACNT_PRDT_CD="01")
+
+    # 변경 전 create_order 의 KRX 시장가 매수 / 미국 지정가 매수 경로
+    def before_krx():
+        body = base_order_body.dict()
+        headers = copy.deepcopy(base_headers)
+        headers |= KoreaBuyOrderHeaders(**headers).dict()
+        body |= KoreaMarketOrderBody(**body, PDNO="005930", ORD_QTY="3").dict()
+        return headers, body
+
+    def before_usa():
+        body = base_order_body.dict()
+        headers = copy.deepcopy(base_headers)
+        headers |= UsaBuyOrderHeaders(**headers).dict()
+        body |= UsaOrderBody(
+            **body,
+            PDNO="AAPL",
+            ORD_DVSN=UsaOrderType.limit.value,
+            ORD_QTY="3",
+            OVRS_ORD_UNPR="105.53",
+            OVRS_EXCG_CD=ExchangeCode.NASDAQ.value,
+        ).dict()
+        return headers, body
+
+    for name, func in (
+        ("pydantic KRX market buy", before_krx),
+        ("template KRX market buy", lambda: bot._build_order("KRX", "005930", "market", "buy", 3)),
+        ("pydantic NASDAQ limit buy", before_usa),
+        ("template NASDAQ limit buy", lambda: bot._build_order("NASDAQ", "AAPL", "limit", "buy", 3, 105.53)),
+    ):
+        report(name, timeit.timeit(func, number=number), number)
+
+
+def db_contention(threads: int = 8, number: int = 2_000, write_ratio: float = 0.1):
+    """여러 스레드가 동시에 토큰 조회/저장할 때: 예전 단일 연결+잠금 vs 스레드별 WAL 연결"""
+    import os
+    import sqlite3
+    import tempfile
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from exchange.database import ConnectionManager
+
+    read = "SELECT access_token, access_token_token_expired FROM auth WHERE exchange = :exchange;"
+    write = """
+    INSERT INTO auth (exchange, access_token, access_token_token_expired)
+    VALUES (:exchange, :access_token, :access_token_token_expired)
+    ON CONFLICT(exchange) DO UPDATE SET access_token=excluded.access_token;
+    """
+    writes_every = max(int(1 / write_ratio), 1) if write_ratio > 0 else 0
+
+    def prepare(path: str):
+        con = sqlite3.connect(path)
+        con.execute("CREATE TABLE auth (exchange TEXT PRIMARY KEY, access_token TEXT, access_token_token_expired TEXT)")
+        for i in range(1, 51):
+            con.execute(write, {"exchange": f"KIS{i}", "access_token": "token", "access_token_token_expired": "2099-01-01 00:00:00"})
+        con.commit()
+        con.close()
+
+    def run(worker) -> float:
+        def job(thread_index: int):
+            for i in range(number):
+                params = {"exchange": f"KIS{(thread_index + i) % 50 + 1}"}
+                if writes_every and i % writes_every == 0:
+                    worker(write, params | {"access_token": f"t{i}", "access_token_token_expired": "2099-01-01 00:00:00"}, True)
+                else:
+                    worker(read, params, False)
+
+        start = timeit.default_timer()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(job, range(threads)))
+        return timeit.default_timer() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 변경 전: 프로세스 전체가 연결/커서 하나를 공유 (스레드에서 쓰려면 잠금이 필요)
+        path = os.path.join(directory, "before.db")
+        prepare(path)
+        con = sqlite3.connect(path, check_same_thread=False)
+        cursor = con.cursor()
+        lock = threading.Lock()
+
+        def before(query, params, is_write):
+            with lock:
+                cursor.execute(query, params)
+                if is_write:
+                    con.commit()
+                else:
+                    cursor.fetchone()
+
+        before_seconds = run(before)
+        con.close()
+
+        path = os.path.join(directory, "after.db")
+        prepare(path)
+        connections = ConnectionManager(path)
+
+        def after(query, params, is_write):
+            con = connections.get()
+            cursor = con.execute(query, params)
+            if is_write:
+                con.commit()
+            else:
+                cursor.fetchone()
+
+        after_seconds = run(after)
+        connections.close_all()
+
+    total = threads * number
+    report(f"single connection + lock ({threads} threads)", before_seconds, total)
+    report(f"per-thread WAL connection ({threads} threads)", after_seconds, total)
+    print(f"{before_seconds / after_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    fire.Fire({"registry": registry, "kis_order": kis_order, "db_contention": db_contention})
@@ -1,6 +1,10 @@
 from exchange.pexchange import ccxt, ccxt_async, httpx
 from devtools import debug
 from exchange.model import MarketOrder
+from exchange.market_cache import load_markets
+from exchange.micro_cache import MicroCache
+from exchange.marketdata import market_data
+from exchange.utility import ws
 import exchange.error as error
 
 
@@ -13,10 +17,15 @@ class Binance:
                 "options": {"adjustForTimeDifference": True},
             }
         )
-        self.client.load_markets()
+        load_markets(self.client)
+        self.cache = MicroCache()
         self.position_mode = "one-way"
         self.order_info: MarketOrder = None
 
+    @property
+    def user_stream(self):
+        return ws.user_stream
+
     def init_info(self, order_info: MarketOrder):
         self.order_info = order_info
 
@@ -43,14 +52,18 @@ class Binance:
             self.client.options["defaultType"] = "spot"
 
     def get_ticker(self, symbol: str):
-        return self.client.fetch_ticker(symbol)
+        return self.cache.fetch_ticker(self.client, symbol)
 
     def get_price(self, symbol: str):
+        # 웹소켓 시세가 신선하면 네트워크 왕복 없이 사용
+        price = market_data.last_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol=None, all=False):
         if symbol is None and all:
-            positions = self.client.fetch_balance()["info"]["positions"]
+            positions = self.cache.fetch_balance(self.client)["info"]["positions"]
             positions = [
                 position
                 for position in positions
@@ -59,8 +72,10 @@ class Binance:
             return positions
 
         positions = None
+        # 유저 데이터 스트림이 살아 있으면 fapi 원본 모양의 포지션을 네트워크 없이 읽는다
+        is_raw = self.order_info.is_coinm
         if self.order_info.is_coinm:
-            positions = self.client.fetch_balance()["info"]["positions"]
+            positions = self.cache.fetch_balance(self.client)["info"]["positions"]
             positions = [
                 position
                 for position in positions
@@ -68,18 +83,23 @@ class Binance:
                 and position["symbol"] == self.client.market(symbol).get("id")
             ]
         else:
-            positions = self.client.fetch_positions(symbols=[symbol])
+            if self.user_stream is not None:
+                positions = self.user_stream.get_positions(self.client.market(symbol)["id"])
+                is_raw = positions is not None
+            if positions is None:
+                positions = self.cache.fetch_positions(self.client, [symbol])
 
         long_contracts = None
         short_contracts = None
         if positions:
-            if self.order_info.is_coinm:
+            if is_raw:
                 for position in positions:
                     amt = float(position["positionAmt"])
                     if position["positionSide"] == "LONG":
                         long_contracts = amt
                     elif position["positionSide"] == "SHORT":
-                        short_contracts: float = amt
+                        # 헷지 모드의 숏 positionAmt는 음수이므로 ccxt contracts처럼 양수로 맞춘다
+                        short_contracts: float = abs(amt)
                     elif position["positionSide"] == "BOTH":
                         if amt > 0:
                             long_contracts = amt
@@ -112,9 +132,9 @@ class Binance:
             and (self.order_info.is_buy or self.order_info.is_sell)
         ):
             free_balance = (
-                self.client.fetch_free_balance()
+                self.cache.fetch_balance(self.client)["free"]
                 if not self.order_info.is_total
-                else self.client.fetch_total_balance()
+                else self.cache.fetch_balance(self.client)["total"]
             )
             free_balance_by_base = free_balance.get(base)
 
@@ -290,22 +310,28 @@ class Binance:
         inverted_side = (
             "sell" if side.lower() == "buy" else "buy"
         )  # buy면 sell, sell이면 buy * 진입 포지션과 반대로 주문 넣어줘 야함
-        self.client.create_order(
-            symbol,
-            "STOP_MARKET",
-            inverted_side,
-            amount,
-            None,
-            {"stopPrice": stop_price, "newClientOrderId": "STOP_MARKET"},
-        )  # STOP LOSS 오더
-        self.client.create_order(
-            symbol,
-            "TAKE_PROFIT_MARKET",
-            inverted_side,
-            amount,
-            None,
-            {"stopPrice": profit_price, "newClientOrderId": "TAKE_PROFIT_MARKET"},
-        )  # TAKE profit 오더
+        from exchange.retry import invalidate_account_cache
+
+        try:
+            self.client.create_order(
+                symbol,
+                "STOP_MARKET",
+                inverted_side,
+                amount,
+                None,
+                {"stopPrice": stop_price, "newClientOrderId": "STOP_MARKET"},
+            )  # STOP LOSS 오더
+            self.client.create_order(
+                symbol,
+                "TAKE_PROFIT_MARKET",
+                inverted_side,
+                amount,
+                None,
+                {"stopPrice": profit_price, "newClientOrderId": "TAKE_PROFIT_MARKET"},
+            )  # TAKE profit 오더
+        finally:
+            # retry를 거치지 않으므로 잔고/포지션 캐시를 직접 무효화
+            invalidate_account_cache(self)
 
         # response = self.future.private_post_order_oco({
         #     'symbol': self.future.market(symbol)['id'],
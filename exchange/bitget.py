@@ -2,6 +2,8 @@ from pprint import pprint
 from exchange.pexchange import ccxt
 from exchange.database import db
 from exchange.model import MarketOrder
+from exchange.market_cache import load_markets
+from exchange.micro_cache import MicroCache
 import exchange.error as error
 from devtools import debug
 
@@ -15,7 +17,8 @@ class Bitget:
                 "password": passphrase,
             }
         )
-        self.client.load_markets()
+        load_markets(self.client)
+        self.cache = MicroCache()
         self.order_info: MarketOrder = None
         self.position_mode = "hedge"
 
@@ -45,13 +48,13 @@ class Bitget:
             self.client.options["defaultType"] = "spot"
 
     def get_ticker(self, symbol: str):
-        return self.client.fetch_ticker(symbol)
+        return self.cache.fetch_ticker(self.client, symbol)
 
     def get_price(self, symbol: str):
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol):
-        positions = self.client.fetch_positions([symbol])
+        positions = self.cache.fetch_positions(self.client, [symbol])
         long_contracts = None
         short_contracts = None
 
@@ -89,9 +92,9 @@ class Bitget:
             and (self.order_info.is_buy or self.order_info.is_sell)
         ):
             free_balance = (
-                self.client.fetch_free_balance({"coin": base})
+                self.cache.fetch_balance(self.client, {"coin": base})["free"]
                 if not self.order_info.is_total
-                else self.client.fetch_total_balance({"coin": base})
+                else self.cache.fetch_balance(self.client, {"coin": base})["total"]
             )
             free_balance_by_base = free_balance.get(base)
         if free_balance_by_base is None or free_balance_by_base == 0:
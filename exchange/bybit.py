@@ -1,6 +1,8 @@
 from pprint import pprint
 from exchange.pexchange import ccxt
 from exchange.model import MarketOrder
+from exchange.market_cache import load_markets
+from exchange.micro_cache import MicroCache
 import time
 import exchange.error as error
 from devtools import debug
@@ -15,7 +17,8 @@ class Bybit:
                 "options": {"adjustForTimeDifference": True},
             }
         )
-        self.client.load_markets()
+        load_markets(self.client)
+        self.cache = MicroCache()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
@@ -48,13 +51,13 @@ class Bybit:
             self.client.options["defaultType"] = "spot"
 
     def get_ticker(self, symbol: str):
-        return self.client.fetch_ticker(symbol)
+        return self.cache.fetch_ticker(self.client, symbol)
 
     def get_price(self, symbol: str):
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol):
-        positions = self.client.fetch_positions(symbols=[symbol])
+        positions = self.cache.fetch_positions(self.client, [symbol])
         long_contracts = None
         short_contracts = None
         if positions:
@@ -84,9 +87,9 @@ class Bybit:
             and (self.order_info.is_buy or self.order_info.is_sell)
         ):
             free_balance = (
-                self.client.fetch_free_balance()
+                self.cache.fetch_balance(self.client)["free"]
                 if not self.order_info.is_total
-                else self.client.fetch_total_balance()
+                else self.cache.fetch_balance(self.client)["total"]
             )
             free_balance_by_base = free_balance.get(base)
 
@@ -1,11 +1,69 @@
 import sqlite3
+import threading
 import traceback
 import os
+from contextlib import contextmanager
 from pathlib import Path
 
 current_file_direcotry = os.path.dirname(os.path.realpath(__file__))
 parent_directory = Path(current_file_direcotry).parent
 
+# 연결마다 재사용할 준비된 문장(prepared statement) 수
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "128"))
+# 다른 연결이 쓰는 중일 때 기다리는 최대 시간(초)
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "5"))
+
+
+def connect(database_url: str) -> sqlite3.Connection:
+    # 닫기는 종료 시 다른 스레드에서 하므로 check_same_thread는 끈다 (사용은 만든 스레드에서만)
+    con = sqlite3.connect(
+        database_url,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    # WAL이면 쓰는 동안에도 다른 스레드의 조회가 막히지 않고, NORMAL이면 커밋마다 fsync하지 않는다
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    return con
+
+
+class ConnectionManager:
+    """스레드마다 SQLite 연결을 하나씩 만들어 재사용"""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections: dict[threading.Thread, sqlite3.Connection] = {}
+        # close_all() 이후에는 각 스레드가 새 연결을 만들도록 세대를 올린다
+        self.generation = 0
+
+    def get(self) -> sqlite3.Connection:
+        con = getattr(self.local, "con", None)
+        if con is None or self.local.generation != self.generation:
+            con = connect(self.database_url)
+            with self.lock:
+                # 끝난 스레드(임시 스레드 풀 등)의 연결은 새 연결을 만들 때 정리
+                for thread in [thread for thread in self.connections if not thread.is_alive()]:
+                    self.connections.pop(thread).close()
+                self.connections[threading.current_thread()] = con
+            self.local.con = con
+            self.local.generation = self.generation
+            self.local.depth = 0
+        return con
+
+    def close_all(self):
+        with self.lock:
+            connections, self.connections = self.connections, {}
+            self.generation += 1
+        for con in connections.values():
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
+
+
 class Database:
     def __new__(cls, *args, **kwargs):
         if not hasattr(cls, "_instance"):
@@ -16,28 +74,56 @@ class Database:
         cls = type(self)
         if not hasattr(cls, "_init"):
             self.database_url = database_url
-            self.con = sqlite3.connect(self.database_url)
-            self.cursor = self.con.cursor()
+            self.connections = ConnectionManager(self.database_url)
             cls._init = True
 
+    @property
+    def con(self) -> sqlite3.Connection:
+        """호출한 스레드의 연결"""
+        return self.connections.get()
+
     def close(self):
-        self.con.close()
+        self.connections.close_all()
 
-    def excute(self, query: str, value: dict | tuple):
-        self.cursor.execute(query, value)
-        self.con.commit()
+    @contextmanager
+    def transaction(self):
+        """블록 안의 excute들을 커밋 한 번으로 묶는다 (중첩 가능, 예외 시 롤백)"""
+        con = self.con
+        local = self.connections.local
+        local.depth += 1
+        try:
+            yield con
+        except BaseException:
+            local.depth -= 1
+            if local.depth == 0:
+                con.rollback()
+            raise
+        else:
+            local.depth -= 1
+            if local.depth == 0:
+                con.commit()
 
-    def excute_many(self, query: str, values: list[dict | tuple]):
-        self.cursor.executemany(query, values)
+    def commit(self):
         self.con.commit()
 
+    def excute(self, query: str, value: dict | tuple, commit: bool = True):
+        """commit=False면 커밋을 미뤄 다음 commit()/transaction() 때 함께 커밋"""
+        con = self.con
+        con.execute(query, value)
+        if commit and not self.connections.local.depth:
+            con.commit()
+
+    def excute_many(self, query: str, values: list[dict | tuple], commit: bool = True):
+        con = self.con
+        con.executemany(query, values)
+        if commit and not self.connections.local.depth:
+            con.commit()
+
     def fetch_one(self, query: str, value: dict | tuple):
-        self.cursor.execute(query, value)
-        return self.cursor.fetchone()
+        return self.con.execute(query, value).fetchone()
 
     def fetch_all(self, query: str, value: dict | tuple):
-        self.cursor.execute(query, value)
-        return self.cursor.fetchall()
+        return self.con.execute(query, value).fetchall()
 
     def set_auth(self, exchange, access_token, access_token_token_expired):
         query = """
@@ -55,6 +141,36 @@ class Database:
         """
         return self.fetch_one(query, {"exchange": exchange})
 
+    def set_idempotency_many(self, rows):
+        """(key, result, expires_at) 목록을 커밋 한 번으로 저장"""
+        query = """
+        INSERT INTO idempotency (key, result, expires_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+        result=excluded.result,
+        expires_at=excluded.expires_at;
+        """
+        return self.excute_many(query, rows)
+
+    def get_idempotency(self, key, now):
+        query = """
+        SELECT result, expires_at FROM idempotency WHERE key = :key AND expires_at > :now;
+        """
+        return self.fetch_one(query, {"key": key, "now": now})
+
+    def get_recent_idempotency(self, now, limit):
+        query = """
+        SELECT key, result, expires_at FROM idempotency WHERE expires_at > :now
+        ORDER BY expires_at DESC LIMIT :limit;
+        """
+        return self.fetch_all(query, {"now": now, "limit": limit})
+
+    def delete_expired_idempotency(self, now):
+        query = """
+        DELETE FROM idempotency WHERE expires_at <= :now;
+        """
+        return self.excute(query, {"now": now})
+
     def clear_auth(self):
         self.set_auth("KIS1", "nothing", "nothing")
         self.set_auth("KIS2", "nothing", "nothing")
@@ -70,6 +186,24 @@ class Database:
         );
         """
         self.excute(query, {})
+        query = """
+        CREATE TABLE IF NOT EXISTS idempotency (
+            key TEXT PRIMARY KEY,
+            result TEXT,
+            expires_at REAL
+        );
+        """
+        self.excute(query, {})
+        query = """
+        CREATE TABLE IF NOT EXISTS pocket_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT,
+            collection TEXT,
+            data TEXT,
+            created_at REAL
+        );
+        """
+        self.excute(query, {})
         # self.clear_auth()
 
 
@@ -0,0 +1,243 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import exchange.error as error
+from exchange.hedge_ledger import hedge_ledger
+from exchange.journal import journal
+from exchange.model import OrderRequest
+from exchange.pexchange import get_bot, get_bot_key, get_order_lock
+from exchange.utility import log_message
+
+KOREA_EXCHANGE = "UPBIT"
+KOREA_QUOTE = "KRW"
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+class LegError(Exception):
+    """한쪽 다리 주문 실패. 어느 거래소에서 실패했는지 함께 남긴다"""
+
+    def __init__(self, exchange: str, e: Exception):
+        self.exchange = exchange
+        self.error = e
+        super().__init__(f"{exchange}: {getattr(e, 'detail', None) or str(e)}")
+
+
+class HedgeEngine:
+    """김프 헷지의 두 다리(해외 선물 숏 / 업비트 현물 매수)를 동시에 실행
+
+    수량은 두 거래소의 수량 단위로 미리 내림해 같은 값으로 맞추고, 레버리지 설정과 업비트 가격 조회도
+    주문 전에 끝내 둔 뒤 두 주문을 동시에 보낸다. 한쪽만 체결되면 체결된 쪽을 즉시 되돌리고,
+    두 주문의 체결(응답) 시각 차이를 skew_ms로 기록한다.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.rollbacks = 0
+        self.rollback_failures = 0
+        self.skews = deque(maxlen=100)
+
+    @asynccontextmanager
+    async def locked(self, exchange_names: list[str]):
+        """두 봇의 주문 잠금을 항상 같은 순서로 잡는다 (다른 헷지/주문과 교착되지 않도록)"""
+        async with AsyncExitStack() as stack:
+            for bot_key in sorted({get_bot_key(exchange_name) for exchange_name in exchange_names}):
+                await stack.enter_async_context(get_order_lock(bot_key))
+            yield
+
+    def prepare_open(self, exchange_name: str, base: str, quote: str, amount: float, leverage: int | None):
+        """두 거래소 모두 주문 가능한 공통 수량과 주문 정보를 미리 만든다 (워커 스레드에서 호출)"""
+        bot = get_bot(exchange_name)
+        upbit = get_bot(KOREA_EXCHANGE)
+        foreign_order_info = OrderRequest(
+            exchange=exchange_name, base=base, quote=quote, side="entry/sell", type="market"
+        )
+        korea_order_info = OrderRequest(
+            exchange=KOREA_EXCHANGE, base=base, quote=KOREA_QUOTE, side="buy", type="market"
+        )
+        # 두 거래소의 수량 단위로 각각 내림한 값 중 작은 쪽을 다시 양쪽 단위로 내림
+        quantity = min(
+            float(bot.client.amount_to_precision(foreign_order_info.unified_symbol, amount)),
+            float(upbit.client.amount_to_precision(korea_order_info.unified_symbol, amount)),
+        )
+        quantity = float(bot.client.amount_to_precision(foreign_order_info.unified_symbol, quantity))
+        if quantity <= 0:
+            raise error.MinAmountError()
+        foreign_order_info.amount = quantity
+        korea_order_info.amount = quantity
+        bot.init_info(foreign_order_info)
+        upbit.init_info(korea_order_info)
+        if leverage is not None:
+            bot.set_leverage(leverage, foreign_order_info.unified_symbol)
+        # 업비트 시장가 매수는 비용(수량 x 가격)으로 주문하므로 가격도 미리 조회
+        korea_order_info.price = upbit.get_price(korea_order_info.unified_symbol)
+        return bot, upbit, foreign_order_info, korea_order_info
+
+    def run_leg(self, exchange: str, order, start: float) -> dict:
+        """주문을 보내고 보낸 시각/응답 시각(ms, 공통 시작 기준)을 함께 반환"""
+        leg = {"exchange": exchange, "sent_ms": elapsed_ms(start)}
+        try:
+            leg["result"] = order()
+        except Exception as e:
+            raise LegError(exchange, e) from e
+        leg["filled_ms"] = elapsed_ms(start)
+        return leg
+
+    def entry_foreign(self, bot, order_info: OrderRequest) -> dict:
+        result = bot.market_entry(order_info)
+        return {"order": result, "amount": result["amount"]}
+
+    def buy_korea(self, upbit, order_info: OrderRequest) -> dict:
+        result = upbit.market_order(order_info)
+        try:
+            filled = upbit.get_order(result["id"])["filled"]
+        except Exception:
+            # 주문은 접수되었으므로 조회에 실패하면 요청 수량으로 기록
+            filled = order_info.amount
+        return {"order": result, "amount": filled}
+
+    def rollback(self, exchange_name: str, base: str, quote: str, leg: dict):
+        """한쪽만 체결되었을 때 체결된 다리를 반대 주문으로 되돌린다 (워커 스레드에서 호출)"""
+        amount = leg["result"]["amount"]
+        if leg["exchange"] == KOREA_EXCHANGE:
+            upbit = get_bot(KOREA_EXCHANGE)
+            order_info = OrderRequest(exchange=KOREA_EXCHANGE, base=base, quote=KOREA_QUOTE, side="sell", amount=amount)
+            upbit.init_info(order_info)
+            return upbit.market_sell(order_info)
+        bot = get_bot(exchange_name)
+        order_info = OrderRequest(exchange=exchange_name, base=base, quote=quote, side="close/buy", amount=amount)
+        bot.init_info(order_info)
+        return bot.market_close(order_info)
+
+    def record_skew(self, legs: list[dict]) -> float | None:
+        filled = [leg["filled_ms"] for leg in legs if "filled_ms" in leg]
+        if len(filled) != 2:
+            return None
+        skew = round(abs(filled[0] - filled[1]), 3)
+        self.skews.append(skew)
+        return skew
+
+    def journal(self, legs, latency: dict):
+        """두 다리의 결과와 체결 시각 차이를 주문 기록에 남긴다"""
+        for leg, order_info in legs:
+            if isinstance(leg, BaseException):
+                journal.record(order_info, "error", error=str(leg), latency=latency)
+            else:
+                journal.record(
+                    order_info, "success", leg["result"]["order"],
+                    latency=latency | {"sent_ms": leg["sent_ms"], "filled_ms": leg["filled_ms"]},
+                )
+
+    async def open(self, exchange_name: str, base: str, quote: str, amount: float, leverage: int | None = None) -> dict:
+        """헷지 진입. 두 다리가 모두 체결되어야 원장에 기록하고, 한쪽만 체결되면 되돌린 뒤 LegError를 올린다"""
+        start = time.perf_counter()
+        async with self.locked([exchange_name, KOREA_EXCHANGE]):
+            bot, upbit, foreign_order_info, korea_order_info = await asyncio.to_thread(
+                self.prepare_open, exchange_name, base, quote, amount, leverage
+            )
+            prepare_ms = elapsed_ms(start)
+            start = time.perf_counter()
+            foreign, korea = await asyncio.gather(
+                asyncio.to_thread(
+                    self.run_leg, exchange_name, lambda: self.entry_foreign(bot, foreign_order_info), start
+                ),
+                asyncio.to_thread(
+                    self.run_leg, KOREA_EXCHANGE, lambda: self.buy_korea(upbit, korea_order_info), start
+                ),
+                return_exceptions=True,
+            )
+            self.executions += 1
+            legs = [leg for leg in (foreign, korea) if not isinstance(leg, BaseException)]
+            failures = [leg for leg in (foreign, korea) if isinstance(leg, BaseException)]
+            skew = self.record_skew(legs)
+            latency = {"prepare_ms": prepare_ms, "skew_ms": skew, "total_ms": elapsed_ms(start)}
+            self.journal(((foreign, foreign_order_info), (korea, korea_order_info)), latency)
+
+            if not failures:
+                hedge_ledger.add(exchange_name, base, quote, foreign["result"]["amount"])
+                hedge_ledger.add(KOREA_EXCHANGE, base, KOREA_QUOTE, korea["result"]["amount"])
+                return {
+                    "amount": {exchange_name: foreign["result"]["amount"], KOREA_EXCHANGE: korea["result"]["amount"]},
+                    "skew_ms": skew,
+                    "latency": latency,
+                }
+
+            for leg in legs:
+                self.rollbacks += 1
+                try:
+                    await asyncio.to_thread(self.rollback, exchange_name, base, quote, leg)
+                    log_message(
+                        f"[헷지 실패] {failures[0]} - {leg['exchange']} 체결분 {leg['result']['amount']}을 되돌렸습니다"
+                    )
+                except Exception as e:
+                    # 되돌리지 못한 다리는 원장에 남겨 헷지 종료(OFF)로 정리할 수 있게 한다
+                    self.rollback_failures += 1
+                    leg_quote = KOREA_QUOTE if leg["exchange"] == KOREA_EXCHANGE else quote
+                    hedge_ledger.add(leg["exchange"], base, leg_quote, leg["result"]["amount"])
+                    log_message(
+                        f"[헷지 실패] {failures[0]} - {leg['exchange']} 체결분 {leg['result']['amount']} 되돌리기 실패: {str(e)}"
+                    )
+            raise failures[0]
+
+    async def close(self, exchange_name: str, base: str, quote: str) -> dict | None:
+        """헷지 종료. 원장의 두 다리를 동시에 정리하고, 성공한 쪽만 원장에서 지운다
+
+        원장은 잠금을 잡은 뒤에 읽으므로 종료 요청이 동시에 들어와도 같은 수량을 두 번 정리하지 않는다.
+        정리할 수량이 (이미) 없으면 None.
+        """
+        async with self.locked([exchange_name, KOREA_EXCHANGE]):
+            records = hedge_ledger.get(base)
+            foreign_amount = records[exchange_name]["amount"]
+            korea_amount = records[KOREA_EXCHANGE]["amount"]
+            if foreign_amount <= 0 or korea_amount <= 0:
+                return None
+            foreign_order_info = OrderRequest(
+                exchange=exchange_name, base=base, quote=quote, side="close/buy", amount=foreign_amount
+            )
+            korea_order_info = OrderRequest(
+                exchange=KOREA_EXCHANGE, base=base, quote=KOREA_QUOTE, side="sell", amount=korea_amount
+            )
+
+            def close_foreign():
+                bot = get_bot(exchange_name)
+                bot.init_info(foreign_order_info)
+                return {"order": bot.market_close(foreign_order_info), "amount": foreign_amount}
+
+            def sell_korea():
+                upbit = get_bot(KOREA_EXCHANGE)
+                upbit.init_info(korea_order_info)
+                return {"order": upbit.market_sell(korea_order_info), "amount": korea_amount}
+
+            start = time.perf_counter()
+            foreign, korea = await asyncio.gather(
+                asyncio.to_thread(self.run_leg, exchange_name, close_foreign, start),
+                asyncio.to_thread(self.run_leg, KOREA_EXCHANGE, sell_korea, start),
+                return_exceptions=True,
+            )
+            legs = [leg for leg in (foreign, korea) if not isinstance(leg, BaseException)]
+            failures = [leg for leg in (foreign, korea) if isinstance(leg, BaseException)]
+            for leg in legs:
+                hedge_ledger.remove(base, leg["exchange"], records[leg["exchange"]]["records_id"])
+            skew = self.record_skew(legs)
+            self.journal(((foreign, foreign_order_info), (korea, korea_order_info)), {"skew_ms": skew, "total_ms": elapsed_ms(start)})
+        if failures:
+            raise failures[0]
+        return {"amount": {exchange_name: foreign_amount, KOREA_EXCHANGE: korea_amount}, "skew_ms": skew}
+
+    def snapshot(self) -> dict:
+        skews = tuple(self.skews)
+        return {
+            "executions": self.executions,
+            "rollbacks": self.rollbacks,
+            "rollback_failures": self.rollback_failures,
+            "last_skew_ms": skews[-1] if skews else None,
+            "avg_skew_ms": round(sum(skews) / len(skews), 3) if skews else None,
+            "max_skew_ms": max(skews) if skews else None,
+        }
+
+
+hedge_engine = HedgeEngine()
@@ -0,0 +1,150 @@
+import asyncio
+import traceback
+from collections import defaultdict
+
+import httpx
+
+from exchange import pocket
+from exchange.pocket import async_pb, PocketBaseUnavailable
+from exchange.utility import log_error_message
+
+COLLECTION = "kimp"
+HEDGE_EXCHANGES = ("BINANCE", "UPBIT")
+RETRY_DELAY_SECONDS = 1
+RETRY_DELAY_MAX_SECONDS = 60
+
+
+class HedgeLedger:
+    """기준 코인(base)/거래소별 헷지 수량 원장
+
+    처음 사용할 때 PocketBase(kimp)를 한 번 읽어 메모리에 올리고, 이후에는 메모리가 기준이다.
+    추가/삭제는 메모리에 바로 반영하고 PocketBase에는 백그라운드 태스크가 모아서 순서대로 반영한다.
+    레코드 id는 생성 요청 전에 미리 정해 두므로 아직 생성 중인 레코드도 삭제 대상으로 지정할 수 있다.
+    """
+
+    def __init__(self):
+        # (base, exchange) -> {레코드 id: 수량}
+        self.records: dict[tuple[str, str], dict[str, float]] = defaultdict(dict)
+        self.loaded = False
+        self.load_lock: asyncio.Lock | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.queue: asyncio.Queue | None = None
+        # start() 전에 들어온 작업
+        self.backlog: list[tuple[str, object]] = []
+        self.pending = 0
+        self.failures = 0
+
+    async def load(self):
+        """PocketBase의 헷지 기록 전체를 한 번만 읽어 원장을 만든다"""
+        if self.loaded:
+            return
+        if self.load_lock is None:
+            self.load_lock = asyncio.Lock()
+        async with self.load_lock:
+            if self.loaded:
+                return
+            for record in await async_pb.get_full_list(COLLECTION):
+                self.records[(record["base"], record["exchange"])][record["id"]] = record["amount"]
+            self.loaded = True
+
+    def check_loaded(self):
+        if not self.loaded:
+            raise Exception("헷지 원장이 아직 로드되지 않았습니다")
+
+    def start(self) -> asyncio.Task:
+        """이벤트 루프 안에서 호출"""
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        for item in self.backlog:
+            self.queue.put_nowait(item)
+        self.backlog = []
+        return asyncio.create_task(self.run())
+
+    def put(self, item: tuple[str, object]):
+        self.pending += 1
+        if self.loop is None:
+            self.backlog.append(item)
+        else:
+            # 주문 스레드에서 호출될 수도 있으므로 큐에는 이벤트 루프에서 넣는다
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def add(self, exchange: str, base: str, quote: str, amount: float) -> str:
+        self.check_loaded()
+        record_id = pocket.new_record_id()
+        self.records[(base, exchange)][record_id] = amount
+        self.put(
+            ("create", {"id": record_id, "exchange": exchange, "base": base, "quote": quote, "amount": amount})
+        )
+        return record_id
+
+    def get(self, base: str) -> dict[str, dict]:
+        """거래소별 합계 수량과 그 수량을 이루는 레코드 id 목록"""
+        self.check_loaded()
+        return {
+            exchange: {
+                "amount": sum(self.records[(base, exchange)].values(), 0.0),
+                "records_id": list(self.records[(base, exchange)]),
+            }
+            for exchange in HEDGE_EXCHANGES
+        }
+
+    def remove(self, base: str, exchange: str, records_id: list[str]):
+        """get()으로 읽은 레코드만 지운다 (그 사이 새로 추가된 헷지는 남김)"""
+        if not records_id:
+            return
+        records = self.records[(base, exchange)]
+        for record_id in records_id:
+            records.pop(record_id, None)
+        self.put(("delete", list(records_id)))
+
+    async def apply(self, operation: str, items: list):
+        if operation == "create":
+            await async_pb.create_many(COLLECTION, items)
+        else:
+            await async_pb.delete_many(COLLECTION, items)
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # 연속된 같은 종류의 작업끼리 묶어 한 번에 보낸다 (순서는 유지)
+            groups: list[tuple[str, list]] = []
+            for operation, item in batch:
+                items = item if operation == "delete" else [item]
+                if groups and groups[-1][0] == operation:
+                    groups[-1][1].extend(items)
+                else:
+                    groups.append((operation, list(items)))
+            for operation, items in groups:
+                delay = RETRY_DELAY_SECONDS
+                while True:
+                    try:
+                        await self.apply(operation, items)
+                        break
+                    except (PocketBaseUnavailable, httpx.TransportError):
+                        # outbox를 끈 경우에만 여기로 온다
+                        self.failures += 1
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, RETRY_DELAY_MAX_SECONDS)
+                    except Exception:
+                        # 잘못된 요청은 다시 보내도 실패하므로 기록만 남긴다
+                        self.failures += 1
+                        log_error_message(traceback.format_exc(), f"헷지 원장 저장 실패 ({operation})")
+                        break
+            self.pending -= len(batch)
+
+    def snapshot(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "positions": {
+                f"{base}:{exchange}": sum(records.values())
+                for (base, exchange), records in tuple(self.records.items())
+                if records
+            },
+            "pending_writes": self.pending,
+            "write_failures": self.failures,
+        }
+
+
+hedge_ledger = HedgeLedger()
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import orjson
+from loguru import logger
+
+from exchange.database import db
+from exchange.model import MarketOrder
+
+# 중복 주문 차단 사용 여부
+ENABLE_IDEMPOTENCY = os.getenv("ENABLE_IDEMPOTENCY", "true").lower() == "true"
+# client_order_id 없이 같은 내용의 주문이 이 시간(초) 안에 다시 오면 중복으로 처리 (0이면 내용 비교 안 함)
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "10"))
+# client_order_id 로 받은 주문을 기억하는 시간(초)
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# 메모리에 보관할 최대 키 수 (넘치면 오래된 것부터 버리고 SQLite에서 조회)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+PENDING = "pending"
+DONE = "done"
+
+
+class IdempotencyStore:
+    """웹훅 중복 수신 차단
+
+    키는 client_order_id가 있으면 그 값, 없으면 비밀번호를 뺀 주문 내용의 해시.
+    주문 경로에서는 메모리 LRU만 보고, SQLite(재시작 후에도 유지)는 시작할 때 최근 기록을 읽어오거나
+    LRU에서 밀려난 키가 있을 때만 스레드에서 조회한다. 완료 기록은 응답 후 백그라운드에서 모아서 저장한다.
+    실패한 주문은 키를 풀어 재전송을 다시 받을 수 있게 한다.
+    """
+
+    def __init__(self, size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.size = size
+        # key -> (상태, 결과, 만료 시각)
+        self.entries: OrderedDict[str, tuple[str, object, float]] = OrderedDict()
+        # 아직 SQLite에 쓰지 않은 완료 기록 (key, 결과 JSON, 만료 시각)
+        self.unsaved: deque[tuple[str, str, float]] = deque()
+        # SQLite의 기록이 모두 메모리에도 있으면 SQLite를 다시 볼 필요가 없다
+        self.all_in_memory = False
+        self.duplicates = 0
+        self.saves = 0
+        try:
+            now = time.time()
+            db.delete_expired_idempotency(now)
+            rows = db.get_recent_idempotency(now, size + 1)
+        except Exception as e:
+            logger.warning(f"중복 주문 기록 읽기 실패: {str(e)}")
+            return
+        for key, result, expires_at in reversed(rows[:size]):
+            self.entries[key] = (DONE, orjson.loads(result), expires_at)
+        self.all_in_memory = len(rows) <= size
+
+    def key(self, order_info: MarketOrder) -> tuple[Optional[str], float]:
+        """(키, 유지 시간). 중복 판단을 하지 않는 주문이면 키는 None"""
+        if not ENABLE_IDEMPOTENCY:
+            return None, 0
+        if order_info.client_order_id:
+            return f"id:{order_info.client_order_id}", IDEMPOTENCY_TTL_SECONDS
+        if IDEMPOTENCY_WINDOW_SECONDS <= 0:
+            return None, 0
+        payload = orjson.dumps(
+            order_info.dict(exclude={"password", "client_order_id"}),
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return f"hash:{hashlib.sha256(payload).hexdigest()}", IDEMPOTENCY_WINDOW_SECONDS
+
+    def lookup(self, key: str, now: float) -> Optional[tuple[str, object, float]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] > now:
+            self.entries.move_to_end(key)
+            return entry
+        del self.entries[key]
+        return None
+
+    def remember(self, key: str, entry: tuple[str, object, float]):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.all_in_memory = False
+
+    def begin(self, key: Optional[str], ttl: float) -> Optional[dict]:
+        """처음 보는 키면 처리 중으로 표시하고 None, 중복이면 기존 기록을 반환
+
+        검사와 표시 사이에 await가 없으므로 이벤트 루프 안에서 동시에 들어온 중복도 하나만 통과한다.
+        """
+        if key is None:
+            return None
+        now = time.time()
+        entry = self.lookup(key, now)
+        if entry is not None:
+            self.duplicates += 1
+            return {"status": entry[0], "result": entry[1]}
+        self.remember(key, (PENDING, None, now + ttl))
+        return None
+
+    async def recall(self, key: Optional[str]) -> Optional[dict]:
+        """begin()을 통과한 키가 메모리에서 밀려난 기록인지 SQLite에서 확인 (이벤트 루프 밖에서 조회)
+
+        begin()이 이미 처리 중으로 표시했으므로 조회하는 동안 들어온 같은 키는 메모리에서 중복으로 걸린다.
+        """
+        if key is None or self.all_in_memory:
+            return None
+        try:
+            row = await asyncio.to_thread(db.get_idempotency, key, time.time())
+        except Exception as e:
+            logger.warning(f"중복 주문 기록 조회 실패: {str(e)}")
+            return None
+        if row is None:
+            return None
+        self.remember(key, (DONE, orjson.loads(row[0]), row[1]))
+        self.duplicates += 1
+        return {"status": DONE, "result": self.entries[key][1]}
+
+    def complete(self, key: Optional[str], result):
+        if key is None or key not in self.entries:
+            return
+        expires_at = self.entries[key][2]
+        # 거래소 응답에 datetime 등이 섞여 있을 수 있어 직렬화 가능한 형태로 맞춰 저장
+        data = orjson.dumps(result, default=str, option=orjson.OPT_NON_STR_KEYS)
+        self.remember(key, (DONE, orjson.loads(data), expires_at))
+        self.unsaved.append((key, data.decode(), expires_at))
+
+    def persist(self):
+        """complete()로 쌓인 기록을 커밋 한 번으로 저장 (응답 후 백그라운드 작업에서 호출)"""
+        rows = []
+        while self.unsaved:
+            try:
+                rows.append(self.unsaved.popleft())
+            except IndexError:
+                break
+        if not rows:
+            return
+        try:
+            db.set_idempotency_many(rows)
+            saves, self.saves = self.saves, self.saves + len(rows)
+            if saves // 1000 != self.saves // 1000:
+                db.delete_expired_idempotency(time.time())
+        except Exception as e:
+            logger.warning(f"중복 주문 기록 저장 실패 ({len(rows)}건): {str(e)}")
+
+    def release(self, key: Optional[str]):
+        if key is not None:
+            self.entries.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self.entries), "duplicates": self.duplicates, "unsaved": len(self.unsaved)}
+
+
+idempotency = IdempotencyStore()
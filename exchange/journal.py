@@ -0,0 +1,218 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import orjson
+from loguru import logger
+
+from exchange.database import connect, parent_directory
+from exchange.model import MarketOrder
+
+# 주문 기록(저널) 사용 여부
+ENABLE_ORDER_JOURNAL = os.getenv("ENABLE_ORDER_JOURNAL", "true").lower() == "true"
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", f"{parent_directory}/store.db")
+# 쌓인 기록을 모아서 쓰는 간격(초)과 한 번에 쓰는 최대 건수
+ORDER_JOURNAL_FLUSH_SECONDS = float(os.getenv("ORDER_JOURNAL_FLUSH_SECONDS", "0.5"))
+ORDER_JOURNAL_BATCH_SIZE = int(os.getenv("ORDER_JOURNAL_BATCH_SIZE", "200"))
+
+COLUMNS = (
+    "created_at",
+    "exchange",
+    "symbol",
+    "side",
+    "amount",
+    "kis_number",
+    "client_order_id",
+    "status",
+    "request",
+    "order_info",
+    "response",
+    "error",
+    "latency",
+    "total_ms",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    exchange TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT,
+    amount REAL,
+    kis_number INTEGER,
+    client_order_id TEXT,
+    status TEXT NOT NULL,
+    request TEXT,
+    order_info TEXT,
+    response TEXT,
+    error TEXT,
+    latency TEXT,
+    total_ms REAL
+);
+CREATE INDEX IF NOT EXISTS order_journal_created_at ON order_journal (created_at);
+CREATE INDEX IF NOT EXISTS order_journal_symbol ON order_journal (symbol, created_at);
+CREATE INDEX IF NOT EXISTS order_journal_exchange ON order_journal (exchange, created_at);
+"""
+
+STOP = object()
+
+
+def dumps(value) -> Optional[str]:
+    if value is None:
+        return None
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def redact(request: Optional[dict]) -> Optional[dict]:
+    """원본 요청에서 비밀번호를 빼고 저장"""
+    if not isinstance(request, dict):
+        return request
+    return {key: value for key, value in request.items() if key != "password"}
+
+
+class OrderJournal:
+    """주문 요청/정규화된 주문/거래소 응답/지연 시간/결과를 SQLite에 남긴다
+
+    주문 경로에서는 큐에 넣기만 하고, 백그라운드 스레드가 모아서 한 번에 커밋한다.
+    """
+
+    def __init__(self, path: str = ORDER_JOURNAL_PATH):
+        self.path = path
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.writer: Optional[threading.Thread] = None
+        self.reader: Optional[sqlite3.Connection] = None
+        self.reader_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        with self.start_lock:
+            if self.writer is not None and self.writer.is_alive():
+                return
+            con = connect(self.path)
+            con.executescript(SCHEMA)
+            con.close()
+            self.writer = threading.Thread(target=self.run, name="order-journal", daemon=True)
+            self.writer.start()
+
+    def record(
+        self,
+        order_info: MarketOrder,
+        status: str,
+        response=None,
+        error: Optional[str] = None,
+        latency: Optional[dict] = None,
+        request: Optional[dict] = None,
+    ):
+        if not ENABLE_ORDER_JOURNAL:
+            return
+        if self.writer is None:
+            self.start()
+        latency = latency or {}
+        self.queue.put(
+            (
+                time.time(),
+                order_info.exchange,
+                order_info.unified_symbol or order_info.base,
+                order_info.side,
+                order_info.amount,
+                order_info.kis_number if order_info.is_stock else None,
+                order_info.client_order_id,
+                status,
+                dumps(redact(request)),
+                dumps(order_info.dict(exclude={"password"}, exclude_none=True)),
+                dumps(response),
+                error,
+                dumps(latency),
+                latency.get("total_ms"),
+            )
+        )
+
+    def run(self):
+        con = connect(self.path)
+        query = f"INSERT INTO order_journal ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        stopping = False
+        while not stopping:
+            rows = [self.queue.get()]
+            deadline = time.monotonic() + ORDER_JOURNAL_FLUSH_SECONDS
+            while len(rows) < ORDER_JOURNAL_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if STOP in rows:
+                stopping = True
+                rows = [row for row in rows if row is not STOP]
+            if not rows:
+                continue
+            try:
+                con.executemany(query, rows)
+                con.commit()
+                self.written += len(rows)
+            except Exception as e:
+                self.dropped += len(rows)
+                logger.error(f"주문 기록 저장 실패 ({len(rows)}건): {str(e)}")
+        con.close()
+
+    def close(self, timeout: float = 5):
+        """남은 기록을 모두 쓰고 종료"""
+        if self.writer is not None and self.writer.is_alive():
+            self.queue.put(STOP)
+            self.writer.join(timeout)
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def query(
+        self,
+        exchange: Optional[str] = None,
+        symbol: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """거래소/심볼/시간(epoch 초) 조건으로 최근 기록부터 조회"""
+        conditions, values = [], []
+        for column, value in (("exchange", exchange), ("symbol", symbol), ("status", status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            values.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT id, {', '.join(COLUMNS)} FROM order_journal {where} ORDER BY created_at DESC LIMIT ?"
+        values.append(limit)
+
+        with self.reader_lock:
+            if self.reader is None:
+                self.start()
+                self.reader = connect(self.path)
+            rows = self.reader.execute(query, values).fetchall()
+
+        json_columns = ("request", "order_info", "response", "latency")
+        return [
+            {
+                column: orjson.loads(value) if column in json_columns and value is not None else value
+                for column, value in zip(("id",) + COLUMNS, row)
+            }
+            for row in rows
+        ]
+
+    def snapshot(self) -> dict:
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+journal = OrderJournal()
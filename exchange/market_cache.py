@@ -0,0 +1,91 @@
+import os
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+current_file_directory = os.path.dirname(os.path.realpath(__file__))
+cache_directory = Path(current_file_directory).parent / "cache" / "markets"
+
+MARKET_CACHE_TTL_HOURS = float(os.getenv("MARKET_CACHE_TTL_HOURS", "24"))
+
+# set_markets가 채우는 속성들. 갱신 시 이 속성들만 한 번에 교체한다
+MARKET_ATTRIBUTES = (
+    "markets",
+    "markets_by_id",
+    "symbols",
+    "ids",
+    "currencies",
+    "currencies_by_id",
+    "codes",
+    "baseCurrencies",
+    "quoteCurrencies",
+)
+
+
+def cache_path(exchange_id: str) -> Path:
+    return cache_directory / f"{exchange_id}.json"
+
+
+def read_cache(exchange_id: str, ttl_hours: float = MARKET_CACHE_TTL_HOURS):
+    path = cache_path(exchange_id)
+    try:
+        age = time.time() - path.stat().st_mtime
+        if age > ttl_hours * 3600:
+            return None
+        return orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"{exchange_id} 마켓 캐시 읽기 실패: {str(e)}")
+        return None
+
+
+def write_cache(exchange_id: str, markets, currencies):
+    path = cache_path(exchange_id)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(
+            orjson.dumps({"markets": markets, "currencies": currencies})
+        )
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"{exchange_id} 마켓 캐시 저장 실패: {str(e)}")
+
+
+def fetch_markets(client):
+    """load_markets와 같은 순서로 원본 마켓/통화 정보를 받아온다"""
+    currencies = None
+    if client.has.get("fetchCurrencies") is True:
+        currencies = client.fetch_currencies()
+    return client.fetch_markets(), currencies
+
+
+def load_markets(client):
+    """캐시가 유효하면 바로 적용하고, 아니면 내려받아 캐시에 저장"""
+    cached = read_cache(client.id)
+    if cached is not None:
+        markets = client.set_markets(cached["markets"], cached["currencies"])
+        # 바이낸스/바이비트는 fetch_markets에서 서버 시간 차이를 받아두므로 캐시를 쓸 때는 따로 받는다
+        if client.options.get("adjustForTimeDifference"):
+            client.load_time_difference()
+        return markets
+
+    markets, currencies = fetch_markets(client)
+    write_cache(client.id, markets, currencies)
+    return client.set_markets(markets, currencies)
+
+
+def swap_markets(client, markets, currencies):
+    """주문 처리 중인 클라이언트의 마켓 테이블을 통째로 교체
+
+    set_markets는 markets_by_id를 비운 뒤 다시 채우므로 사용 중인 클라이언트에 직접 호출하지 않고,
+    임시 인스턴스에서 만든 테이블을 __dict__.update 한 번으로 바꿔 끼운다.
+    """
+    scratch = type(client)()
+    scratch.set_markets(markets, currencies)
+    client.__dict__.update(
+        {attribute: getattr(scratch, attribute) for attribute in MARKET_ATTRIBUTES}
+    )
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import orjson
+from loguru import logger
+
+# 웹소켓 시세 미러 사용 여부와 구독 심볼 (예: "BINANCE:BTC/USDT,BINANCE:BTC/USDT:USDT,UPBIT:BTC/KRW")
+ENABLE_MARKET_DATA = os.getenv("ENABLE_MARKET_DATA", "false").lower() == "true"
+MARKET_DATA_SYMBOLS = os.getenv("MARKET_DATA_SYMBOLS", "")
+# 이 시간보다 오래된 시세는 쓰지 않고 REST로 조회
+MARKET_DATA_MAX_AGE_SECONDS = float(os.getenv("MARKET_DATA_MAX_AGE_SECONDS", "3"))
+
+# 리플레이 서버로 바꿔 끼울 수 있도록 환경변수로 덮어쓸 수 있게 둔다
+BINANCE_SPOT_WS_URL = os.getenv("BINANCE_SPOT_WS_URL", "wss://stream.binance.com:9443/stream")
+BINANCE_FUTURES_WS_URL = os.getenv("BINANCE_FUTURES_WS_URL", "wss://fstream.binance.com/stream")
+UPBIT_WS_URL = os.getenv("UPBIT_WS_URL", "wss://api.upbit.com/websocket/v1")
+
+RECONNECT_DELAY_SECONDS = 1
+RECONNECT_DELAY_MAX_SECONDS = 30
+
+
+@dataclass(slots=True)
+class Quote:
+    last: Optional[float] = None
+    bid: Optional[float] = None
+    ask: Optional[float] = None
+    # 체결가(ticker)와 호가(bookTicker/orderbook)는 따로 들어오므로 갱신 시각도 따로 둔다 (time.monotonic())
+    last_at: float = 0.0
+    book_at: float = 0.0
+
+
+class MarketDataMirror:
+    """웹소켓으로 받은 최신 체결가/최우선 호가를 (거래소 id, 통합 심볼) 단위로 보관"""
+
+    def __init__(self, max_age: float = MARKET_DATA_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self.quotes: dict[tuple[str, str], Quote] = {}
+
+    def update(self, exchange_id: str, symbol: str, **fields):
+        quote = self.quotes.get((exchange_id, symbol))
+        if quote is None:
+            quote = self.quotes[(exchange_id, symbol)] = Quote()
+        for name, value in fields.items():
+            setattr(quote, name, float(value))
+        now = time.monotonic()
+        if "last" in fields:
+            quote.last_at = now
+        if "bid" in fields or "ask" in fields:
+            quote.book_at = now
+
+    def get(self, exchange_id: str, symbol: str, max_age: float = None, field: str = "last") -> Optional[Quote]:
+        """field("last" 체결가 / "book" 호가)가 max_age 안에 갱신된 시세만 반환"""
+        quote = self.quotes.get((exchange_id, symbol))
+        if quote is None:
+            return None
+        updated_at = quote.last_at if field == "last" else quote.book_at
+        if time.monotonic() - updated_at > (self.max_age if max_age is None else max_age):
+            return None
+        return quote
+
+    def last_price(self, exchange_id: str, symbol: str) -> Optional[float]:
+        """신선한 체결가가 있으면 반환, 없으면 None (호출한 쪽이 REST로 대체)"""
+        quote = self.get(exchange_id, symbol)
+        return quote.last if quote is not None else None
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            f"{exchange_id}:{symbol}": {
+                "last": quote.last,
+                "bid": quote.bid,
+                "ask": quote.ask,
+                "last_age_seconds": round(now - quote.last_at, 3) if quote.last_at else None,
+                "book_age_seconds": round(now - quote.book_at, 3) if quote.book_at else None,
+            }
+            for (exchange_id, symbol), quote in self.quotes.items()
+        }
+
+
+market_data = MarketDataMirror()
+
+
+def parse_symbols(value: str = MARKET_DATA_SYMBOLS) -> dict[str, list[str]]:
+    """"BINANCE:BTC/USDT,UPBIT:BTC/KRW" -> {"BINANCE": ["BTC/USDT"], "UPBIT": ["BTC/KRW"]}"""
+    symbols = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        exchange_name, symbol = item.split(":", 1)
+        symbols.setdefault(exchange_name.strip().upper(), []).append(symbol.strip())
+    return symbols
+
+
+async def run_stream(name: str, url: str, handle, subscribe: bytes = None):
+    """끊기면 지수 백오프로 다시 연결하며 메시지를 handle에 넘긴다"""
+    import websockets
+
+    delay = RECONNECT_DELAY_SECONDS
+    while True:
+        try:
+            async with websockets.connect(url, max_size=2**22) as ws:
+                if subscribe is not None:
+                    await ws.send(subscribe)
+                logger.info(f"{name} 시세 스트림 연결")
+                delay = RECONNECT_DELAY_SECONDS
+                async for message in ws:
+                    try:
+                        handle(orjson.loads(message))
+                    except Exception as e:
+                        logger.error(f"{name} 시세 메시지 처리 실패: {str(e)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{name} 시세 스트림 끊김, {delay}초 후 재연결: {str(e)}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_DELAY_MAX_SECONDS)
+
+
+def binance_stream(symbols: list[str], futures: bool):
+    """bookTicker(최우선 호가) + 24hrTicker(체결가) 결합 스트림"""
+    stream_symbols = {
+        symbol.split(":")[0].replace("/", "").lower(): symbol for symbol in symbols
+    }
+    streams = "/".join(
+        f"{stream_symbol}@{channel}"
+        for stream_symbol in stream_symbols
+        for channel in ("bookTicker", "ticker")
+    )
+    url = f"{BINANCE_FUTURES_WS_URL if futures else BINANCE_SPOT_WS_URL}?streams={streams}"
+
+    def handle(message: dict):
+        stream = message.get("stream", "")
+        data = message.get("data", message)
+        symbol = stream_symbols.get(stream.split("@")[0])
+        if symbol is None:
+            return
+        if stream.endswith("@bookTicker"):
+            market_data.update("binance", symbol, bid=data["b"], ask=data["a"])
+        elif stream.endswith("@ticker"):
+            market_data.update("binance", symbol, last=data["c"])
+
+    return run_stream(f"BINANCE {'futures' if futures else 'spot'}", url, handle)
+
+
+def upbit_stream(symbols: list[str]):
+    codes = {f"{symbol.split('/')[1]}-{symbol.split('/')[0]}": symbol for symbol in symbols}
+    subscribe = orjson.dumps(
+        [
+            {"ticket": "poa-market-data"},
+            {"type": "ticker", "codes": list(codes)},
+            {"type": "orderbook", "codes": [f"{code}.1" for code in codes]},
+        ]
+    )
+
+    def handle(message: dict):
+        symbol = codes.get(message.get("code"))
+        if symbol is None:
+            return
+        if message.get("type") == "ticker":
+            market_data.update("upbit", symbol, last=message["trade_price"])
+        elif message.get("type") == "orderbook":
+            best = message["orderbook_units"][0]
+            market_data.update("upbit", symbol, bid=best["bid_price"], ask=best["ask_price"])
+
+    return run_stream("UPBIT", UPBIT_WS_URL, handle, subscribe)
+
+
+def start_market_data(symbols: dict[str, list[str]] = None) -> list[asyncio.Task]:
+    """구독 설정에 맞춰 스트림 태스크를 띄운다 (이벤트 루프 안에서 호출)"""
+    symbols = parse_symbols() if symbols is None else symbols
+    streams = []
+    binance_symbols = symbols.get("BINANCE", [])
+    spot = [symbol for symbol in binance_symbols if ":" not in symbol]
+    futures = [symbol for symbol in binance_symbols if symbol.endswith(":USDT")]
+    if spot:
+        streams.append(binance_stream(spot, futures=False))
+    if futures:
+        streams.append(binance_stream(futures, futures=True))
+    if symbols.get("UPBIT"):
+        streams.append(upbit_stream(symbols["UPBIT"]))
+    return [asyncio.create_task(stream) for stream in streams]
@@ -0,0 +1,66 @@
+import os
+import time
+
+# 같은 순간 몰린 알림이 한 번의 조회 결과를 나눠 쓰도록 유지하는 시간(초)
+MICRO_CACHE_TTL_SECONDS = float(os.getenv("MICRO_CACHE_TTL_SECONDS", "0.5"))
+
+
+class MicroCache:
+    """어댑터별 초단기 캐시 (시세/잔고/포지션)
+
+    키에 defaultType을 넣어 현물/선물 조회 결과가 섞이지 않게 하고,
+    주문을 보낸 뒤에는 invalidate_account()로 잔고/포지션을 비운다.
+    """
+
+    __slots__ = ("ttl", "entries", "hits", "misses")
+
+    def __init__(self, ttl: float = MICRO_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, fetch):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = fetch()
+        self.entries[key] = (now, value)
+        return value
+
+    def fetch_ticker(self, client, symbol: str):
+        return self.get(
+            ("ticker", client.options.get("defaultType"), symbol),
+            lambda: client.fetch_ticker(symbol),
+        )
+
+    def fetch_balance(self, client, params: dict = None):
+        """fetch_free_balance/fetch_total_balance 대신 한 번 받은 전체 잔고를 공유"""
+        params = params or {}
+        return self.get(
+            ("balance", client.options.get("defaultType"), tuple(sorted(params.items()))),
+            lambda: client.fetch_balance(params),
+        )
+
+    def fetch_positions(self, client, symbols: list):
+        return self.get(
+            ("positions", client.options.get("defaultType"), tuple(symbols)),
+            lambda: client.fetch_positions(symbols),
+        )
+
+    def invalidate_account(self):
+        """우리 주문으로 바뀌었을 잔고/포지션만 비우고 시세는 유지"""
+        self.entries = {
+            key: entry for key, entry in self.entries.items() if key[0] == "ticker"
+        }
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
@@ -621,6 +621,8 @@ class OrderRequest(BaseModel):
     stop_price: float | None = None
     profit_price: float | None = None
     order_name: str = "주문"
+    # 같은 값으로 다시 들어온 주문은 중복으로 보고 실행하지 않음 (없으면 주문 내용으로 판단)
+    client_order_id: str | None = None
     kis_number: int | None = 1
     hedge: str | None = None
     unified_symbol: str | None = None
@@ -3,6 +3,8 @@ import ccxt.async_support as ccxt_async
 from devtools import debug
 
 from exchange.model import MarketOrder
+from exchange.market_cache import load_markets
+from exchange.micro_cache import MicroCache
 import exchange.error as error
 from decimal import Decimal
 
@@ -16,7 +18,8 @@ class Okx:
                 "password": passphrase,
             }
         )
-        self.client.load_markets()
+        load_markets(self.client)
+        self.cache = MicroCache()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
@@ -57,7 +60,7 @@ class Okx:
             return f"{base}/{quote}"
 
     def get_ticker(self, symbol: str):
-        return self.client.fetch_ticker(symbol)
+        return self.cache.fetch_ticker(self.client, symbol)
 
     def get_price(self, symbol: str):
         return self.get_ticker(symbol)["last"]
@@ -69,9 +72,9 @@ class Okx:
             and (self.order_info.is_buy or self.order_info.is_sell)
         ):
             free_balance = (
-                self.client.fetch_free_balance()
+                self.cache.fetch_balance(self.client)["free"]
                 if not self.order_info.is_total
-                else self.client.fetch_total_balance()
+                else self.cache.fetch_balance(self.client)["total"]
             )
             free_balance_by_base = free_balance.get(base)
 
@@ -81,7 +84,7 @@ class Okx:
 
     def get_futures_position(self, symbol=None, all=False):
         if symbol is None and all:
-            positions = self.client.fetch_balance()["info"]["positions"]
+            positions = self.cache.fetch_balance(self.client)["info"]["positions"]
             positions = [
                 position
                 for position in positions
@@ -89,7 +92,7 @@ class Okx:
             ]
             return positions
 
-        positions = self.client.fetch_positions([symbol])
+        positions = self.cache.fetch_positions(self.client, [symbol])
         long_contracts = None
         short_contracts = None
         if positions:
@@ -2,7 +2,6 @@ import ccxt
 import ccxt.async_support as ccxt_async
 import httpx
 from fastapi import HTTPException
-from pydantic import BaseModel
 from .binance import Binance
 from .upbit import Upbit
 from .bithumb import Bithumb
@@ -12,7 +11,13 @@ from .okx import Okx
 from .stock import ImprovedKoreaInvestment
 from exchange.utility import settings, log_message
 from .database import db
+from .retry import retry, classify_error, ErrorCategory
+from .market_cache import fetch_markets, write_cache, swap_markets
+from .ratelimit import govern, exchange_governors
 from typing import Literal
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pendulum
 import time
 from devtools import debug
@@ -22,104 +27,67 @@ from loguru import logger
 from .model import CRYPTO_EXCHANGES, STOCK_EXCHANGES, MarketOrder
 
 
-class Exchange(BaseModel):
-    UPBIT: Upbit | None = None
-    BINANCE: Binance | None = None
-    BITHUMB: Bithumb | None = None
-    BYBIT: Bybit | None = None
-    BITGET: Bitget | None = None
-    OKX: Okx | None = None
-    KIS1: ImprovedKoreaInvestment | None = None
-    KIS2: ImprovedKoreaInvestment | None = None
-    KIS3: ImprovedKoreaInvestment | None = None
-    KIS4: ImprovedKoreaInvestment | None = None
-    KIS5: ImprovedKoreaInvestment | None = None
-    KIS6: ImprovedKoreaInvestment | None = None
-    KIS7: ImprovedKoreaInvestment | None = None
-    KIS8: ImprovedKoreaInvestment | None = None
-    KIS9: ImprovedKoreaInvestment | None = None
-    KIS10: ImprovedKoreaInvestment | None = None
-    KIS11: ImprovedKoreaInvestment | None = None
-    KIS12: ImprovedKoreaInvestment | None = None
-    KIS13: ImprovedKoreaInvestment | None = None
-    KIS14: ImprovedKoreaInvestment | None = None
-    KIS15: ImprovedKoreaInvestment | None = None
-    KIS16: ImprovedKoreaInvestment | None = None
-    KIS17: ImprovedKoreaInvestment | None = None
-    KIS18: ImprovedKoreaInvestment | None = None
-    KIS19: ImprovedKoreaInvestment | None = None
-    KIS20: ImprovedKoreaInvestment | None = None
-    KIS21: ImprovedKoreaInvestment | None = None
-    KIS22: ImprovedKoreaInvestment | None = None
-    KIS23: ImprovedKoreaInvestment | None = None
-    KIS24: ImprovedKoreaInvestment | None = None
-    KIS25: ImprovedKoreaInvestment | None = None
-    KIS26: ImprovedKoreaInvestment | None = None
-    KIS27: ImprovedKoreaInvestment | None = None
-    KIS28: ImprovedKoreaInvestment | None = None
-    KIS29: ImprovedKoreaInvestment | None = None
-    KIS30: ImprovedKoreaInvestment | None = None
-    KIS31: ImprovedKoreaInvestment | None = None
-    KIS32: ImprovedKoreaInvestment | None = None
-    KIS33: ImprovedKoreaInvestment | None = None
-    KIS34: ImprovedKoreaInvestment | None = None
-    KIS35: ImprovedKoreaInvestment | None = None
-    KIS36: ImprovedKoreaInvestment | None = None
-    KIS37: ImprovedKoreaInvestment | None = None
-    KIS38: ImprovedKoreaInvestment | None = None
-    KIS39: ImprovedKoreaInvestment | None = None
-    KIS40: ImprovedKoreaInvestment | None = None
-    KIS41: ImprovedKoreaInvestment | None = None
-    KIS42: ImprovedKoreaInvestment | None = None
-    KIS43: ImprovedKoreaInvestment | None = None
-    KIS44: ImprovedKoreaInvestment | None = None
-    KIS45: ImprovedKoreaInvestment | None = None
-    KIS46: ImprovedKoreaInvestment | None = None
-    KIS47: ImprovedKoreaInvestment | None = None
-    KIS48: ImprovedKoreaInvestment | None = None
-    KIS49: ImprovedKoreaInvestment | None = None
-    KIS50: ImprovedKoreaInvestment | None = None
-    
-    class Config:
-        arbitrary_types_allowed = True
-
-payload = {}
+class ClientRegistry:
+    """거래소 이름/KIS 번호(KIS1 ...) -> 실행 중인 인스턴스를 바로 돌려주는 레지스트리"""
 
+    __slots__ = ("_clients", "_locks")
 
-def get_exchange(exchange_name: str, kis_number=None):
-    global payload
+    def __init__(self):
+        self._clients: dict[
+            str, Binance | Upbit | Bithumb | Bybit | Bitget | Okx | ImprovedKoreaInvestment
+        ] = {}
+        self._locks: dict[str, threading.Lock] = {}
+
+    def get(self, key: str):
+        return self._clients.get(key)
+
+    def get_or_create(self, key: str, factory):
+        client = self._clients.get(key)
+        if client is None:
+            # 같은 키의 인스턴스가 두 번 만들어지지 않도록 키별로 잠금
+            with self._locks.setdefault(key, threading.Lock()):
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory()
+        return client
+
+    def items(self):
+        return list(self._clients.items())
+
+    def __contains__(self, key: str):
+        return key in self._clients
+
+
+registry = ClientRegistry()
+
+
+def create_exchange(exchange_name: str, kis_number=None):
     if exchange_name in CRYPTO_EXCHANGES:
         KEY, SECRET, PASSPHRASE = check_key(exchange_name)
-        if not payload.get(exchange_name):
-            if exchange_name in ("BITGET", "OKX"):
-                payload |= {
-                    exchange_name: globals()[exchange_name.title()](
-                        KEY, SECRET, PASSPHRASE
-                    )
-                }
-            elif exchange_name == "BITHUMB":
-                payload |= {exchange_name: globals()[exchange_name.title()]()}
-            else:
-                if not payload.get(exchange_name):
-                    payload |= {
-                        exchange_name: globals()[exchange_name.title()](KEY, SECRET)
-                    }
-
-        return Exchange(**payload)
-
-    elif exchange_name in ("KRX", "NASDAQ", "NYSE", "AMEX"):
-        _kis = f"KIS{kis_number}"
-        key = check_key(_kis)
-        KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE = key
-        if not payload.get(_kis):
-            payload |= {
-                _kis: globals()["ImprovedKoreaInvestment"](
-                    KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE, kis_number
-                )
-            }
-        exchange = Exchange(**payload)
-        kis: ImprovedKoreaInvestment = exchange.dict()[_kis]
-        return kis
+        if exchange_name in ("BITGET", "OKX"):
+            bot = globals()[exchange_name.title()](KEY, SECRET, PASSPHRASE)
+        elif exchange_name == "BITHUMB":
+            return Bithumb()
+        else:
+            bot = globals()[exchange_name.title()](KEY, SECRET)
+        govern(bot.client)
+        return bot
+    else:
+        KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE = check_key(f"KIS{kis_number}")
+        return ImprovedKoreaInvestment(
+            KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE, kis_number
+        )
+
+
+def get_exchange(exchange_name: str, kis_number=None):
+    if exchange_name in CRYPTO_EXCHANGES:
+        return registry.get_or_create(
+            exchange_name, lambda: create_exchange(exchange_name)
+        )
+    elif exchange_name in STOCK_EXCHANGES:
+        return registry.get_or_create(
+            f"KIS{kis_number}", lambda: create_exchange(exchange_name, kis_number)
+        )
 
 
 def get_bot(
@@ -128,11 +96,7 @@ def get_bot(
     ],
     kis_number=None,
 ) -> Binance | Upbit | Bithumb | Bybit | Bitget | ImprovedKoreaInvestment | Okx:
-    exchange_name = exchange_name.upper()
-    if exchange_name in CRYPTO_EXCHANGES:
-        return get_exchange(exchange_name, kis_number).dict()[exchange_name]
-    elif exchange_name in STOCK_EXCHANGES:
-        return get_exchange(exchange_name, kis_number)
+    return get_exchange(exchange_name.upper(), kis_number)
 
 
 def check_key(exchange_name):
@@ -161,206 +125,223 @@ def check_key(exchange_name):
             raise Exception(f"{exchange_name} 키가 없습니다")
 
 
-def get_today_timestamp(timezone="Asia/Seoul"):
-    today = pendulum.today(timezone)
-    today_start = int(today.start_of("day").timestamp() * 1000)
-    today_end = int(today.end_of("day").timestamp() * 1000)
-    return today_start, today_end
+def configured_exchanges() -> list[str]:
+    """키가 설정된 암호화폐 거래소 목록"""
+    return [
+        exchange_name
+        for exchange_name in CRYPTO_EXCHANGES
+        if getattr(settings, f"{exchange_name}_KEY", None)
+        and getattr(settings, f"{exchange_name}_SECRET", None)
+    ]
+
+
+def warm_up(exchange_names: list[str] | None = None) -> dict[str, dict]:
+    """거래소 인스턴스를 병렬로 미리 생성 (생성자에서 마켓 정보를 받아둔다)"""
+    if exchange_names is None:
+        exchange_names = configured_exchanges()
+    if not exchange_names:
+        return {}
+
+    def load(exchange_name: str):
+        start = time.perf_counter()
+        try:
+            get_bot(exchange_name)
+        except Exception as e:
+            status = f"error: {str(e)}"
+        else:
+            status = "ok"
+        return {"seconds": round(time.perf_counter() - start, 3), "status": status}
+
+    with ThreadPoolExecutor(max_workers=len(exchange_names)) as pool:
+        results = pool.map(load, exchange_names)
+        return dict(zip(exchange_names, results))
+
+
+def configured_kis_numbers() -> list[int]:
+    """키가 설정된 KIS 계좌 번호 목록"""
+    return [
+        kis_number
+        for kis_number in range(1, 51)
+        if getattr(settings, f"KIS{kis_number}_KEY", None)
+    ]
+
+
+# KIS 계좌별 준비 상태 (check_kis_accounts가 기록)
+kis_status: dict[str, dict] = {}
+
+
+def check_kis_accounts(kis_numbers: list[int] | None = None, concurrency: int = 5) -> dict[str, dict]:
+    """KIS 계좌를 concurrency개씩 묶어 생성하고 토큰을 확보해 준비 상태를 기록"""
+    if kis_numbers is None:
+        kis_numbers = configured_kis_numbers()
+    if not kis_numbers:
+        return {}
+    for kis_number in kis_numbers:
+        kis_status[f"KIS{kis_number}"] = {"status": "pending"}
+
+    def check(kis_number: int):
+        start = time.perf_counter()
+        try:
+            bot = get_bot("KRX", kis_number)
+            status = "ready" if bot._ensure_authentication() else "auth_failed"
+        except Exception as e:
+            status = f"error: {str(e)}"
+        kis_status[f"KIS{kis_number}"] = {
+            "status": status,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(kis_numbers))) as pool:
+        list(pool.map(check, kis_numbers))
+    return {f"KIS{kis_number}": kis_status[f"KIS{kis_number}"] for kis_number in kis_numbers}
 
 
-def retry(
-    func,
-    *args,
-    order_info: MarketOrder,
-    max_attempts=3,
-    delay=1,
-    instance: Binance | Bybit | Bitget | Upbit | Okx = None,
-):
-    attempts = 0
+def get_kis_status() -> dict[str, dict]:
+    """설정된 KIS 계좌 상태. 확인 전 계좌는 생성 여부(loaded/not_loaded)로 표시"""
+    result = {}
+    for kis_number in configured_kis_numbers():
+        key = f"KIS{kis_number}"
+        if key in kis_status:
+            result[key] = kis_status[key]
+        elif key in registry:
+            result[key] = {"status": "loaded", "is_auth": registry.get(key).is_auth}
+        else:
+            result[key] = {"status": "not_loaded"}
+    return result
+
+
+async_clients = {}
+
+
+def get_async_client(exchange_name: str):
+    """거래소/키 당 하나의 ccxt async 클라이언트를 재사용 (aiohttp 세션 공유)"""
+    exchange_name = exchange_name.upper()
+    if exchange_name not in CRYPTO_EXCHANGES or exchange_name == "BITHUMB":
+        raise ValueError(f"{exchange_name}는 async 클라이언트를 지원하지 않습니다")
+
+    client = async_clients.get(exchange_name)
+    if client is None:
+        KEY, SECRET, PASSPHRASE = check_key(exchange_name)
+        config = {"apiKey": KEY, "secret": SECRET}
+        if exchange_name in ("BITGET", "OKX"):
+            config["password"] = PASSPHRASE
+        if exchange_name in ("BINANCE", "BYBIT"):
+            config["options"] = {"adjustForTimeDifference": True}
+        client = govern(getattr(ccxt_async, exchange_name.lower())(config), asynchronous=True)
+
+        # 동기 클라이언트가 이미 받아둔 마켓 정보가 있으면 그대로 공유
+        bot = registry.get(exchange_name)
+        if bot is not None and bot.client.markets:
+            client.set_markets(bot.client.markets, bot.client.currencies)
+            # 마켓을 다시 받지 않으므로 서버 시간 차이도 동기 클라이언트 값을 그대로 사용
+            if "timeDifference" in bot.client.options:
+                client.options["timeDifference"] = bot.client.options["timeDifference"]
+        async_clients[exchange_name] = client
+    return client
+
+
+def rate_limit_metrics() -> dict:
+    """거래소별 가중치 예산과 KIS 계좌별 호출 제한의 대기열 지표"""
+    return {
+        "exchanges": {
+            exchange_id: governor.snapshot()
+            for exchange_id, governor in exchange_governors.items()
+        },
+        "kis": {
+            key: bot.rate_limiter.snapshot()
+            for key, bot in registry.items()
+            if key.startswith("KIS")
+        },
+    }
+
+
+def micro_cache_metrics() -> dict:
+    """어댑터별 초단기 캐시 적중/미적중 횟수"""
+    return {
+        key: bot.cache.snapshot()
+        for key, bot in registry.items()
+        if hasattr(bot, "cache")
+    }
+
+
+async def close_async_clients():
+    for exchange_name, client in list(async_clients.items()):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"{exchange_name} async 클라이언트 종료 실패: {str(e)}")
+    async_clients.clear()
+
+
+def refresh_markets():
+    """실행 중인 거래소의 마켓 정보를 새로 받아 캐시와 메모리(동기/async 클라이언트)를 갱신"""
+    for exchange_name, bot in registry.items():
+        client = getattr(bot, "client", None)
+        if not isinstance(client, ccxt.Exchange):
+            continue
+        try:
+            markets, currencies = fetch_markets(client)
+            write_cache(client.id, markets, currencies)
+            swap_markets(client, markets, currencies)
+            async_client = async_clients.get(exchange_name)
+            if async_client is not None:
+                swap_markets(async_client, markets, currencies)
+        except Exception as e:
+            logger.error(f"{exchange_name} 마켓 정보 갱신 실패: {str(e)}")
+
+
+async def run_periodic_market_refresh(interval_hours: float):
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        await asyncio.to_thread(refresh_markets)
 
-    while attempts < max_attempts:
+
+def refresh_kis_tokens(within_minutes: float) -> dict[str, bool]:
+    """생성된 KIS 계좌 중 토큰 만료가 within_minutes 이내인 계좌만 미리 재발급"""
+    results = {}
+    for key, bot in registry.items():
+        if not isinstance(bot, ImprovedKoreaInvestment):
+            continue
         try:
-            result = func(*args)  # 함수 실행
-            return result
+            refreshed = bot.refresh_token_if_expiring(pendulum.duration(minutes=within_minutes))
         except Exception as e:
-            logger.error(f"에러 발생: {str(e)}")
-            attempts += 1
-            if func.__name__ == "create_order":
-                if order_info.exchange in ("BINANCE"):
-                    if "Internal error" in str(e):
-                        time.sleep(delay)  # 재시도 간격 설정
-                    elif "position side does not match" in str(e):
-                        if instance.position_mode == "one-way":
-                            instance.position_mode = "hedge"
-                            if order_info.side == "buy":
-                                if order_info.is_entry:
-                                    positionSide = "LONG"
-                                elif order_info.is_close:
-                                    positionSide = "SHORT"
-                            elif order_info.side == "sell":
-                                if order_info.is_entry:
-                                    positionSide = "SHORT"
-                                elif order_info.is_close:
-                                    positionSide = "LONG"
-
-                            params = {"positionSide": positionSide}
-                        elif instance.position_mode == "hedge":
-                            instance.position_mode = "one-way"
-                            if order_info.is_entry:
-                                params = {}
-                            elif order_info.is_close:
-                                params = {"reduceOnly": True}
-
-                        args = tuple(
-                            params if i == 5 else arg for i, arg in enumerate(args)
-                        )
-
-                    else:
-                        attempts = max_attempts
-                elif order_info.exchange in ("BYBIT"):
-                    if "position idx not match position mode" in str(e):
-                        if instance.position_mode == "one-way":
-                            instance.position_mode = "hedge"
-                            position_idx = None
-                            if order_info.side == "buy":
-                                if order_info.is_entry:
-                                    position_idx = 1
-                                    params = {"position_idx": position_idx}
-                                elif order_info.is_close:
-                                    position_idx = 2
-                                    params = {
-                                        "reduceOnly": True,
-                                        "position_idx": position_idx,
-                                    }
-                            elif order_info.side == "sell":
-                                if order_info.is_entry:
-                                    position_idx = 2
-                                    params = {"position_idx": position_idx}
-                                elif order_info.is_close:
-                                    position_idx = 1
-                                    params = {
-                                        "reduceOnly": True,
-                                        "position_idx": position_idx,
-                                    }
-                        elif instance.position_mode == "hedge":
-                            instance.position_mode = "one-way"
-                            if order_info.is_entry:
-                                params = {"position_idx": 0}
-                            elif order_info.is_close:
-                                params = {"reduceOnly": True, "position_idx": 0}
-
-                        args = tuple(
-                            params if i == 5 else arg for i, arg in enumerate(args)
-                        )
-                    elif "check your server timestamp" in str(e):
-                        bybit: Bybit = instance
-                        bybit.load_time_difference()
-                    else:
-                        attempts = max_attempts
-
-                elif order_info.exchange in ("OKX"):
-                    if "posSide error" in str(e):
-                        params = {}
-
-                        if instance.position_mode == "one-way":
-                            instance.position_mode = "hedge"
-                            pos_side = "net"
-                            if order_info.is_futures and order_info.side == "buy":
-                                if order_info.is_entry:
-                                    pos_side = "long"
-                                elif order_info.is_close:
-                                    pos_side = "short"
-                            elif order_info.is_futures and order_info.side == "sell":
-                                if order_info.is_entry:
-                                    pos_side = "short"
-                                elif order_info.is_close:
-                                    pos_side = "long"
-
-                            if (
-                                order_info.margin_mode is None
-                                or order_info.margin_mode == "isolated"
-                            ):
-                                params |= {"posSide": pos_side, "tdMode": "isolated"}
-                            elif order_info.margin_mode == "cross":
-                                params |= {"posSide": pos_side, "tdMode": "cross"}
-                        elif instance.position_mode == "hedge":
-                            instance.position_mode = "one-way"
-                            if order_info.is_entry:
-                                params |= {}
-                            elif order_info.is_close:
-                                params |= {"reduceOnly": True}
-
-                        if order_info.is_entry:
-                            if order_info.leverage is None:
-                                instance.set_leverage(1, order_info.unified_symbol)
-                            else:
-                                instance.set_leverage(
-                                    order_info.leverage, order_info.unified_symbol
-                                )
-                            if order_info.margin_mode is None:
-                                params |= {"tdMode": "isolated"}
-                            else:
-                                params |= {"tdMode": order_info.margin_mode}
-
-                        args = tuple(
-                            params if i == 5 else arg for i, arg in enumerate(args)
-                        )
-                    else:
-                        attempts = max_attempts
-                elif order_info.exchange in ("BITGET"):
-                    if "unilateral position" in str(e):
-                        if instance.position_mode == "hedge":
-                            instance.position_mode = "one-way"
-                            new_side = order_info.side + "_single"
-                            new_params = {"side": new_side}
-                            args = tuple(
-                                new_side if i == 2 else arg
-                                for i, arg in enumerate(args)
-                            )
-                            args = tuple(
-                                new_params if i == 5 else arg
-                                for i, arg in enumerate(args)
-                            )
-                        elif instance.position_mode == "one-way":
-                            instance.position_mode = "hedge"
-                            if order_info.is_entry:
-                                new_params = {}
-                            elif order_info.is_close:
-                                new_params = {"reduceOnly": True}
-                            args = tuple(
-                                new_params if i == 5 else arg
-                                for i, arg in enumerate(args)
-                            )
-
-                    elif "two-way positions" in str(e):
-                        if instance.position_mode == "hedge":
-                            instance.position_mode = "one-way"
-                            new_side = order_info.side + "_single"
-                            new_params = {"reduceOnly": True, "side": new_side}
-                            args = tuple(
-                                new_side if i == 2 else arg
-                                for i, arg in enumerate(args)
-                            )
-                            args = tuple(
-                                new_params if i == 5 else arg
-                                for i, arg in enumerate(args)
-                            )
-                        elif instance.position_mode == "one-way":
-                            instance.position_mode = "hedge"
-                            if order_info.is_entry:
-                                new_params = {}
-                            elif order_info.is_close:
-                                new_params = {"reduceOnly": True}
-                            args = tuple(
-                                new_params if i == 5 else arg
-                                for i, arg in enumerate(args)
-                            )
-                    else:
-                        attempts = max_attempts
-                else:
-                    attempts = max_attempts
-
-            if attempts == max_attempts:
-                raise
-            else:
-                logger.error(f"재시도 {max_attempts - attempts}번 남았음")
+            logger.warning(f"{key} 토큰 갱신 실패: {str(e)}")
+            refreshed = False
+        if refreshed is not None:
+            results[key] = refreshed
+    return results
+
+
+async def run_token_refresh_scheduler(interval_minutes: float, within_minutes: float):
+    """주문 경로에서 토큰을 발급하지 않도록 만료 전에 백그라운드에서 갱신"""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        results = await asyncio.to_thread(refresh_kis_tokens, within_minutes)
+        failed = [key for key, refreshed in results.items() if not refreshed]
+        if failed:
+            log_message(f"KIS 토큰 사전 갱신 실패: {', '.join(failed)}")
+
+
+def get_bot_key(exchange_name: str, kis_number=None) -> str:
+    exchange_name = exchange_name.upper()
+    if exchange_name in STOCK_EXCHANGES:
+        return f"KIS{kis_number}"
+    return exchange_name
+
+
+order_locks: dict[str, asyncio.Lock] = {}
+
+
+def get_order_lock(bot_key: str) -> asyncio.Lock:
+    """봇 인스턴스(order_info, defaultType 등)를 공유하는 주문끼리만 순서대로 실행"""
+    lock = order_locks.get(bot_key)
+    if lock is None:
+        lock = order_locks[bot_key] = asyncio.Lock()
+    return lock
+
+
+def get_today_timestamp(timezone="Asia/Seoul"):
+    today = pendulum.today(timezone)
+    today_start = int(today.start_of("day").timestamp() * 1000)
+    today_end = int(today.end_of("day").timestamp() * 1000)
+    return today_start, today_end
@@ -25,33 +25,33 @@ KIS_EXCHANGES = {}
 exchange_lock = threading.Lock()
 
 
-def initialize_kis_exchanges():
-    """KIS 거래소 1-50번 초기화"""
-    for i in range(1, 51):
-        key = getattr(settings, f"KIS{i}_KEY", None)
-        secret = getattr(settings, f"KIS{i}_SECRET", None)
-        account_number = getattr(settings, f"KIS{i}_ACCOUNT_NUMBER", None)
-        account_code = getattr(settings, f"KIS{i}_ACCOUNT_CODE", None)
-        
-        if key and secret and account_number and account_code:
-            try:
-                kis_exchange = KoreaInvestment(
-                    key=key,
-                    secret=secret,
-                    account_number=account_number,
-                    account_code=account_code,
-                    kis_number=i
-                )
-                KIS_EXCHANGES[f"KIS{i}"] = kis_exchange
-            except Exception as e:
-                print(f"KIS{i} 초기화 실패: {e}")
-                KIS_EXCHANGES[f"KIS{i}"] = None
-        else:
-            KIS_EXCHANGES[f"KIS{i}"] = None
+def initialize_kis_exchange(kis_number: int):
+    """KIS 계좌 하나를 처음 사용할 때 초기화 (import 시점에 50개를 만들지 않음)"""
+    key = getattr(settings, f"KIS{kis_number}_KEY", None)
+    secret = getattr(settings, f"KIS{kis_number}_SECRET", None)
+    account_number = getattr(settings, f"KIS{kis_number}_ACCOUNT_NUMBER", None)
+    account_code = getattr(settings, f"KIS{kis_number}_ACCOUNT_CODE", None)
 
+    if key and secret and account_number and account_code:
+        try:
+            return KoreaInvestment(
+                key=key,
+                secret=secret,
+                account_number=account_number,
+                account_code=account_code,
+                kis_number=kis_number
+            )
+        except Exception as e:
+            print(f"KIS{kis_number} 초기화 실패: {e}")
+    return None
 
-# KIS 거래소 초기화
-initialize_kis_exchanges()
+
+def get_kis_exchange(kis_number: int):
+    kis_key = f"KIS{kis_number}"
+    with exchange_lock:
+        if KIS_EXCHANGES.get(kis_key) is None:
+            KIS_EXCHANGES[kis_key] = initialize_kis_exchange(kis_number)
+        return KIS_EXCHANGES[kis_key]
 
 
 def initialize_exchange(exchange_name: str):
@@ -92,7 +92,10 @@ def get_exchange(exchange_name: str = None) -> Dict:
         
         # KIS 거래소
         if exchange_name and exchange_name.startswith("KIS"):
-            if exchange_name in KIS_EXCHANGES:
+            if exchange_name[3:].isdigit():
+                kis_number = int(exchange_name[3:])
+                if KIS_EXCHANGES.get(exchange_name) is None:
+                    KIS_EXCHANGES[exchange_name] = initialize_kis_exchange(kis_number)
                 return {exchange_name: KIS_EXCHANGES[exchange_name]}
         
         # 전체 거래소 반환
@@ -108,11 +111,11 @@ def get_bot(exchange_name: str, kis_number: int = 1):
     """거래 봇 객체를 반환합니다."""
     if exchange_name in ["KRX", "NASDAQ", "NYSE", "AMEX"]:
         # 주식 거래인 경우 KIS 번호로 거래소 선택
-        kis_key = f"KIS{kis_number}"
-        if kis_key in KIS_EXCHANGES and KIS_EXCHANGES[kis_key] is not None:
-            return KIS_EXCHANGES[kis_key]
+        kis_exchange = get_kis_exchange(kis_number)
+        if kis_exchange is not None:
+            return kis_exchange
         else:
-            raise ValueError(f"{kis_key} 거래소가 설정되지 않았습니다.")
+            raise ValueError(f"KIS{kis_number} 거래소가 설정되지 않았습니다.")
     else:
         # 암호화폐 거래소
         with exchange_lock:
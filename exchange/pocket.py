@@ -1,28 +1,55 @@
 from pocketbase import PocketBase
 import jwt
 from exchange.utility import log_message, log_error_message, settings
+from exchange.database import db
+import asyncio
+import httpx
+import orjson
+import os
+import secrets
+import string
 import time
 import traceback
 
-pb = PocketBase("http://127.0.0.1:8090")
+POCKETBASE_URL = os.getenv("POCKETBASE_URL", "http://127.0.0.1:8090")
+# 토큰 만료 몇 초 전에 미리 다시 인증할지
+POCKETBASE_RENEW_BEFORE_SECONDS = float(os.getenv("POCKETBASE_RENEW_BEFORE_SECONDS", "300"))
+# 일괄 생성/삭제 시 동시에 보낼 요청 수
+POCKETBASE_CONCURRENCY = int(os.getenv("POCKETBASE_CONCURRENCY", "8"))
+# PocketBase가 응답하지 않을 때 쓰기를 SQLite(store.db)에 보관했다가 나중에 반영할지 여부
+ENABLE_POCKETBASE_OUTBOX = os.getenv("ENABLE_POCKETBASE_OUTBOX", "true").lower() == "true"
+POCKETBASE_OUTBOX_FLUSH_SECONDS = float(os.getenv("POCKETBASE_OUTBOX_FLUSH_SECONDS", "30"))
+
+pb = PocketBase(POCKETBASE_URL)
+# 토큰 만료 시각 (epoch 초). 인증할 때 한 번만 디코딩해 둔다
+token_expires_at = 0.0
+
+RECORD_ID_ALPHABET = string.ascii_lowercase + string.digits
+
+
+def new_record_id() -> str:
+    """PocketBase 형식(15자 소문자/숫자)의 레코드 id. 미리 정해두면 생성 전에도 삭제 대상으로 지정할 수 있다"""
+    return "".join(secrets.choice(RECORD_ID_ALPHABET) for _ in range(15))
+
+
+def token_expiry(token: str) -> float:
+    return float(jwt.decode(token, options={"verify_signature": False})["exp"])
 
 
 def auth():
+    global token_expires_at
     try:
         DB_ID = settings.DB_ID
         DB_PASSWORD = settings.DB_PASSWORD
         pb.admins.auth_with_password(DB_ID, DB_PASSWORD)
+        token_expires_at = token_expiry(pb.auth_store.base_token)
     except Exception as e:
         raise Exception("DB auth error")
 
 
 def reauth():
     try:
-        token = pb.auth_store.base_token
-        decoded_token = jwt.decode(token, options={"verify_signature": False})
-        expire_time = decoded_token["exp"]
-        current_time = int(time.time())
-        if current_time > expire_time:
+        if time.time() + POCKETBASE_RENEW_BEFORE_SECONDS >= token_expires_at:
             auth()
     except:
         raise Exception("DB reauth error")
@@ -31,7 +58,7 @@ def reauth():
 def create(collection, data):
     try:
         reauth()
-        pb.collection(collection).create(data)
+        return pb.collection(collection).create(data)
     except:
         raise Exception("DB create error")
 
@@ -44,6 +71,17 @@ def delete(collection, id):
         raise Exception("DB delete error")
 
 
+def delete_many(collection, ids):
+    """인증 확인은 한 번만 하고 여러 레코드를 삭제"""
+    try:
+        reauth()
+        records = pb.collection(collection)
+        for id in ids:
+            records.delete(id)
+    except:
+        raise Exception("DB delete error")
+
+
 def get_full_list(collection, batch_size=200, query_params=None):
     try:
         reauth()
@@ -54,6 +92,197 @@ def get_full_list(collection, batch_size=200, query_params=None):
         raise Exception("DB get_full_list error")
 
 
+class PocketBaseUnavailable(Exception):
+    pass
+
+
+class AsyncPocketBase:
+    """keep-alive 연결을 재사용하는 async PocketBase 클라이언트
+
+    토큰 만료 시각을 숫자로 보관해 만료 전에 한 번만 다시 인증하고,
+    PocketBase가 응답하지 않으면 생성/삭제를 SQLite outbox에 쌓았다가 순서대로 반영한다.
+    outbox에 남은 작업이 있는 동안에는 순서가 뒤바뀌지 않도록 새 쓰기도 outbox로 보낸다.
+    """
+
+    def __init__(self, url: str = POCKETBASE_URL):
+        self.url = url
+        self.client: httpx.AsyncClient | None = None
+        self.token: str | None = None
+        self.token_expires_at = 0.0
+        self.auth_lock: asyncio.Lock | None = None
+        self.outbox_pending = count_outbox() if ENABLE_POCKETBASE_OUTBOX else 0
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=10,
+                limits=httpx.Limits(max_keepalive_connections=POCKETBASE_CONCURRENCY, keepalive_expiry=60),
+            )
+        return self.client
+
+    async def auth(self, force: bool = False):
+        if self.auth_lock is None:
+            self.auth_lock = asyncio.Lock()
+        async with self.auth_lock:
+            # 기다리는 동안 다른 요청이 이미 인증했으면 그대로 사용
+            if not force and time.time() + POCKETBASE_RENEW_BEFORE_SECONDS < self.token_expires_at:
+                return
+            response = await self.get_client().post(
+                "/api/admins/auth-with-password",
+                json={"identity": settings.DB_ID, "password": settings.DB_PASSWORD},
+            )
+            response.raise_for_status()
+            self.token = response.json()["token"]
+            self.token_expires_at = token_expiry(self.token)
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        try:
+            if time.time() + POCKETBASE_RENEW_BEFORE_SECONDS >= self.token_expires_at:
+                await self.auth()
+            response = await self.get_client().request(
+                method, path, headers={"Authorization": self.token}, **kwargs
+            )
+            if response.status_code == 401:
+                await self.auth(force=True)
+                response = await self.get_client().request(
+                    method, path, headers={"Authorization": self.token}, **kwargs
+                )
+        except httpx.TransportError as e:
+            raise PocketBaseUnavailable(str(e)) from e
+        if response.status_code >= 500:
+            raise PocketBaseUnavailable(f"{response.status_code} {response.text}")
+        return response
+
+    async def get_full_list(self, collection: str, filter: str | None = None, batch_size: int = 200) -> list[dict]:
+        items, page = [], 1
+        while True:
+            params = {"page": page, "perPage": batch_size}
+            if filter:
+                params["filter"] = filter
+            response = await self.request("GET", f"/api/collections/{collection}/records", params=params)
+            response.raise_for_status()
+            data = response.json()
+            items += data["items"]
+            if not data["items"] or len(items) >= data["totalItems"]:
+                return items
+            page += 1
+
+    async def send_create(self, collection: str, data: dict):
+        response = await self.request("POST", f"/api/collections/{collection}/records", json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def send_delete(self, collection: str, id: str):
+        response = await self.request("DELETE", f"/api/collections/{collection}/records/{id}")
+        # 이미 지워진 레코드는 성공으로 본다
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    async def gather(self, coroutines) -> list:
+        semaphore = asyncio.Semaphore(POCKETBASE_CONCURRENCY)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+    async def create_many(self, collection: str, items: list[dict]):
+        """여러 레코드를 keep-alive 연결 위에서 동시에 생성 (PocketBase 불가 시 outbox)"""
+        if not items:
+            return
+        if self.outbox_pending:
+            return await self.to_outbox([("create", collection, item) for item in items])
+        try:
+            await self.gather(self.send_create(collection, item) for item in items)
+        except PocketBaseUnavailable:
+            # 일부가 이미 생성되었을 수 있지만 id가 정해져 있어 다시 보내도 중복되지 않는다
+            await self.to_outbox([("create", collection, item) for item in items])
+
+    async def delete_many(self, collection: str, ids: list[str]):
+        if not ids:
+            return
+        if self.outbox_pending:
+            return await self.to_outbox([("delete", collection, {"id": id}) for id in ids])
+        try:
+            await self.gather(self.send_delete(collection, id) for id in ids)
+        except PocketBaseUnavailable:
+            await self.to_outbox([("delete", collection, {"id": id}) for id in ids])
+
+    async def to_outbox(self, operations: list[tuple[str, str, dict]]):
+        if not ENABLE_POCKETBASE_OUTBOX:
+            raise PocketBaseUnavailable("PocketBase에 연결할 수 없습니다")
+        # 대기 건수를 먼저 올려 두어 저장하는 동안 들어온 쓰기도 outbox로 가게 한다 (순서 유지)
+        self.outbox_pending += len(operations)
+        await asyncio.to_thread(
+            db.excute_many,
+            "INSERT INTO pocket_outbox (operation, collection, data, created_at) VALUES (?, ?, ?, ?)",
+            [(operation, collection, orjson.dumps(data).decode(), time.time()) for operation, collection, data in operations],
+        )
+
+    async def flush_outbox(self) -> int:
+        """outbox를 쌓인 순서대로 반영. PocketBase가 여전히 응답하지 않으면 멈추고 다음에 다시 시도"""
+        flushed = []
+        rows = await asyncio.to_thread(
+            db.fetch_all, "SELECT id, operation, collection, data FROM pocket_outbox ORDER BY id", {}
+        )
+        try:
+            for row_id, operation, collection, data in rows:
+                data = orjson.loads(data)
+                try:
+                    if operation == "create":
+                        await self.send_create(collection, data)
+                    else:
+                        await self.send_delete(collection, data["id"])
+                except PocketBaseUnavailable:
+                    break
+                except httpx.HTTPStatusError as e:
+                    # 이미 반영된 생성(중복 id) 등 다시 보내도 성공할 수 없는 작업은 기록만 남기고 버린다
+                    log_error_message(f"{operation} {collection} {data}\n{e.response.text}", "PocketBase outbox 반영 실패")
+                flushed.append((row_id,))
+        finally:
+            # 반영한 작업은 커밋 한 번으로 지운다
+            if flushed:
+                await asyncio.to_thread(db.excute_many, "DELETE FROM pocket_outbox WHERE id = ?", flushed)
+            self.outbox_pending = await asyncio.to_thread(count_outbox)
+        return len(flushed)
+
+    async def run_outbox_flusher(self, interval: float = POCKETBASE_OUTBOX_FLUSH_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            if not self.outbox_pending:
+                continue
+            try:
+                flushed = await self.flush_outbox()
+            except Exception:
+                log_error_message(traceback.format_exc(), "PocketBase outbox 반영 에러")
+                continue
+            if flushed:
+                log_message(f"PocketBase outbox {flushed}건 반영 (남은 작업 {self.outbox_pending}건)")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def snapshot(self) -> dict:
+        return {
+            "token_expires_in_seconds": round(self.token_expires_at - time.time()) if self.token_expires_at else None,
+            "outbox_pending": self.outbox_pending,
+        }
+
+
+def count_outbox() -> int:
+    try:
+        return db.fetch_one("SELECT COUNT(*) FROM pocket_outbox", {})[0]
+    except Exception:
+        return 0
+
+
+async_pb = AsyncPocketBase()
+
+
 try:
     auth()
 except:
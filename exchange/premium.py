@@ -0,0 +1,219 @@
+import asyncio
+import os
+import time
+import traceback
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from exchange.hedge_engine import hedge_engine
+from exchange.hedge_ledger import hedge_ledger
+from exchange.marketdata import market_data
+from exchange.pexchange import get_async_client
+from exchange.utility import log_error_message, log_hedge_message
+from exchange.utility.fx import fx_rate
+
+# 김프 계산 사용 여부와 계산할 코인 (예: "BTC,ETH,XRP")
+ENABLE_PREMIUM_MONITOR = os.getenv("ENABLE_PREMIUM_MONITOR", "false").lower() == "true"
+PREMIUM_SYMBOLS = os.getenv("PREMIUM_SYMBOLS", "BTC")
+# 계산 간격(초)과 분위수를 계산할 최근 표본 수
+PREMIUM_INTERVAL_SECONDS = float(os.getenv("PREMIUM_INTERVAL_SECONDS", "1"))
+PREMIUM_WINDOW_SIZE = int(os.getenv("PREMIUM_WINDOW_SIZE", "3600"))
+PREMIUM_PERCENTILES = (5, 25, 50, 75, 95)
+
+# 김프가 기준 이하로 내려가면 헷지 진입, 기준 이상으로 올라가면 헷지 종료 (값이 없으면 사용 안 함)
+ENABLE_PREMIUM_HEDGE = os.getenv("ENABLE_PREMIUM_HEDGE", "false").lower() == "true"
+PREMIUM_HEDGE_ENTRY_PERCENT = os.getenv("PREMIUM_HEDGE_ENTRY_PERCENT")
+PREMIUM_HEDGE_EXIT_PERCENT = os.getenv("PREMIUM_HEDGE_EXIT_PERCENT")
+# 한 번에 헷지할 코인 수량 (예: "BTC:0.01,ETH:0.2")
+PREMIUM_HEDGE_AMOUNTS = os.getenv("PREMIUM_HEDGE_AMOUNTS", "")
+PREMIUM_HEDGE_LEVERAGE = os.getenv("PREMIUM_HEDGE_LEVERAGE")
+# 자동 헷지 후 같은 코인을 다시 판단하기까지 기다리는 시간(초)
+PREMIUM_HEDGE_COOLDOWN_SECONDS = float(os.getenv("PREMIUM_HEDGE_COOLDOWN_SECONDS", "60"))
+
+FOREIGN_EXCHANGE = "BINANCE"
+FOREIGN_QUOTE = "USDT.P"
+
+
+def parse_amounts(value: str = PREMIUM_HEDGE_AMOUNTS) -> dict[str, float]:
+    """"BTC:0.01,ETH:0.2" -> {"BTC": 0.01, "ETH": 0.2}"""
+    amounts = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        base, amount = item.split(":", 1)
+        amounts[base.strip().upper()] = float(amount)
+    return amounts
+
+
+def optional_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+class PremiumWindow:
+    """최근 김프(%)를 고정 크기 NumPy 배열에 돌려가며 저장 (표본마다 메모리 할당 없음)"""
+
+    def __init__(self, size: int = PREMIUM_WINDOW_SIZE):
+        self.values = np.full(size, np.nan)
+        self.index = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def stats(self, percentiles=PREMIUM_PERCENTILES) -> dict:
+        if not self.count:
+            return {"count": 0}
+        # 아직 다 채워지지 않았으면 앞부분만 사용 (순서는 분위수와 무관)
+        values = self.values[: self.count]
+        return {
+            "count": self.count,
+            "mean": round(float(values.mean()), 4),
+            "min": round(float(values.min()), 4),
+            "max": round(float(values.max()), 4),
+            "percentiles": {
+                f"p{q}": round(float(value), 4)
+                for q, value in zip(percentiles, np.percentile(values, percentiles))
+            },
+        }
+
+
+class PremiumMonitor:
+    """업비트 원화 가격과 바이낸스 USDT 선물 가격 x 원/달러 환율로 코인별 김프를 계산
+
+    가격은 웹소켓 시세 미러(market_data)에 신선한 값이 있으면 그대로 쓰고, 없으면 REST로 조회한다.
+    설정한 기준을 넘으면 헷지 엔진으로 진입/종료 주문을 보낸다.
+    """
+
+    def __init__(self, bases: list[str] | None = None, window_size: int = PREMIUM_WINDOW_SIZE):
+        bases = bases if bases is not None else PREMIUM_SYMBOLS.split(",")
+        self.window_size = window_size
+        self.windows: dict[str, PremiumWindow] = {
+            base.strip().upper(): PremiumWindow(window_size) for base in bases if base.strip()
+        }
+        self.latest: dict[str, dict] = {}
+        self.entry_percent = optional_float(PREMIUM_HEDGE_ENTRY_PERCENT)
+        self.exit_percent = optional_float(PREMIUM_HEDGE_EXIT_PERCENT)
+        self.hedge_amounts = parse_amounts()
+        self.leverage = int(PREMIUM_HEDGE_LEVERAGE) if PREMIUM_HEDGE_LEVERAGE else None
+        self.hedged_at: dict[str, float] = {}
+        self.hedging: set[str] = set()
+        # 이벤트 루프는 태스크를 약하게만 참조하므로 주문 중인 태스크는 끝날 때까지 여기서 붙잡아 둔다
+        self.hedge_tasks: set[asyncio.Task] = set()
+        self.triggers = 0
+        self.errors = 0
+
+    async def get_price(self, exchange_name: str, symbol: str) -> float:
+        price = market_data.last_price(exchange_name.lower(), symbol)
+        if price is not None:
+            return price
+        ticker = await get_async_client(exchange_name).fetch_ticker(symbol)
+        return ticker["last"]
+
+    async def calculate(self, base: str) -> dict:
+        """현재 김프(%) = 업비트 원화 가격 / (바이낸스 USDT 가격 x 원/달러 환율) - 1"""
+        korea_price, foreign_price, fx = await asyncio.gather(
+            self.get_price("UPBIT", f"{base}/KRW"),
+            self.get_price(FOREIGN_EXCHANGE, f"{base}/USDT:USDT"),
+            asyncio.to_thread(fx_rate.get),
+        )
+        foreign_krw = foreign_price * fx["rate"]
+        return {
+            "base": base,
+            "premium": round((korea_price / foreign_krw - 1) * 100, 4),
+            "upbit_krw": korea_price,
+            "binance_usdt": foreign_price,
+            "usd_krw": fx["rate"],
+            "fx_source": fx["source"],
+            "updated_at": time.time(),
+        }
+
+    async def sample(self, base: str):
+        try:
+            latest = await self.calculate(base)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"{base} 김프 계산 실패: {str(e)}")
+            return
+        self.latest[base] = latest
+        self.windows[base].append(latest["premium"])
+        if ENABLE_PREMIUM_HEDGE and base not in self.hedging:
+            self.check_threshold(base, latest["premium"])
+
+    def check_threshold(self, base: str, premium: float):
+        if time.monotonic() - self.hedged_at.get(base, float("-inf")) < PREMIUM_HEDGE_COOLDOWN_SECONDS:
+            return
+        if not hedge_ledger.loaded:
+            return
+        records = hedge_ledger.get(base)
+        hedged = records[FOREIGN_EXCHANGE]["amount"] > 0 and records["UPBIT"]["amount"] > 0
+        amount = self.hedge_amounts.get(base)
+        if not hedged and amount and self.entry_percent is not None and premium <= self.entry_percent:
+            self.trigger(base, "ON", premium, amount)
+        elif hedged and self.exit_percent is not None and premium >= self.exit_percent:
+            self.trigger(base, "OFF", premium)
+
+    def trigger(self, base: str, hedge: str, premium: float, amount: float | None = None):
+        """시세 계산을 막지 않도록 헷지 주문은 별도 태스크로 실행 (코인마다 하나씩)"""
+        self.hedging.add(base)
+        self.hedged_at[base] = time.monotonic()
+        self.triggers += 1
+        task = asyncio.create_task(self.hedge(base, hedge, premium, amount))
+        self.hedge_tasks.add(task)
+        task.add_done_callback(self.hedge_tasks.discard)
+
+    async def hedge(self, base: str, hedge: str, premium: float, amount: float | None):
+        try:
+            if hedge == "ON":
+                result = await hedge_engine.open(FOREIGN_EXCHANGE, base, FOREIGN_QUOTE, amount, self.leverage)
+            else:
+                result = await hedge_engine.close(FOREIGN_EXCHANGE, base, FOREIGN_QUOTE)
+                if result is None:
+                    # 그 사이 웹훅 등으로 이미 종료됨
+                    return
+            log_hedge_message(
+                FOREIGN_EXCHANGE,
+                base,
+                FOREIGN_QUOTE,
+                result["amount"][FOREIGN_EXCHANGE],
+                result["amount"]["UPBIT"],
+                hedge,
+            )
+            logger.info(f"{base} 김프 {premium}%로 자동 헷지 {hedge} (skew {result['skew_ms']}ms)")
+        except Exception:
+            log_error_message(traceback.format_exc(), f"김프 자동 헷지 {hedge}")
+        finally:
+            self.hedging.discard(base)
+            # 주문이 끝난 시점부터 다시 대기
+            self.hedged_at[base] = time.monotonic()
+
+    async def run(self, interval: float = PREMIUM_INTERVAL_SECONDS):
+        while True:
+            started_at = time.monotonic()
+            await asyncio.gather(*(self.sample(base) for base in self.windows))
+            await asyncio.sleep(max(interval - (time.monotonic() - started_at), 0))
+
+    async def get(self, base: str) -> dict:
+        """현재 김프와 최근 구간 분위수. 계산 대상이 아닌 코인은 현재 값만 바로 계산"""
+        base = base.upper()
+        window = self.windows.get(base)
+        if window is None or base not in self.latest:
+            current = await self.calculate(base)
+        else:
+            current = self.latest[base]
+        return current | {"window": window.stats() if window is not None else {"count": 0}}
+
+    def snapshot(self) -> dict:
+        return {
+            "premium": {base: latest["premium"] for base, latest in tuple(self.latest.items())},
+            "samples": {base: window.count for base, window in self.windows.items()},
+            "hedge_triggers": self.triggers,
+            "errors": self.errors,
+        }
+
+
+premium_monitor = PremiumMonitor()
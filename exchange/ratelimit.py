@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """O(1) 토큰 버킷
+
+    reserve()는 토큰을 미리 차감(음수 허용)하고 기다려야 할 시간만 돌려준다.
+    대기 자체는 호출한 쪽이 time.sleep 또는 asyncio.sleep으로 처리하므로
+    동기 코드와 이벤트 루프 양쪽에서 같은 버킷을 쓸 수 있다.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at", "_lock")
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, cost: float = 1) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def fill(self) -> float:
+        """남은 토큰 비율 (0~1, 대기열이 밀려 있으면 음수)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens / self.capacity
+
+
+class RateLimiter:
+    """여러 구간(초/분 등)의 버킷을 동시에 만족시키는 제한기"""
+
+    def __init__(self, **buckets: TokenBucket):
+        self.buckets = buckets
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, cost: float = 1) -> float:
+        wait = max(bucket.reserve(cost) for bucket in self.buckets.values())
+        self.requests += 1
+        if wait > 0:
+            self.waits += 1
+            self.wait_seconds += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def acquire(self, cost: float = 1):
+        wait = self.reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1):
+        wait = self.reserve(cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def snapshot(self) -> dict:
+        return {
+            "fill": {name: round(bucket.fill(), 3) for name, bucket in self.buckets.items()},
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+# KIS 호출 제한은 계좌 객체가 아니라 앱키 단위로 걸리므로 앱키별로 하나씩 공유
+rate_limiters: dict[str, RateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str, per_second: int, per_minute: int) -> RateLimiter:
+    limiter = rate_limiters.get(key)
+    if limiter is None:
+        with rate_limiters_lock:
+            limiter = rate_limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(
+                    second=TokenBucket(per_second, 1.0),
+                    minute=TokenBucket(per_minute, 60.0),
+                )
+                rate_limiters[key] = limiter
+    return limiter
+
+
+class ClientThrottle:
+    """ccxt 클라이언트의 throttle 자리에 끼우는 어댑터
+
+    ccxt는 요청마다 self.throttle(cost)를 호출하고 async 클라이언트는 그 결과를 await 한다.
+    cost는 엔드포인트별 가중치(rateLimit 배수)이므로 그대로 버킷에서 차감한다.
+    """
+
+    def __init__(self, limiter: RateLimiter, asynchronous: bool):
+        self.limiter = limiter
+        self.asynchronous = asynchronous
+        self.loop = None  # async_support의 open()이 설정하는 속성
+
+    def __call__(self, cost=None):
+        cost = 1 if cost is None else cost
+        if self.asynchronous:
+            return self.limiter.acquire_async(cost)
+        self.limiter.acquire(cost)
+
+
+# 거래소별 가중치 예산. 동기/비동기 클라이언트가 같은 예산을 나눠 쓴다
+exchange_governors: dict[str, RateLimiter] = {}
+
+# ccxt rateLimit이 실제 거래소 제한보다 지나치게 보수적인 경우 초당 요청 수를 직접 지정
+REQUESTS_PER_SECOND = {
+    "upbit": 8,  # 주문 API 초당 8회 (ccxt 기본값은 초당 1회)
+}
+
+
+def get_exchange_governor(client) -> RateLimiter:
+    governor = exchange_governors.get(client.id)
+    if governor is None:
+        with rate_limiters_lock:
+            governor = exchange_governors.get(client.id)
+            if governor is None:
+                # rateLimit(ms)은 가중치 1짜리 요청 간격이므로 초당 1000 / rateLimit 만큼 허용
+                per_second = REQUESTS_PER_SECOND.get(client.id, 1000 / client.rateLimit)
+                governor = RateLimiter(second=TokenBucket(per_second, 1.0))
+                exchange_governors[client.id] = governor
+    return governor
+
+
+def govern(client, asynchronous: bool = False):
+    """ccxt 클라이언트의 요청 간격 조절을 거래소 공용 가중치 예산으로 교체"""
+    client.enableRateLimit = True
+    client.throttle = ClientThrottle(get_exchange_governor(client), asynchronous)
+    return client
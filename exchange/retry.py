@@ -0,0 +1,247 @@
+import random
+import re
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable
+
+import ccxt
+from loguru import logger
+
+from exchange.model import MarketOrder
+
+
+class ErrorCategory(str, Enum):
+    POSITION_MODE = "position_mode"  # 단방향/양방향 포지션 모드 불일치
+    TIMESTAMP = "timestamp"  # 서버 시간 차이
+    TRANSIENT = "transient"  # 거래소 내부 오류, 5xx
+    RATE_LIMIT = "rate_limit"  # 요청 한도 초과
+    FATAL = "fatal"  # 재시도해도 소용없는 에러
+
+
+@dataclass(frozen=True)
+class Backoff:
+    attempts: int  # 이 분류로 허용되는 재시도 횟수
+    base: float | None  # 첫 대기 시간(초), None이면 호출부의 delay 사용
+    cap: float  # 최대 대기 시간(초)
+
+
+BACKOFF = {
+    ErrorCategory.POSITION_MODE: Backoff(attempts=2, base=0, cap=0),
+    ErrorCategory.TIMESTAMP: Backoff(attempts=2, base=0, cap=0),
+    ErrorCategory.TRANSIENT: Backoff(attempts=4, base=None, cap=2.0),
+    ErrorCategory.RATE_LIMIT: Backoff(attempts=5, base=0.5, cap=5.0),
+}
+
+# 거래소별 에러 메시지 패턴 -> (분류, 태그)
+ERROR_PATTERNS = {
+    exchange: [(re.compile(pattern), category, tag) for pattern, category, tag in rules]
+    for exchange, rules in {
+        "BINANCE": [
+            ("position side does not match", ErrorCategory.POSITION_MODE, None),
+            # -1001 "Internal error; unable to process your request": 처리되지 않았다고 명시하므로 주문도 재시도
+            ("Internal error", ErrorCategory.TRANSIENT, None),
+            ('"code":-1001', ErrorCategory.TRANSIENT, None),
+            ('"code":-1021', ErrorCategory.TIMESTAMP, None),
+        ],
+        "BYBIT": [
+            ("position idx not match position mode", ErrorCategory.POSITION_MODE, None),
+            ("check your server timestamp", ErrorCategory.TIMESTAMP, None),
+        ],
+        "OKX": [
+            ("posSide error", ErrorCategory.POSITION_MODE, None),
+        ],
+        "BITGET": [
+            ("unilateral position", ErrorCategory.POSITION_MODE, "unilateral"),
+            ("two-way positions", ErrorCategory.POSITION_MODE, "two-way"),
+        ],
+    }.items()
+}
+
+# 메시지 패턴에 걸리지 않은 에러는 ccxt 예외 타입으로 분류
+# RequestTimeout은 주문이 이미 접수됐을 수 있으므로 재시도하지 않는다
+# ExchangeNotAvailable(5xx, 매핑되지 않은 4xx)도 주문 처리 여부를 알 수 없으므로 조회 호출에서만 재시도
+ERROR_TYPES = (
+    ((ccxt.RateLimitExceeded, ccxt.DDoSProtection), ErrorCategory.RATE_LIMIT),
+    ((ccxt.InvalidNonce,), ErrorCategory.TIMESTAMP),
+    ((ccxt.RequestTimeout,), ErrorCategory.FATAL),
+    ((ccxt.ExchangeNotAvailable,), ErrorCategory.TRANSIENT),
+)
+
+
+def classify_error(exchange: str, e: Exception, is_order: bool = False) -> tuple[ErrorCategory, str | None]:
+    """is_order면 주문 제출 호출. 주문은 거래소가 '처리하지 못했다'고 명시한 메시지 패턴일 때만 일시 오류로 본다"""
+    message = str(e)
+    for pattern, category, tag in ERROR_PATTERNS.get(exchange, ()):
+        if pattern.search(message):
+            return category, tag
+    for types, category in ERROR_TYPES:
+        if isinstance(e, types):
+            if is_order and category == ErrorCategory.TRANSIENT:
+                return ErrorCategory.FATAL, None
+            return category, None
+    return ErrorCategory.FATAL, None
+
+
+def replace_arg(args: tuple, index: int, value) -> tuple:
+    return tuple(value if i == index else arg for i, arg in enumerate(args))
+
+
+def binance_position_mode(instance, order_info: MarketOrder, args: tuple, tag):
+    if instance.position_mode == "one-way":
+        instance.position_mode = "hedge"
+        if order_info.side == "buy":
+            positionSide = "LONG" if order_info.is_entry else "SHORT"
+        else:
+            positionSide = "SHORT" if order_info.is_entry else "LONG"
+        params = {"positionSide": positionSide}
+    else:
+        instance.position_mode = "one-way"
+        params = {} if order_info.is_entry else {"reduceOnly": True}
+    return replace_arg(args, 5, params), None
+
+
+def bybit_position_mode(instance, order_info: MarketOrder, args: tuple, tag):
+    if instance.position_mode == "one-way":
+        instance.position_mode = "hedge"
+        if order_info.side == "buy":
+            position_idx = 1 if order_info.is_entry else 2
+        else:
+            position_idx = 2 if order_info.is_entry else 1
+    else:
+        instance.position_mode = "one-way"
+        position_idx = 0
+    params = {"position_idx": position_idx}
+    if order_info.is_close:
+        params["reduceOnly"] = True
+    return replace_arg(args, 5, params), None
+
+
+def okx_position_mode(instance, order_info: MarketOrder, args: tuple, tag):
+    params = {}
+    if instance.position_mode == "one-way":
+        instance.position_mode = "hedge"
+        pos_side = "net"
+        if order_info.is_futures and order_info.side == "buy":
+            pos_side = "long" if order_info.is_entry else "short"
+        elif order_info.is_futures and order_info.side == "sell":
+            pos_side = "short" if order_info.is_entry else "long"
+        params |= {"posSide": pos_side, "tdMode": order_info.margin_mode or "isolated"}
+    else:
+        instance.position_mode = "one-way"
+        if order_info.is_close:
+            params |= {"reduceOnly": True}
+
+    prepare = None
+    if order_info.is_entry:
+        leverage = order_info.leverage or 1
+        prepare = lambda: instance.set_leverage(leverage, order_info.unified_symbol)
+        params |= {"tdMode": order_info.margin_mode or "isolated"}
+    return replace_arg(args, 5, params), prepare
+
+
+def bitget_position_mode(instance, order_info: MarketOrder, args: tuple, tag):
+    if instance.position_mode == "hedge":
+        instance.position_mode = "one-way"
+        new_side = order_info.side + "_single"
+        params = {"side": new_side}
+        if tag == "two-way":
+            params = {"reduceOnly": True, "side": new_side}
+        args = replace_arg(args, 2, new_side)
+    else:
+        instance.position_mode = "hedge"
+        params = {} if order_info.is_entry else {"reduceOnly": True}
+    return replace_arg(args, 5, params), None
+
+
+POSITION_MODE_HANDLERS = {
+    "BINANCE": binance_position_mode,
+    "BYBIT": bybit_position_mode,
+    "OKX": okx_position_mode,
+    "BITGET": bitget_position_mode,
+}
+
+
+class RetryState:
+    """한 번의 주문 재시도 상태. 에러마다 분류를 한 번만 하고 분류별 재시도 예산을 적용"""
+
+    def __init__(self, func, order_info: MarketOrder, max_attempts, delay, instance):
+        self.func_name = getattr(func, "__name__", "")
+        self.order_info = order_info
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.instance = instance
+        self.attempts = 0
+        self.used = {category: 0 for category in ErrorCategory}
+
+    def next(self, e: Exception, args: tuple) -> tuple[float, tuple, Callable | None] | None:
+        """다음 시도를 위한 (대기 시간, 인자, 사전 작업)을 반환하고, 재시도할 수 없으면 None"""
+        logger.error(f"에러 발생: {str(e)}")
+        self.attempts += 1
+        exchange = self.order_info.exchange
+        category, tag = classify_error(exchange, e, self.func_name == "create_order")
+        prepare = None
+
+        if category == ErrorCategory.POSITION_MODE:
+            handler = POSITION_MODE_HANDLERS.get(exchange)
+            if self.func_name != "create_order" or handler is None:
+                category = ErrorCategory.FATAL
+            else:
+                args, prepare = handler(self.instance, self.order_info, args, tag)
+        elif category == ErrorCategory.TIMESTAMP:
+            client = getattr(self.instance, "client", None)
+            if hasattr(client, "load_time_difference"):
+                prepare = client.load_time_difference
+
+        budget = BACKOFF.get(category)
+        if (
+            budget is None
+            or self.used[category] >= budget.attempts
+            or self.attempts >= self.max_attempts
+        ):
+            return None
+
+        self.used[category] += 1
+        base = self.delay if budget.base is None else budget.base
+        wait = min(budget.cap, base * 2 ** (self.used[category] - 1))
+        wait = wait / 2 + random.uniform(0, wait / 2)
+        logger.error(
+            f"[{category.value}] 재시도 {self.max_attempts - self.attempts}번 남았음"
+        )
+        return wait, args, prepare
+
+
+def invalidate_account_cache(instance):
+    """주문이 체결됐을 수 있으므로(실패 포함) 어댑터의 잔고/포지션 캐시와 스트림 상태를 무효화"""
+    cache = getattr(instance, "cache", None)
+    if cache is not None:
+        cache.invalidate_account()
+    user_stream = getattr(instance, "user_stream", None)
+    if user_stream is not None:
+        user_stream.mark_pending()
+
+
+def retry(
+    func,
+    *args,
+    order_info: MarketOrder,
+    max_attempts=3,
+    delay=1,
+    instance=None,
+):
+    state = RetryState(func, order_info, max_attempts, delay, instance)
+    try:
+        while True:
+            try:
+                return func(*args)  # 함수 실행
+            except Exception as e:
+                plan = state.next(e, args)
+                if plan is None:
+                    raise
+                wait, args, prepare = plan
+                if prepare is not None:
+                    prepare()
+                if wait:
+                    time.sleep(wait)  # 주문 스레드만 대기
+    finally:
+        invalidate_account_cache(instance)
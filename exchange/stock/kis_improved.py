@@ -1,23 +1,24 @@
 import time
+import asyncio
+import threading
 import httpx
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import json
 import traceback
-import copy
 from dataclasses import dataclass
 import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
+from exchange.utility.fx import fx_rate
+from exchange.ratelimit import get_rate_limiter
+from exchange.stock import transport
 
 # 기존 POA 모듈들 import
 try:
     from exchange.stock.error import TokenExpired
     from exchange.stock.schemas import *
     from exchange.database import db
-    from pydantic import validate_arguments
     from exchange.model import MarketOrder
     from exchange.utility import log_message
-    from exchange.utility.kis_debugger import KISDebugger, debug_kis_method
 except ImportError:
     print("Warning: POA modules not found, using mock implementations")
     class TokenExpired(Exception): pass
@@ -28,6 +29,11 @@ except ImportError:
         def set_auth(auth_id, token, expires): pass
         @staticmethod
         def get_auth(auth_id): return None
+
+# 디버거는 선택 모듈이라 없어도 토큰 저장(db) 등 나머지는 실제 모듈을 사용
+try:
+    from exchange.utility.kis_debugger import KISDebugger, debug_kis_method
+except ImportError:
     class KISDebugger:
         def __init__(self, *args, **kwargs): 
             import logging
@@ -87,6 +93,8 @@ class ImprovedKoreaInvestment:
         self.token_expires_at = None
         self.last_auth_check = None
         self.is_auth = False
+        # 같은 계좌의 동시 토큰 갱신을 하나로 합친다 (single-flight)
+        self._auth_lock = threading.Lock()
         self.base_headers = {}
 
         # 데이터베이스에서 기존 토큰 정보 로드
@@ -110,11 +118,11 @@ class ImprovedKoreaInvestment:
         except Exception as e:
             if self.debugger: self.debugger.log_auth_event("token_db_load_error", False, {"error": str(e)})
         
-        self.api_call_times = []
         self.max_calls_per_second = 18
         self.max_calls_per_minute = 950
+        self.rate_limiter = get_rate_limiter(self.key, self.max_calls_per_second, self.max_calls_per_minute)
         
-        self.session = httpx.Client(timeout=30.0)
+        self.session = transport.get_client()
         
         self.base_order_body = AccountInfo(
             CANO=account_number, ACNT_PRDT_CD=account_code
@@ -130,35 +138,45 @@ class ImprovedKoreaInvestment:
             "NYSE": QueryExchangeCode.NYSE,
             "AMEX": QueryExchangeCode.AMEX,
         }
-
-        self._ensure_authentication()
+        self._compile_order_templates()
+        # 토큰 발급/검증은 첫 API 호출 때 (또는 시작 시 백그라운드 준비 확인에서) 수행
 
     def init_info(self, order_info: MarketOrder):
         self.order_info = order_info
     
     def _rate_limit_check(self):
-        now = time.time()
-        recent_calls_sec = [t for t in self.api_call_times if now - t < 1.0]
-        if len(recent_calls_sec) >= self.max_calls_per_second:
-            time.sleep(1.1 - (now - min(recent_calls_sec)))
-        
-        recent_calls_min = [t for t in self.api_call_times if now - t < 60.0]
-        if len(recent_calls_min) >= self.max_calls_per_minute:
-            time.sleep(61.0 - (now - min(recent_calls_min)))
-
-        self.api_call_times = [t for t in recent_calls_min if now - t < 60.0]
-        self.api_call_times.append(time.time())
+        self.rate_limiter.acquire()
     
+    def _token_valid_for(self, margin: timedelta) -> bool:
+        return bool(self.access_token and self.token_expires_at and
+                    datetime.now() + margin < self.token_expires_at)
+
     def _ensure_authentication(self) -> bool:
-        if (not self.access_token or not self.token_expires_at or
-                datetime.now() + timedelta(minutes=10) >= self.token_expires_at):
-            return self._refresh_token()
-        if (not self.last_auth_check or 
-                datetime.now() - self.last_auth_check > timedelta(minutes=5)):
-            return self._validate_token()
-        return True
-    
-    def _refresh_token(self) -> bool:
+        """토큰이 곧 만료될 때만 갱신. 주기적 검증 호출은 하지 않는다 (갱신은 스케줄러가 미리 수행)"""
+        if self._token_valid_for(timedelta(minutes=10)):
+            return True
+        return self._refresh_token()
+
+    def refresh_token_if_expiring(self, within: timedelta) -> Optional[bool]:
+        """만료가 within 이내로 다가온 토큰만 미리 갱신. 갱신하지 않았으면 None"""
+        if self._token_valid_for(within):
+            return None
+        return self._refresh_token(stale_token=self.access_token)
+
+    def _refresh_token(self, stale_token: Optional[str] = None) -> bool:
+        """토큰 발급. 여러 스레드가 동시에 요청하면 하나만 발급하고 나머지는 그 결과를 사용
+
+        stale_token: 만료된 것으로 확인된 토큰. 기다리는 동안 이미 다른 토큰으로 바뀌었으면 재발급하지 않는다.
+        """
+        with self._auth_lock:
+            if stale_token is None:
+                if self._token_valid_for(timedelta(minutes=10)):
+                    return True
+            elif self.access_token != stale_token and self._token_valid_for(timedelta(0)):
+                return True
+            return self._issue_token()
+
+    def _issue_token(self) -> bool:
         if self.debugger: self.debugger.log_auth_event("token_refresh_start", True)
         endpoint = "/oauth2/tokenP"
         data = {"grant_type": "client_credentials", "appkey": self.key, "appsecret": self.secret}
@@ -194,7 +212,7 @@ class ImprovedKoreaInvestment:
             res_data = response.json()
             if res_data.get("msg_cd") == "EGW00123":
                 if self.debugger: self.debugger.log_auth_event("token_validation_expired", False)
-                return self._refresh_token()
+                return self._refresh_token(stale_token=headers["authorization"].removeprefix("Bearer "))
             self.last_auth_check = datetime.now()
             if self.debugger: self.debugger.log_auth_event("token_validation_success", True)
             return True
@@ -205,121 +223,191 @@ class ImprovedKoreaInvestment:
     def _get_headers(self, tr_id: str) -> Dict[str, str]:
         return {"Content-Type": "application/json; charset=utf-8", "authorization": f"Bearer {self.access_token}", "appkey": self.key, "appsecret": self.secret, "tr_id": tr_id, "custtype": "P"}
 
+    def _handle_response(self, response: httpx.Response, endpoint: str, method: str, headers: Dict, payload: Optional[Dict]) -> Optional[Dict]:
+        """KIS 응답 해석. 성공이면 응답 데이터, 토큰 만료면 None, 그 외 오류는 예외"""
+        try:
+            res_data = response.json()
+        except json.JSONDecodeError:
+            print(f"CRITICAL: KIS API JSON Decode Error. Status={response.status_code}, URL={response.url}, Response='{response.text}'")
+            raise
+
+        if self.debugger: self.debugger.log_api_call(endpoint, method, headers, payload, res_data)
+
+        if res_data.get("rt_cd") == "0": return res_data
+        elif res_data.get("msg_cd") == "EGW00123":
+            if self.debugger: self.debugger.logger.warning(f"Token expired, refreshing...")
+            return None
+        else:
+            raise Exception(f"API error: {res_data.get('msg1', 'Unknown error')}")
+
     def _api_call_with_retry(self, method: str, endpoint: str, headers: Dict, params: Dict = None, data: Dict = None, max_retries: int = 3) -> Dict:
         for attempt in range(max_retries):
             try:
                 if not self._ensure_authentication(): raise Exception("Authentication failed")
-                headers["authorization"] = f"Bearer {self.access_token}"
+                token = self.access_token
+                headers["authorization"] = f"Bearer {token}"
                 self._rate_limit_check()
                 
                 if method.upper() == "GET":
                     response = self.session.get(f"{self.base_url}{endpoint}", headers=headers, params=params)
                 else:
                     response = self.session.post(f"{self.base_url}{endpoint}", headers=headers, json=data)
-                
-                try:
-                    res_data = response.json()
-                except json.JSONDecodeError:
-                    print(f"CRITICAL: KIS API JSON Decode Error. Status={response.status_code}, URL={response.url}, Response='{response.text}'")
-                    raise
 
-                if self.debugger: self.debugger.log_api_call(endpoint, method, headers, params or data, res_data)
-                
-                if res_data.get("rt_cd") == "0": return res_data
-                elif res_data.get("msg_cd") == "EGW00123":
-                    if self.debugger: self.debugger.logger.warning(f"Token expired, refreshing...")
-                    if self._refresh_token(): continue
-                    else: raise Exception("Token refresh failed")
-                else:
-                    raise Exception(f"API error: {res_data.get('msg1', 'Unknown error')}")
+                res_data = self._handle_response(response, endpoint, method, headers, params or data)
+                if res_data is not None: return res_data
+                if self._refresh_token(stale_token=token): continue
+                else: raise Exception("Token refresh failed")
             except Exception as e:
                 if self.debugger: self.debugger.logger.error(f"Attempt {attempt + 1} failed: {e}")
                 if attempt == max_retries - 1: raise
                 time.sleep((2 ** attempt))
         raise Exception("Max retries exceeded")
 
+    async def _ensure_authentication_async(self) -> bool:
+        if self._token_valid_for(timedelta(minutes=10)):
+            return True
+        return await asyncio.to_thread(self._refresh_token)
+
+    async def _api_call_async(self, method: str, endpoint: str, headers: Dict, params: Dict = None, data: Dict = None, max_retries: int = 3) -> Dict:
+        """_api_call_with_retry의 async 버전 (공유 AsyncClient 사용, 이벤트 루프를 막지 않음)"""
+        client = transport.get_async_client()
+        for attempt in range(max_retries):
+            try:
+                if not await self._ensure_authentication_async(): raise Exception("Authentication failed")
+                token = self.access_token
+                headers["authorization"] = f"Bearer {token}"
+                await self.rate_limiter.acquire_async()
+
+                if method.upper() == "GET":
+                    response = await client.get(f"{self.base_url}{endpoint}", headers=headers, params=params)
+                else:
+                    response = await client.post(f"{self.base_url}{endpoint}", headers=headers, json=data)
+
+                res_data = self._handle_response(response, endpoint, method, headers, params or data)
+                if res_data is not None: return res_data
+                if await asyncio.to_thread(self._refresh_token, token): continue
+                else: raise Exception("Token refresh failed")
+            except Exception as e:
+                if self.debugger: self.debugger.logger.error(f"Attempt {attempt + 1} failed: {e}")
+                if attempt == max_retries - 1: raise
+                await asyncio.sleep((2 ** attempt))
+        raise Exception("Max retries exceeded")
+
+    def _domestic_balance_request(self) -> Tuple[str, str, Dict]:
+        is_mock = "openapivts" in self.base_url
+        tr_id = "VTTC8434R" if is_mock else "TTTC8434R"
+        endpoint = "/uapi/domestic-stock/v1/trading/inquire-balance"
+        params = {"CANO": self.account_number, "ACNT_PRDT_CD": self.account_code, "AFHR_FLPR_YN": "N", "OFL_YN": "", "INQR_DVSN": "02", "UNPR_DVSN": "01", "FUND_STTL_ICLD_YN": "N", "FNCG_AMT_AUTO_RDPT_YN": "N", "PRCS_DVSN": "01", "CTX_AREA_FK100": "", "CTX_AREA_NK100": ""}
+        return endpoint, tr_id, params
+
+    def _parse_domestic_balance(self, data: Dict, tr_id: str) -> Dict:
+        output2 = data.get("output2")
+        total_krw = 0
+        if isinstance(output2, list) and len(output2) > 0:
+            total_krw = int(float(output2[0].get("tot_evlu_amt", 0)))
+
+        stocks = [
+            AssetInfo(
+                symbol=i.get("pdno",""), 
+                name=i.get("prdt_name",""), 
+                quantity=int(i.get("hldg_qty",0)), 
+                average_price=float(i.get("pchs_avg_pric",0)), 
+                current_price=float(i.get("prpr",0)), 
+                eval_amount=int(float(i.get("evlu_amt",0))),
+                eval_amount_usd=0, # 국내 주식은 USD 평가액 없음
+                market_type="domestic"
+            ) for i in data.get("output1",[]) if int(i.get("hldg_qty",0)) > 0
+        ]
+        if self.debugger: self.debugger.logger.info(f"Domestic balance: {total_krw:,} KRW, {len(stocks)} stocks (tr_id: {tr_id})")
+        return {"total_krw": total_krw, "stocks": stocks}
+
     def get_domestic_balance(self) -> Dict:
         try:
-            is_mock = "openapivts" in self.base_url
-            tr_id = "VTTC8434R" if is_mock else "TTTC8434R"
-            
-            endpoint = "/uapi/domestic-stock/v1/trading/inquire-balance"
-            headers = self._get_headers(tr_id)
-            params = {"CANO": self.account_number, "ACNT_PRDT_CD": self.account_code, "AFHR_FLPR_YN": "N", "OFL_YN": "", "INQR_DVSN": "02", "UNPR_DVSN": "01", "FUND_STTL_ICLD_YN": "N", "FNCG_AMT_AUTO_RDPT_YN": "N", "PRCS_DVSN": "01", "CTX_AREA_FK100": "", "CTX_AREA_NK100": ""}
-            data = self._api_call_with_retry("GET", endpoint, headers, params)
-            
-            output2 = data.get("output2")
-            total_krw = 0
-            if isinstance(output2, list) and len(output2) > 0:
-                total_krw = int(float(output2[0].get("tot_evlu_amt", 0)))
-
-            stocks = [
-                AssetInfo(
-                    symbol=i.get("pdno",""), 
-                    name=i.get("prdt_name",""), 
-                    quantity=int(i.get("hldg_qty",0)), 
-                    average_price=float(i.get("pchs_avg_pric",0)), 
-                    current_price=float(i.get("prpr",0)), 
-                    eval_amount=int(float(i.get("evlu_amt",0))),
-                    eval_amount_usd=0, # 국내 주식은 USD 평가액 없음
-                    market_type="domestic"
-                ) for i in data.get("output1",[]) if int(i.get("hldg_qty",0)) > 0
-            ]
-            if self.debugger: self.debugger.logger.info(f"Domestic balance: {total_krw:,} KRW, {len(stocks)} stocks (tr_id: {tr_id})")
-            return {"total_krw": total_krw, "stocks": stocks}
+            endpoint, tr_id, params = self._domestic_balance_request()
+            data = self._api_call_with_retry("GET", endpoint, self._get_headers(tr_id), params)
+            return self._parse_domestic_balance(data, tr_id)
         except Exception as e:
             if self.debugger: self.debugger.logger.error(f"Domestic balance query failed: {e}")
             return {"total_krw": 0, "stocks": []}
 
-    def get_overseas_balance(self) -> Dict:
-        """해외 주식 잔고 조회 (공식 문서 기반 최종 수정)"""
-        all_stocks = []
+    async def get_domestic_balance_async(self) -> Dict:
+        try:
+            endpoint, tr_id, params = self._domestic_balance_request()
+            data = await self._api_call_async("GET", endpoint, self._get_headers(tr_id), params)
+            return self._parse_domestic_balance(data, tr_id)
+        except Exception as e:
+            if self.debugger: self.debugger.logger.error(f"Domestic balance query failed: {e}")
+            return {"total_krw": 0, "stocks": []}
+
+    overseas_exchange_codes = ("NYS", "NAS", "AMEX", "ARCX")
+
+    def _overseas_balance_request(self, exch_code: str) -> Tuple[str, str, Dict]:
         is_mock = "openapivts" in self.base_url
         tr_id = "VTTS3012R" if is_mock else "TTTS3012R"
-        
-        for exch_code in ["NYS", "NAS", "AMEX", "ARCX"]:
-            try:
-                endpoint = "/uapi/overseas-stock/v1/trading/inquire-balance"
-                headers = self._get_headers(tr_id)
-                params = {
-                    "CANO": self.account_number, "ACNT_PRDT_CD": self.account_code,
-                    "OVRS_EXCG_CD": exch_code, "TR_CRCY_CD": "USD",
-                    "CTX_AREA_FK200": "", "CTX_AREA_NK200": ""
-                }
-                data = self._api_call_with_retry("GET", endpoint, headers, params)
-                
-                output1 = data.get("output1", [])
-                for item in output1:
-                    if int(item.get("ovrs_cblc_qty", 0)) > 0:
-                        stock_info = AssetInfo(
-                            symbol=item.get("ovrs_pdno", ""),
-                            name=item.get("ovrs_item_name", ""),
-                            quantity=int(item.get("ovrs_cblc_qty", 0)),
-                            average_price=float(item.get("pchs_avg_pric", 0)),
-                            current_price=float(item.get("now_pric2", 0)),
-                            # 공식 문서 기준, 개별 주식의 USD 평가액은 ovrs_stck_evlu_amt
-                            eval_amount_usd=float(item.get("ovrs_stck_evlu_amt", 0)),
-                            # 원화 평가액은 이 API에서 제공하지 않으므로 0으로 처리
-                            eval_amount=0, 
-                            market_type=f"overseas_{exch_code}"
-                        )
-                        all_stocks.append(stock_info)
-                
-                if self.debugger: self.debugger.logger.info(f"Successfully fetched {exch_code} balance.")
-            except Exception as e:
-                if self.debugger: self.debugger.logger.warning(f"Could not fetch {exch_code} balance: {e}")
-
+        endpoint = "/uapi/overseas-stock/v1/trading/inquire-balance"
+        params = {
+            "CANO": self.account_number, "ACNT_PRDT_CD": self.account_code,
+            "OVRS_EXCG_CD": exch_code, "TR_CRCY_CD": "USD",
+            "CTX_AREA_FK200": "", "CTX_AREA_NK200": ""
+        }
+        return endpoint, tr_id, params
+
+    def _parse_overseas_stocks(self, data: Dict, exch_code: str) -> List[AssetInfo]:
+        stocks = []
+        for item in data.get("output1", []):
+            if int(item.get("ovrs_cblc_qty", 0)) > 0:
+                stocks.append(AssetInfo(
+                    symbol=item.get("ovrs_pdno", ""),
+                    name=item.get("ovrs_item_name", ""),
+                    quantity=int(item.get("ovrs_cblc_qty", 0)),
+                    average_price=float(item.get("pchs_avg_pric", 0)),
+                    current_price=float(item.get("now_pric2", 0)),
+                    # 공식 문서 기준, 개별 주식의 USD 평가액은 ovrs_stck_evlu_amt
+                    eval_amount_usd=float(item.get("ovrs_stck_evlu_amt", 0)),
+                    # 원화 평가액은 이 API에서 제공하지 않으므로 0으로 처리
+                    eval_amount=0, 
+                    market_type=f"overseas_{exch_code}"
+                ))
+        if self.debugger: self.debugger.logger.info(f"Successfully fetched {exch_code} balance.")
+        return stocks
+
+    def _overseas_balance_result(self, all_stocks: List[AssetInfo]) -> Dict:
         # 총 USD 평가액은 모든 개별 주식의 USD 평가액을 합산하여 계산
         total_usd = sum(stock.eval_amount_usd for stock in all_stocks)
 
         if self.debugger:
-            self.debugger.logger.info(f"Overseas balance query completed: {total_usd:,.2f} USD, {len(all_stocks)} stocks (tr_id: {tr_id})")
+            self.debugger.logger.info(f"Overseas balance query completed: {total_usd:,.2f} USD, {len(all_stocks)} stocks")
             
         # 이 API는 신뢰할 수 있는 원화 총액을 제공하지 않으므로, USD 총액만 반환
         return {"total_usd": total_usd, "stocks": all_stocks}
 
-    def fetch_current_price(self, exchange: str, ticker: str) -> Optional[float]:
-        """해외 주식 현재가 조회"""
+    def get_overseas_balance(self) -> Dict:
+        """해외 주식 잔고 조회 (공식 문서 기반 최종 수정)"""
+        all_stocks = []
+        for exch_code in self.overseas_exchange_codes:
+            try:
+                endpoint, tr_id, params = self._overseas_balance_request(exch_code)
+                data = self._api_call_with_retry("GET", endpoint, self._get_headers(tr_id), params)
+                all_stocks.extend(self._parse_overseas_stocks(data, exch_code))
+            except Exception as e:
+                if self.debugger: self.debugger.logger.warning(f"Could not fetch {exch_code} balance: {e}")
+        return self._overseas_balance_result(all_stocks)
+
+    async def get_overseas_balance_async(self) -> Dict:
+        """해외 주식 잔고 조회 (거래소 코드별 동시 조회)"""
+        async def fetch(exch_code: str) -> List[AssetInfo]:
+            try:
+                endpoint, tr_id, params = self._overseas_balance_request(exch_code)
+                data = await self._api_call_async("GET", endpoint, self._get_headers(tr_id), params)
+                return self._parse_overseas_stocks(data, exch_code)
+            except Exception as e:
+                if self.debugger: self.debugger.logger.warning(f"Could not fetch {exch_code} balance: {e}")
+                return []
+
+        results = await asyncio.gather(*(fetch(exch_code) for exch_code in self.overseas_exchange_codes))
+        return self._overseas_balance_result([stock for stocks in results for stock in stocks])
+
+    def _current_price_request(self, exchange: str, ticker: str) -> Optional[Tuple[str, str, Dict]]:
         is_mock = "openapivts" in self.base_url
         tr_id = "HHDFS00000300" if not is_mock else "VHDFS00000300"
         
@@ -329,68 +417,96 @@ class ImprovedKoreaInvestment:
             return None
 
         endpoint = "/uapi/overseas-price/v1/quotations/price"
-        headers = self._get_headers(tr_id)
         params = {"AUTH": "", "EXCD": exchange_code.value, "SYMB": ticker}
-        
+        return endpoint, tr_id, params
+
+    def _parse_current_price(self, data: Dict, exchange: str, ticker: str) -> float:
+        price = float(data.get("output", {}).get("last", "0"))
+        if self.debugger: self.debugger.logger.info(f"Current price for {ticker} ({exchange}): {price}")
+        return price
+
+    def fetch_current_price(self, exchange: str, ticker: str) -> Optional[float]:
+        """해외 주식 현재가 조회"""
+        request = self._current_price_request(exchange, ticker)
+        if request is None:
+            return None
+        endpoint, tr_id, params = request
         try:
-            data = self._api_call_with_retry("GET", endpoint, headers, params)
-            price_str = data.get("output", {}).get("last", "0")
-            price = float(price_str)
-            if self.debugger: self.debugger.logger.info(f"Current price for {ticker} ({exchange}): {price}")
-            return price
+            data = self._api_call_with_retry("GET", endpoint, self._get_headers(tr_id), params)
+            return self._parse_current_price(data, exchange, ticker)
         except Exception as e:
             if self.debugger: self.debugger.logger.error(f"Failed to fetch current price for {ticker}: {e}")
             return None
 
-    @validate_arguments
-    def create_order(
+    async def fetch_current_price_async(self, exchange: str, ticker: str) -> Optional[float]:
+        request = self._current_price_request(exchange, ticker)
+        if request is None:
+            return None
+        endpoint, tr_id, params = request
+        try:
+            data = await self._api_call_async("GET", endpoint, self._get_headers(tr_id), params)
+            return self._parse_current_price(data, exchange, ticker)
+        except Exception as e:
+            if self.debugger: self.debugger.logger.error(f"Failed to fetch current price for {ticker}: {e}")
+            return None
+
+    def _compile_order_templates(self):
+        """주문 헤더/바디 틀을 계좌 생성 시 한 번 만들어 두고, 주문마다 종목/수량/가격만 채운다"""
+        def headers(tr_id: TransactionId) -> Dict[str, str]:
+            # authorization은 토큰이 바뀔 수 있으므로 주문 시점에 채움
+            return {"authorization": "", "appkey": self.key, "appsecret": self.secret,
+                    "custtype": "P", "tr_id": tr_id.value}
+
+        account = {"CANO": self.account_number, "ACNT_PRDT_CD": self.account_code}
+        usa_headers = {
+            "buy": headers(TransactionId.usa_buy),
+            "sell": headers(TransactionId.usa_sell),
+        }
+        self.order_header_templates = {
+            "KRX": {
+                "buy": headers(TransactionId.korea_buy),
+                "sell": headers(TransactionId.korea_sell),
+            },
+        } | {exchange: usa_headers for exchange in self.order_exchange_code}
+
+        krx_body = account | {"PDNO": "", "ORD_QTY": "", "ORD_DVSN": KoreaOrderType.market.value, "ORD_UNPR": "0"}
+        self.order_body_templates = {
+            ("KRX", "market"): krx_body,
+            ("KRX", "limit"): krx_body | {"ORD_DVSN": KoreaOrderType.limit.value},
+        } | {
+            # 해외 주문은 시장가도 지정가(UsaOrderType.limit)로 보낸다
+            (exchange, order_type): account | {
+                "PDNO": "", "ORD_QTY": "", "ORD_DVSN": UsaOrderType.limit.value,
+                "OVRS_ORD_UNPR": "", "OVRS_EXCG_CD": exchange_code.value, "ORD_SVR_DVSN_CD": "0",
+            }
+            for exchange, exchange_code in self.order_exchange_code.items()
+            for order_type in ("market", "limit")
+        }
+
+    def _build_order(
         self,
-        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        exchange: str,
         ticker: str,
-        order_type: Literal["limit", "market"],
-        side: Literal["buy", "sell"],
+        order_type: str,
+        side: str,
         amount: int,
         price: int = 0,
-        mintick=0.01,
-    ):
-        endpoint = (
-            Endpoints.korea_order.value
-            if exchange == "KRX"
-            else Endpoints.usa_order.value
-        )
-        body = self.base_order_body.dict()
-        headers = copy.deepcopy(self.base_headers)
-        price = str(price)
-
-        amount = str(int(amount))
+        current_price: Optional[float] = None,
+    ) -> Tuple[str, Dict, Dict]:
+        """주문 엔드포인트/헤더/바디 생성 (해외 시장가 주문은 current_price 필요)"""
+        headers = self.order_header_templates[exchange][side].copy()
+        headers["authorization"] = f"Bearer {self.access_token}"
+        body = self.order_body_templates[(exchange, order_type)].copy()
+        body["PDNO"] = ticker
+        body["ORD_QTY"] = str(int(amount))
 
         if exchange == "KRX":
-            headers |= (
-                KoreaBuyOrderHeaders(**headers).dict()
-                if side == "buy"
-                else KoreaSellOrderHeaders(**headers).dict()
-            )
-
-            if order_type == "market":
-                body |= KoreaMarketOrderBody(**body, PDNO=ticker, ORD_QTY=amount).dict()
-            elif order_type == "limit":
-                body |= KoreaOrderBody(
-                    **body,
-                    PDNO=ticker,
-                    ORD_DVSN=KoreaOrderType.limit,
-                    ORD_QTY=amount,
-                    ORD_UNPR=price,
-                ).dict()
-        elif exchange in ("NASDAQ", "NYSE", "AMEX"):
-            exchange_code = self.order_exchange_code.get(exchange)
-            
-            # 시장가 주문을 위해 현재가 조회
+            endpoint = Endpoints.korea_order.value
+            if order_type == "limit":
+                body["ORD_UNPR"] = str(price)
+        else:
+            endpoint = Endpoints.usa_order.value
             if order_type == "market":
-                current_price = self.fetch_current_price(exchange, ticker)
-                if current_price is None:
-                    log_message(f"Failed to fetch current price for {ticker}, order cancelled.")
-                    return None # 현재가 조회가 안되면 주문 불가
-                
                 # 시장가 주문 시, 지정가 주문으로 변환 (매수: 5% 상향, 매도: 5% 하향)
                 price_multiplier = 1.05 if side == "buy" else 0.95
                 order_price = round(current_price * price_multiplier, 2)
@@ -398,25 +514,66 @@ class ImprovedKoreaInvestment:
                 if order_price < 0.01: order_price = 0.01
             else: # 지정가 주문
                 order_price = float(price)
+            body["OVRS_ORD_UNPR"] = f"{order_price:.2f}"
+        return endpoint, headers, body
+
+    def _check_order(self, exchange: str, order_type: str, side: str, amount, price) -> Tuple[int, int]:
+        """validate_arguments 대신 주문마다 필요한 최소한의 확인만 수행"""
+        if exchange not in self.order_header_templates:
+            raise ValueError(f"지원하지 않는 거래소입니다: {exchange}")
+        if order_type not in ("limit", "market"):
+            raise ValueError(f"지원하지 않는 주문 유형입니다: {order_type}")
+        if side not in ("buy", "sell"):
+            raise ValueError(f"지원하지 않는 주문 방향입니다: {side}")
+        amount = int(amount)
+        if amount <= 0:
+            raise ValueError(f"주문 수량이 올바르지 않습니다: {amount}")
+        return amount, int(price)
 
-            headers |= (
-                UsaBuyOrderHeaders(**headers).dict()
-                if side == "buy"
-                else UsaSellOrderHeaders(**headers).dict()
-            )
-
-            # 모든 해외주문은 지정가(UsaOrderType.limit)로 처리
-            body |= UsaOrderBody(
-                **body,
-                PDNO=ticker,
-                ORD_DVSN=UsaOrderType.limit.value,
-                ORD_QTY=amount,
-                OVRS_ORD_UNPR=f"{order_price:.2f}",
-                OVRS_EXCG_CD=exchange_code.value,
-            ).dict()
+    def create_order(
+        self,
+        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        ticker: str,
+        order_type: Literal["limit", "market"],
+        side: Literal["buy", "sell"],
+        amount: int,
+        price: int = 0,
+        mintick=0.01,
+    ):
+        amount, price = self._check_order(exchange, order_type, side, amount, price)
+        current_price = None
+        if exchange != "KRX" and order_type == "market":
+            # 시장가 주문을 위해 현재가 조회
+            current_price = self.fetch_current_price(exchange, ticker)
+            if current_price is None:
+                log_message(f"Failed to fetch current price for {ticker}, order cancelled.")
+                return None # 현재가 조회가 안되면 주문 불가
+
+        endpoint, headers, body = self._build_order(exchange, ticker, order_type, side, amount, price, current_price)
         # 주문 API 호출
         return self._api_call_with_retry("POST", endpoint, headers=headers, data=body)
 
+    async def create_order_async(
+        self,
+        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        ticker: str,
+        order_type: Literal["limit", "market"],
+        side: Literal["buy", "sell"],
+        amount: int,
+        price: int = 0,
+        mintick=0.01,
+    ):
+        amount, price = self._check_order(exchange, order_type, side, amount, price)
+        current_price = None
+        if exchange != "KRX" and order_type == "market":
+            current_price = await self.fetch_current_price_async(exchange, ticker)
+            if current_price is None:
+                log_message(f"Failed to fetch current price for {ticker}, order cancelled.")
+                return None
+
+        endpoint, headers, body = self._build_order(exchange, ticker, order_type, side, amount, price, current_price)
+        return await self._api_call_async("POST", endpoint, headers=headers, data=body)
+
     def create_market_buy_order(
         self,
         exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
@@ -442,64 +599,38 @@ class ImprovedKoreaInvestment:
             return self.create_order(exchange, ticker, "market", "buy", amount, price)
 
     def get_exchange_rate(self) -> Optional[float]:
-        """USD/KRW 환율 조회 (다중 소스 백업)"""
-        # 1순위: 한국수출입은행 API (oapi.koreaexim.go.kr, JSON 형식)
-        try:
-            auth_key = "cW2I7v06dvyLw4QU4UQQEG3PBOpU9b8U"
-            search_date = datetime.now().strftime('%Y%m%d')
-            url = f"https://oapi.koreaexim.go.kr/site/program/financial/exchangeJSON?authkey={auth_key}&searchdate={search_date}&data=AP01"
-            
-            response = httpx.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            for item in data:
-                if item.get('cur_unit') == 'USD':
-                    exchange_rate_str = item.get('tts', item.get('deal_bas_r', '0')).replace(',', '')
-                    if float(exchange_rate_str) > 0:
-                        if self.debugger: self.debugger.logger.info(f"Successfully fetched exchange rate from Eximbank (JSON): {exchange_rate_str}")
-                        return float(exchange_rate_str)
-            raise ValueError("USD exchange rate not found in Eximbank API response")
+        """USD/KRW 환율 조회 (프로세스 공용 환율 캐시 사용, 조회 불가 시 None)"""
+        return fx_rate.get_rate()
 
-        except Exception as e:
-            if self.debugger: self.debugger.logger.warning(f"Eximbank API failed: {e}. Trying Naver Finance.")
-            # 2순위: 네이버 금융 크롤링
-            try:
-                url = "https://finance.naver.com/marketindex/"
-                headers = {'User-Agent': 'Mozilla/5.0'}
-                response = httpx.get(url, headers=headers)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.text, "html.parser")
-                exchange_rate_str = soup.select_one("#exchangeList > li.on > a.head.usd > div > span.value").text.replace(',', '')
-                if self.debugger: self.debugger.logger.info(f"Successfully fetched exchange rate from Naver Finance: {exchange_rate_str}")
-                return float(exchange_rate_str)
-            except Exception as e_naver:
-                if self.debugger: self.debugger.logger.error(f"Naver Finance scraping failed: {e_naver}. Using fallback rate.")
-                # 3순위: 고정 환율
-                return None
+    def get_balance(self, exchange_rate: Optional[float] = None, is_rate_fallback: bool = False) -> Dict:
+        """국내/해외 자산 통합 조회
 
-    def get_balance(self) -> Dict:
-        """국내/해외 자산 통합 조회"""
+        여러 계좌를 한 번에 조회할 때는 환율을 한 번만 받아 exchange_rate로 넘긴다.
+        """
         try:
             if self.debugger: self.debugger.logger.info(f"Starting balance query for KIS{self.kis_number}")
+            timing = {}
+            start = time.perf_counter()
             domestic = self.get_domestic_balance()
-            time.sleep(0.5)
+            timing["domestic"] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
             overseas = self.get_overseas_balance()
-            time.sleep(0.5)
-            
-            is_rate_fallback = False
-            exchange_rate = self.get_exchange_rate()
+            timing["overseas"] = round(time.perf_counter() - start, 3)
+
             if exchange_rate is None:
-                if self.debugger: self.debugger.logger.warning("Live exchange rate unavailable, using fallback rate 1350.0.")
-                exchange_rate = 1350.0
-                is_rate_fallback = True
+                start = time.perf_counter()
+                rate = fx_rate.get()
+                timing["exchange_rate"] = round(time.perf_counter() - start, 3)
+                exchange_rate, is_rate_fallback = rate["rate"], rate["is_fallback"]
+                if is_rate_fallback and self.debugger:
+                    self.debugger.logger.warning(f"Live exchange rate unavailable, using fallback rate {exchange_rate}.")
 
             result = {
                 "domestic_balance": domestic,
                 "overseas_balance": overseas,
                 "exchange_rate": exchange_rate,
-                "is_rate_fallback": is_rate_fallback
+                "is_rate_fallback": is_rate_fallback,
+                "timing": timing
             }
             
             if self.debugger: 
@@ -509,7 +640,39 @@ class ImprovedKoreaInvestment:
             return result
         except Exception as e:
             if self.debugger: self.debugger.logger.error(f"Balance query failed: {e}\n{traceback.format_exc()}")
-            return {"domestic_balance": {}, "overseas_balance": {}, "exchange_rate": 1350.0, "is_rate_fallback": True}
+            return {"domestic_balance": {}, "overseas_balance": {}, "exchange_rate": exchange_rate or 1350.0, "is_rate_fallback": True}
+
+    async def get_balance_async(self, exchange_rate: Optional[float] = None, is_rate_fallback: bool = False) -> Dict:
+        """get_balance의 async 버전 (국내/해외/환율 동시 조회)"""
+        try:
+            timing = {}
+            start = time.perf_counter()
+
+            async def timed(name, coroutine):
+                result = await coroutine
+                timing[name] = round(time.perf_counter() - start, 3)
+                return result
+
+            jobs = [
+                timed("domestic", self.get_domestic_balance_async()),
+                timed("overseas", self.get_overseas_balance_async()),
+            ]
+            if exchange_rate is None:
+                jobs.append(timed("exchange_rate", asyncio.to_thread(fx_rate.get)))
+            domestic, overseas, *rate = await asyncio.gather(*jobs)
+            if rate:
+                exchange_rate, is_rate_fallback = rate[0]["rate"], rate[0]["is_fallback"]
+
+            return {
+                "domestic_balance": domestic,
+                "overseas_balance": overseas,
+                "exchange_rate": exchange_rate,
+                "is_rate_fallback": is_rate_fallback,
+                "timing": timing
+            }
+        except Exception as e:
+            if self.debugger: self.debugger.logger.error(f"Balance query failed: {e}\n{traceback.format_exc()}")
+            return {"domestic_balance": {}, "overseas_balance": {}, "exchange_rate": exchange_rate or 1350.0, "is_rate_fallback": True}
 
     def health_check(self) -> Dict:
         try:
@@ -517,10 +680,10 @@ class ImprovedKoreaInvestment:
             if self.debugger and self.token_expires_at:
                 token_info = self.debugger.debug_token_validity(self.access_token or "", self.token_expires_at.strftime("%Y-%m-%d %H:%M:%S"))
             api_status = "healthy" if self._validate_token() else "error: token validation failed"
-            return {"kis_number": self.kis_number, "timestamp": datetime.now().isoformat(), "token_status": token_info, "api_status": api_status, "recent_api_calls": len([t for t in self.api_call_times if time.time() - t < 60])}
+            return {"kis_number": self.kis_number, "timestamp": datetime.now().isoformat(), "token_status": token_info, "api_status": api_status, "rate_limit": self.rate_limiter.snapshot()}
         except Exception as e:
             return {"kis_number": self.kis_number, "status": "error", "error": str(e)}
 
     def close(self):
-        if hasattr(self, 'session'): self.session.close()
+        # 세션은 모든 계좌가 공유하므로 닫지 않는다 (종료 시 transport.close_clients)
         if self.debugger: self.debugger.logger.info(f"KIS{self.kis_number} session closed")
\ No newline at end of file
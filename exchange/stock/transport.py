@@ -0,0 +1,53 @@
+import importlib.util
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+# 모든 KIS 계좌가 같은 호스트로 요청하므로 커넥션 풀 하나를 공유하고, 계좌별 인증 헤더만 요청마다 얹는다
+KIS_MAX_CONNECTIONS = int(os.getenv("KIS_MAX_CONNECTIONS", "20"))
+# h2 패키지가 설치되어 있을 때만 HTTP/2 사용
+KIS_HTTP2 = (
+    os.getenv("KIS_HTTP2", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+limits = httpx.Limits(
+    max_connections=KIS_MAX_CONNECTIONS,
+    max_keepalive_connections=KIS_MAX_CONNECTIONS,
+    keepalive_expiry=60,
+)
+timeout = httpx.Timeout(30.0)
+
+client: Optional[httpx.Client] = None
+async_client: Optional[httpx.AsyncClient] = None
+lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    global client
+    if client is None:
+        with lock:
+            if client is None:
+                client = httpx.Client(http2=KIS_HTTP2, limits=limits, timeout=timeout)
+    return client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global async_client
+    if async_client is None:
+        with lock:
+            if async_client is None:
+                async_client = httpx.AsyncClient(http2=KIS_HTTP2, limits=limits, timeout=timeout)
+    return async_client
+
+
+async def close_clients():
+    global client, async_client
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+    if client is not None:
+        client.close()
+        client = None
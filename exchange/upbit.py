@@ -1,6 +1,9 @@
 from exchange.pexchange import ccxt, ccxt_async
 from exchange.database import db
 from exchange.model import MarketOrder
+from exchange.market_cache import load_markets
+from exchange.micro_cache import MicroCache
+from exchange.marketdata import market_data
 import exchange.error as error
 
 
@@ -12,7 +15,8 @@ class Upbit:
                 "secret": secret,
             }
         )
-        self.client.load_markets()
+        load_markets(self.client)
+        self.cache = MicroCache()
         self.order_info: MarketOrder = None
 
     def init_info(self, order_info: MarketOrder):
@@ -28,13 +32,17 @@ class Upbit:
     # async def aclose(self):
     #     await self.spot_async.close()
     def get_ticker(self, symbol: str):
-        return self.client.fetch_ticker(symbol)
+        return self.cache.fetch_ticker(self.client, symbol)
 
     def get_price(self, symbol: str):
+        # 웹소켓 시세가 신선하면 네트워크 왕복 없이 사용
+        price = market_data.last_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_balance(self, base: str) -> float:
-        free_balance_by_base = (self.client.fetch_free_balance()).get(base)
+        free_balance_by_base = self.cache.fetch_balance(self.client)["free"].get(base)
         if free_balance_by_base is None or free_balance_by_base == 0:
             raise error.FreeAmountNoneError()
         else:
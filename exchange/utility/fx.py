@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from bs4 import BeautifulSoup
+from loguru import logger
+
+# 한국수출입은행 환율 API 인증키
+EXIM_AUTH_KEY = os.getenv("EXIM_AUTH_KEY", "cW2I7v06dvyLw4QU4UQQEG3PBOpU9b8U")
+# 이 시간 동안은 캐시된 환율을 그대로 사용
+FX_RATE_TTL_SECONDS = float(os.getenv("FX_RATE_TTL_SECONDS", "600"))
+# 이 시간까지는 오래된 환율을 먼저 돌려주고 백그라운드에서 갱신
+FX_RATE_MAX_STALE_SECONDS = float(os.getenv("FX_RATE_MAX_STALE_SECONDS", "86400"))
+FALLBACK_RATE = 1350.0
+# 모든 소스가 실패한 뒤 다시 조회하기까지 기다리는 시간
+FX_RATE_RETRY_SECONDS = 60
+
+
+class ExchangeRateService:
+    """프로세스 전체가 공유하는 USD/KRW 환율 (TTL 캐시 + stale-while-revalidate)"""
+
+    def __init__(self, ttl: float = FX_RATE_TTL_SECONDS, max_stale: float = FX_RATE_MAX_STALE_SECONDS):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.rate: Optional[float] = None
+        self.source: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self.failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.session = httpx.Client(timeout=10.0, headers={"User-Agent": "Mozilla/5.0"})
+
+    def fetch_eximbank(self) -> float:
+        search_date = datetime.now().strftime('%Y%m%d')
+        response = self.session.get(
+            "https://oapi.koreaexim.go.kr/site/program/financial/exchangeJSON",
+            params={"authkey": EXIM_AUTH_KEY, "searchdate": search_date, "data": "AP01"},
+        )
+        response.raise_for_status()
+        for item in response.json():
+            if item.get('cur_unit') == 'USD':
+                rate = float(item.get('tts', item.get('deal_bas_r', '0')).replace(',', ''))
+                if rate > 0:
+                    return rate
+        raise ValueError("USD exchange rate not found in Eximbank API response")
+
+    def fetch_naver(self) -> float:
+        response = self.session.get("https://finance.naver.com/marketindex/")
+        response.raise_for_status()
+        soup = BeautifulSoup(response.text, "html.parser")
+        return float(soup.select_one("#exchangeList > li.on > a.head.usd > div > span.value").text.replace(',', ''))
+
+    def refresh(self) -> bool:
+        """1순위 한국수출입은행, 2순위 네이버 금융. 실패하면 기존 값 유지"""
+        for source, fetch in (("eximbank", self.fetch_eximbank), ("naver", self.fetch_naver)):
+            try:
+                rate = fetch()
+            except Exception as e:
+                logger.warning(f"환율 조회 실패 ({source}): {e}")
+                continue
+            self.rate, self.source, self.fetched_at = rate, source, time.time()
+            return True
+        self.failed_at = time.time()
+        return False
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def age(self) -> Optional[float]:
+        if self.fetched_at is None:
+            return None
+        return time.time() - self.fetched_at
+
+    def get(self) -> dict:
+        """환율과 출처/나이를 반환. 값이 없으면 FALLBACK_RATE를 is_fallback=True로 반환"""
+        age = self.age()
+        if age is None or age > self.max_stale:
+            # 쓸 수 있는 값이 없으면 한 번만 동기로 조회하고 나머지는 그 결과를 기다림
+            with self._lock:
+                age = self.age()
+                recently_failed = self.failed_at is not None and time.time() - self.failed_at < FX_RATE_RETRY_SECONDS
+                if (age is None or age > self.max_stale) and not recently_failed:
+                    self.refresh()
+        elif age > self.ttl:
+            self._refresh_in_background()
+
+        age = self.age()
+        if self.rate is None or age > self.max_stale:
+            return {"rate": FALLBACK_RATE, "source": "fallback", "age_seconds": None, "is_fallback": True}
+        return {"rate": self.rate, "source": self.source, "age_seconds": round(age, 1), "is_fallback": False}
+
+    def get_rate(self) -> Optional[float]:
+        snapshot = self.get()
+        return None if snapshot["is_fallback"] else snapshot["rate"]
+
+
+fx_rate = ExchangeRateService()
@@ -0,0 +1,90 @@
+"""웹소켓 시세 리플레이 서버
+
+녹화한 메시지를 거래소 대신 흘려보내 시세 미러(exchange/marketdata.py)를 네트워크 없이 시험한다.
+파일은 한 줄에 하나씩 {"t": 시작 후 경과 초, "message": 원본 메시지} 형식의 jsonl.
+
+    python -m exchange.utility.replay serve binance_spot.jsonl --port 8765
+    BINANCE_SPOT_WS_URL=ws://127.0.0.1:8765 ENABLE_MARKET_DATA=true MARKET_DATA_SYMBOLS=BINANCE:BTC/USDT ...
+"""
+import asyncio
+import time
+from pathlib import Path
+
+import fire
+import orjson
+
+
+def load_records(path: str) -> list[dict]:
+    return [
+        orjson.loads(line)
+        for line in Path(path).read_bytes().splitlines()
+        if line.strip()
+    ]
+
+
+async def replay(websocket, records: list[dict], speed: float, loop_forever: bool):
+    while True:
+        start = time.monotonic()
+        for record in records:
+            wait = record.get("t", 0) / speed - (time.monotonic() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await websocket.send(orjson.dumps(record["message"]).decode())
+        if not loop_forever:
+            return
+
+
+async def record(url: str, path: str, seconds: float = 60, subscribe: str = None):
+    """실제 스트림을 seconds 동안 받아 리플레이용 jsonl로 저장"""
+    import websockets
+
+    start = time.monotonic()
+    with open(path, "wb") as file:
+        async with websockets.connect(url) as ws:
+            if subscribe is not None:
+                # fire가 JSON 문자열을 리스트로 바꿔 넘길 수 있다
+                await ws.send(subscribe if isinstance(subscribe, str) else orjson.dumps(subscribe).decode())
+            while (elapsed := time.monotonic() - start) < seconds:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), seconds - elapsed)
+                except asyncio.TimeoutError:
+                    break
+                file.write(
+                    orjson.dumps({"t": round(time.monotonic() - start, 3), "message": orjson.loads(message)})
+                    + b"\n"
+                )
+
+
+async def serve_async(path: str, host: str = "127.0.0.1", port: int = 8765,
+                      speed: float = 1.0, loop_forever: bool = True):
+    import websockets
+
+    records = load_records(path)
+
+    async def handler(websocket, *args):
+        # 업비트처럼 접속 후 구독 메시지를 보내는 클라이언트도 있으므로 수신은 읽고 버린다
+        async def drain():
+            async for _ in websocket:
+                pass
+
+        drainer = asyncio.create_task(drain())
+        try:
+            await replay(websocket, records, speed, loop_forever)
+        finally:
+            drainer.cancel()
+
+    async with websockets.serve(handler, host, port):
+        print(f"replay {path} ({len(records)} messages) on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def serve(path: str, host: str = "127.0.0.1", port: int = 8765, speed: float = 1.0, loop_forever: bool = True):
+    asyncio.run(serve_async(path, host, port, speed, loop_forever))
+
+
+def record_cli(url: str, path: str, seconds: float = 60, subscribe: str = None):
+    asyncio.run(record(url, path, seconds, subscribe))
+
+
+if __name__ == "__main__":
+    fire.Fire({"serve": serve, "record": record_cli})
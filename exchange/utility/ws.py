@@ -1,70 +1,212 @@
-# from toolbox import Client
-
-from client import Client
-import websocket
-import _thread
+import asyncio
+import os
 import time
-import rel
-import json
-from pprint import pprint
+from collections import deque
+from typing import Optional
+
+import orjson
+from loguru import logger
+
+# 바이낸스 USDT-M 선물 유저 데이터 스트림 사용 여부
+ENABLE_BINANCE_USER_STREAM = os.getenv("ENABLE_BINANCE_USER_STREAM", "false").lower() == "true"
+BINANCE_USER_STREAM_WS_URL = os.getenv("BINANCE_USER_STREAM_WS_URL", "wss://fstream.binance.com/ws")
+
+# listenKey는 60분 동안 갱신이 없으면 만료되므로 30분마다 연장
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60
+# 주문 직후 ACCOUNT_UPDATE가 오기 전까지는 상태를 믿지 않고 REST로 조회하는 최대 시간
+PENDING_ORDER_SECONDS = 2
+# 바이낸스는 24시간마다 연결을 끊으므로 그 전에 스스로 다시 연결
+RECONNECT_INTERVAL_SECONDS = 23 * 3600
+RECONNECT_DELAY_SECONDS = 1
+RECONNECT_DELAY_MAX_SECONDS = 30
+
 
+class BinanceUserStream:
+    """바이낸스 선물 유저 데이터 스트림을 받아 포지션/잔고/주문 상태를 메모리에 유지
 
-class Websocket:
+    연결 직후 REST로 포지션/잔고를 한 번 받아 기준을 맞춘 뒤(ready) 이벤트로만 갱신한다.
+    연결이 끊겨 있거나 기준을 맞추기 전에는 ready가 False이고, 읽는 쪽은 REST로 대체한다.
+    """
 
     def __init__(self):
-        self.client = Client()
-        self.binance = self.client.get_binance()
-        self.listen_key = self.binance.get_listen_key()
-        self.ws_url = f"wss://fstream.binance.com/ws/{self.listen_key}"
-
-    def on_message(self, ws, message):
-
-        datas: dict = json.loads(message)
-        event = datas.get("e")
-        event_time = datas.get("E")
-        transaction_time = datas.get("T")
-        cross_wallt_balance = datas.get("cw")
-        order = datas.get("o")
-
-        if event == "listenKeyExpired":
-            print("Listen key expired")
-            self.listen_key = self.binance.get_listen_key()
-        elif event == "ORDER_TRADE_UPDATE":
-            order_type = order.get("ot")  # TAKE_PROFIT_MARKET, STOP_MARKET
-            order_status = order.get("X")  # 새로운 주문은 NEW
-            if order_type in ("TAKE_PROFIT_MARKET", "STOP_MARKET"):
-                order_id = order.get("i")  # 주문 ID
-                client_order_id = order.get("c")  # 주문 고유 ID
-                order_symbol = order.get("s")  # 주문 심볼
-                order_price = order.get("sp")  # 스탑 가격
-                order_side = order.get("S")  # 주문 종류
-                order_qty = order.get("q")  # 주문 수량
-
-                print(f"{order_symbol=}, {order_price=}, {order_type=}, {order_status=}, {order_id=}, {client_order_id=}")
-
-            print("=====끝=====")
-
-    def on_error(self, ws, error):
-        print(error)
-
-    def on_close(self, ws, close_status_code, close_msg):
-        print("### closed ###")
-
-    def on_open(self, ws):
-        print("Opened connection")
-
-    def start(self):
-        ws = websocket.WebSocketApp(self.ws_url,
-                                    on_open=self.on_open,
-                                    on_message=self.on_message,
-                                    on_error=self.on_error,
-                                    on_close=self.on_close)
-
-        ws.run_forever(dispatcher=rel, reconnect=5)  # Set dispatcher to automatic reconnection, 5 second reconnect delay if connection closed unexpectedly
-        rel.signal(2, rel.abort)  # Keyboard Interrupt
-        rel.dispatch()
-
-
-if __name__ == "__main__":
-    ws = Websocket()
-    ws.start()
+        self.listen_key: Optional[str] = None
+        self.ready = False
+        # (심볼 id, positionSide) -> {"amount", "entry_price"}
+        self.positions: dict[tuple[str, str], dict] = {}
+        # 자산 -> {"wallet", "cross_wallet"}
+        self.balances: dict[str, dict] = {}
+        # 주문 id -> 마지막 ORDER_TRADE_UPDATE
+        self.orders: dict[int, dict] = {}
+        self.fills = deque(maxlen=1000)
+        self.last_event_at: Optional[float] = None
+        self.pending_since: Optional[float] = None
+        # 주문을 보낸 시각과 REST 스냅샷 요청 시각 (거래소 서버 시간 기준 ms, 이벤트의 E와 비교)
+        self.pending_since_ms = 0
+        self.synced_at_ms = 0
+        self.reconnects = 0
+
+    @property
+    def client(self):
+        from exchange.pexchange import get_async_client
+
+        return get_async_client("BINANCE")
+
+    async def new_listen_key(self) -> str:
+        response = await self.client.fapiPrivatePostListenKey()
+        return response["listenKey"]
+
+    async def keepalive(self):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE_SECONDS)
+            try:
+                await self.client.fapiPrivatePutListenKey({"listenKey": self.listen_key})
+            except Exception as e:
+                logger.warning(f"listenKey 연장 실패: {str(e)}")
+
+    def server_time_ms(self) -> int:
+        return int(time.time() * 1000) - self.client.options.get("timeDifference", 0)
+
+    async def sync_from_rest(self):
+        """놓친 이벤트가 있을 수 있으므로 (재)연결 때마다 REST 스냅샷으로 상태를 맞춘다"""
+        # 요청 전에 일어난 이벤트는 스냅샷에 이미 들어 있으므로 연결 직후 밀려 있던 이벤트 중 그 이전 것은 버린다
+        self.synced_at_ms = self.server_time_ms()
+        position_risk, balances = await asyncio.gather(
+            self.client.fapiPrivateV2GetPositionRisk(),
+            self.client.fapiPrivateV2GetBalance(),
+        )
+        self.positions = {
+            (position["symbol"], position["positionSide"]): {
+                "amount": float(position["positionAmt"]),
+                "entry_price": float(position["entryPrice"]),
+            }
+            for position in position_risk
+            if float(position["positionAmt"]) != 0
+        }
+        self.balances = {
+            balance["asset"]: {
+                "wallet": float(balance["balance"]),
+                "cross_wallet": float(balance["crossWalletBalance"]),
+            }
+            for balance in balances
+        }
+
+    def handle(self, event: dict):
+        self.last_event_at = time.time()
+        event_type = event.get("e")
+        if event_type == "ACCOUNT_UPDATE":
+            if event.get("E", 0) < self.synced_at_ms:
+                return
+            account = event["a"]
+            # 펀딩비/입출금 등이 아니라 주문 이후에 온 체결 반영일 때만 대기 상태를 푼다
+            if account.get("m") == "ORDER" and event.get("E", 0) >= self.pending_since_ms:
+                self.pending_since = None
+            for balance in account.get("B", []):
+                self.balances[balance["a"]] = {
+                    "wallet": float(balance["wb"]),
+                    "cross_wallet": float(balance["cw"]),
+                }
+            for position in account.get("P", []):
+                key = (position["s"], position["ps"])
+                amount = float(position["pa"])
+                if amount == 0:
+                    self.positions.pop(key, None)
+                else:
+                    self.positions[key] = {"amount": amount, "entry_price": float(position["ep"])}
+        elif event_type == "ORDER_TRADE_UPDATE":
+            order = event["o"]
+            self.orders[order["i"]] = order
+            if len(self.orders) > 1000:
+                self.orders.pop(next(iter(self.orders)))
+            if order.get("x") == "TRADE":
+                self.fills.append(
+                    {
+                        "symbol": order["s"],
+                        "order_id": order["i"],
+                        "client_order_id": order["c"],
+                        "side": order["S"],
+                        "position_side": order["ps"],
+                        "quantity": float(order["l"]),
+                        "price": float(order["L"]),
+                        "status": order["X"],
+                        "time": order["T"],
+                    }
+                )
+        elif event_type == "listenKeyExpired":
+            raise ConnectionResetError("listenKey expired")
+
+    def mark_pending(self):
+        """주문을 보냈으니 체결 결과(ACCOUNT_UPDATE)가 올 때까지 포지션을 믿지 않는다"""
+        self.pending_since = time.monotonic()
+        self.pending_since_ms = self.server_time_ms()
+
+    def get_positions(self, symbol_id: str) -> Optional[list[dict]]:
+        """fapi 원본 포지션과 같은 모양으로 반환. 상태를 믿을 수 없으면 None"""
+        if not self.ready:
+            return None
+        if self.pending_since is not None and time.monotonic() - self.pending_since < PENDING_ORDER_SECONDS:
+            return None
+        return [
+            {"symbol": symbol, "positionSide": position_side, "positionAmt": str(position["amount"])}
+            # 주문 스레드에서 읽는 동안 이벤트 루프가 갱신할 수 있으므로 한 번에 복사해서 순회
+            for (symbol, position_side), position in tuple(self.positions.items())
+            if symbol == symbol_id
+        ]
+
+    def get_order(self, order_id: int) -> Optional[dict]:
+        return self.orders.get(order_id)
+
+    async def connect_once(self):
+        import websockets
+
+        self.listen_key = await self.new_listen_key()
+        keepalive = asyncio.create_task(self.keepalive())
+        try:
+            async with websockets.connect(f"{BINANCE_USER_STREAM_WS_URL}/{self.listen_key}") as ws:
+                await self.sync_from_rest()
+                self.ready = True
+                logger.info("바이낸스 유저 데이터 스트림 연결")
+                connected_at = time.monotonic()
+                async for message in ws:
+                    self.handle(orjson.loads(message))
+                    if time.monotonic() - connected_at > RECONNECT_INTERVAL_SECONDS:
+                        break
+        finally:
+            self.ready = False
+            keepalive.cancel()
+
+    async def run(self):
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            started_at = time.monotonic()
+            try:
+                await self.connect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"바이낸스 유저 데이터 스트림 끊김, {delay}초 후 재연결: {str(e)}")
+            if time.monotonic() - started_at > RECONNECT_DELAY_MAX_SECONDS:
+                delay = RECONNECT_DELAY_SECONDS
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX_SECONDS)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "positions": len(self.positions),
+            "fills": len(self.fills),
+            "reconnects": self.reconnects,
+            "last_event_age_seconds": round(time.time() - self.last_event_at, 1)
+            if self.last_event_at
+            else None,
+        }
+
+
+user_stream: Optional[BinanceUserStream] = None
+
+
+def start_user_stream() -> asyncio.Task:
+    """이벤트 루프 안에서 호출. 이후 Binance 어댑터가 user_stream의 포지션을 읽는다"""
+    global user_stream
+    user_stream = BinanceUserStream()
+    return asyncio.create_task(user_stream.run())
@@ -9,6 +9,7 @@ import httpx
 from datetime import datetime
 from exchange.stock.kis import KoreaInvestment
 from exchange.model import MarketOrder, PriceRequest, HedgeData, OrderRequest
+from exchange.model.schemas import parse_quote
 from exchange.utility import (
     settings,
     log_order_message,
@@ -23,11 +24,35 @@ from exchange.utility import (
 )
 import traceback
 from exchange import get_exchange, log_message, db, settings, get_bot, pocket
+from exchange.pexchange import (
+    get_async_client,
+    close_async_clients,
+    get_bot_key,
+    get_order_lock,
+    warm_up,
+    run_periodic_market_refresh,
+    rate_limit_metrics,
+    micro_cache_metrics,
+    check_kis_accounts,
+    get_kis_status,
+    run_token_refresh_scheduler,
+)
+from exchange.idempotency import idempotency
+from exchange.hedge_ledger import hedge_ledger
+from exchange.hedge_engine import hedge_engine
+from exchange.premium import ENABLE_PREMIUM_MONITOR, premium_monitor
+from exchange.pocket import ENABLE_POCKETBASE_OUTBOX, async_pb
+from exchange.journal import ENABLE_ORDER_JOURNAL, journal
+from exchange.marketdata import ENABLE_MARKET_DATA, market_data, start_market_data
+from exchange.utility import ws
+from exchange.stock import transport as kis_transport
 import ipaddress
 import os
 import sys
 from devtools import debug
 import asyncio
+import time
+import orjson
 
 VERSION = "0.1.3"
 app = FastAPI(default_response_class=ORJSONResponse)
@@ -36,6 +61,21 @@ app = FastAPI(default_response_class=ORJSONResponse)
 ENABLE_ASSET_MONITOR = os.getenv("ENABLE_ASSET_MONITOR", "false").lower() == "true"
 ASSET_REPORT_INTERVAL_HOURS = int(os.getenv("ASSET_REPORT_INTERVAL_HOURS", "6"))
 
+# 서버 시작 시 거래소 마켓 정보를 미리 받아둘지 여부
+ENABLE_WARM_UP = os.getenv("ENABLE_WARM_UP", "false").lower() == "true"
+# 마켓 정보 갱신 간격 (0이면 갱신하지 않음)
+MARKET_REFRESH_INTERVAL_HOURS = float(os.getenv("MARKET_REFRESH_INTERVAL_HOURS", "6"))
+
+# 서버 시작 시 KIS 계좌 토큰을 백그라운드에서 미리 확보할지 여부 (웹훅 수신은 막지 않음)
+ENABLE_KIS_WARM_UP = os.getenv("ENABLE_KIS_WARM_UP", "false").lower() == "true"
+KIS_WARM_UP_CONCURRENCY = int(os.getenv("KIS_WARM_UP_CONCURRENCY", "5"))
+# KIS 토큰 사전 갱신 확인 간격(분, 0이면 사용 안 함)과 만료 몇 분 전부터 갱신할지
+KIS_TOKEN_REFRESH_INTERVAL_MINUTES = float(os.getenv("KIS_TOKEN_REFRESH_INTERVAL_MINUTES", "10"))
+KIS_TOKEN_REFRESH_BEFORE_MINUTES = float(os.getenv("KIS_TOKEN_REFRESH_BEFORE_MINUTES", "60"))
+
+# 웹소켓 스트림 등 상시 실행 태스크 (종료 시 취소)
+service_tasks = []
+
 
 def get_error(e):
     tb = traceback.extract_tb(e.__traceback__)
@@ -54,8 +94,76 @@ def get_error(e):
     return error_msg
 
 
+async def warm_up_kis():
+    start = time.perf_counter()
+    results = await asyncio.to_thread(check_kis_accounts, None, KIS_WARM_UP_CONCURRENCY)
+    ready = [key for key, result in results.items() if result["status"] == "ready"]
+    lines = [
+        f"{key}: {result['status']}"
+        for key, result in results.items()
+        if result["status"] != "ready"
+    ]
+    log_message(
+        f"KIS 계좌 준비 완료 ({time.perf_counter() - start:.2f}초) - {len(ready)}/{len(results)}개 준비\n"
+        + "\n".join(lines)
+    )
+
+
+async def load_hedge_ledger():
+    """헷지 원장을 미리 읽어둔다 (실패하면 첫 /hedge 요청 때 다시 읽음)"""
+    try:
+        await hedge_ledger.load()
+    except Exception:
+        log_error_message(traceback.format_exc(), "헷지 원장 로드")
+
+
 @app.on_event("startup")
 async def startup():
+    if ENABLE_WARM_UP:
+        start = time.perf_counter()
+        results = await asyncio.to_thread(warm_up)
+        lines = [
+            f"{exchange_name}: {result['seconds']}초 {result['status']}"
+            for exchange_name, result in results.items()
+        ]
+        log_message(
+            f"거래소 워밍업 완료 ({time.perf_counter() - start:.2f}초)\n" + "\n".join(lines)
+        )
+
+    if ENABLE_ORDER_JOURNAL:
+        await asyncio.to_thread(journal.start)
+
+    if ENABLE_KIS_WARM_UP:
+        service_tasks.append(asyncio.create_task(warm_up_kis()))
+
+    service_tasks.append(hedge_ledger.start())
+    service_tasks.append(asyncio.create_task(load_hedge_ledger()))
+    if ENABLE_POCKETBASE_OUTBOX:
+        service_tasks.append(asyncio.create_task(async_pb.run_outbox_flusher()))
+
+    if MARKET_REFRESH_INTERVAL_HOURS > 0:
+        service_tasks.append(asyncio.create_task(run_periodic_market_refresh(MARKET_REFRESH_INTERVAL_HOURS)))
+
+    if KIS_TOKEN_REFRESH_INTERVAL_MINUTES > 0:
+        service_tasks.append(
+            asyncio.create_task(
+                run_token_refresh_scheduler(KIS_TOKEN_REFRESH_INTERVAL_MINUTES, KIS_TOKEN_REFRESH_BEFORE_MINUTES)
+            )
+        )
+
+    if ENABLE_MARKET_DATA:
+        streams = start_market_data()
+        service_tasks.extend(streams)
+        log_message(f"웹소켓 시세 미러 시작 - 스트림 {len(streams)}개")
+
+    if ENABLE_PREMIUM_MONITOR:
+        service_tasks.append(asyncio.create_task(premium_monitor.run()))
+        log_message(f"김프 계산 시작 - {', '.join(premium_monitor.windows)}")
+
+    if ws.ENABLE_BINANCE_USER_STREAM and settings.BINANCE_KEY:
+        service_tasks.append(ws.start_user_stream())
+        log_message("바이낸스 유저 데이터 스트림 시작")
+
     log_message(f"POABOT 실행 완료! - 버전:{VERSION}")
     
     # 자산 모니터링 시작
@@ -70,6 +178,12 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in service_tasks + list(premium_monitor.hedge_tasks):
+        task.cancel()
+    await close_async_clients()
+    await kis_transport.close_clients()
+    await async_pb.close()
+    await asyncio.to_thread(journal.close)
     db.close()
 
 
@@ -137,14 +251,38 @@ async def welcome():
     return "hi!!"
 
 
+@app.get("/metrics")
+async def metrics():
+    """거래소 호출 제한 대기열 / 초단기 캐시 / 웹소켓 시세 지표"""
+    return {
+        "rate_limit": rate_limit_metrics(),
+        "micro_cache": micro_cache_metrics(),
+        "market_data": market_data.snapshot(),
+        "binance_user_stream": ws.user_stream.snapshot() if ws.user_stream else None,
+        "idempotency": idempotency.snapshot(),
+        "order_journal": journal.snapshot(),
+        "hedge_ledger": hedge_ledger.snapshot(),
+        "hedge_engine": hedge_engine.snapshot(),
+        "premium": premium_monitor.snapshot(),
+        "pocketbase": async_pb.snapshot(),
+    }
+
+
+@app.get("/kis/status")
+async def kis_status():
+    """KIS 계좌별 준비 상태"""
+    return get_kis_status()
+
+
 @app.get("/assets")
 async def get_assets():
     """자산 현황 즉시 조회 API"""
     from asset_monitor import AssetMonitor
     monitor = AssetMonitor()
     
-    crypto_assets = await monitor.get_crypto_assets()
-    stock_assets = await monitor.get_stock_assets()
+    crypto_assets, stock_assets = await asyncio.gather(
+        monitor.get_crypto_assets(), monitor.get_stock_assets()
+    )
     
     return {
         "crypto": crypto_assets,
@@ -169,6 +307,18 @@ async def get_balance(exchange_name: str):
         )
 
 
+@app.get("/premium/{base}")
+async def get_premium(base: str):
+    """코인의 현재 김프(%)와 최근 구간 분위수 조회 API"""
+    try:
+        return await premium_monitor.get(base)
+    except Exception as e:
+        return ORJSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": f"{base} 김프 계산 실패: {str(e)}"},
+        )
+
+
 @app.post("/assets/report")
 async def send_asset_report():
     """자산 현황 리포트 즉시 전송"""
@@ -181,11 +331,20 @@ async def send_asset_report():
 
 @app.post("/price")
 async def price(price_req: PriceRequest, background_tasks: BackgroundTasks):
-    exchange = get_exchange(price_req.exchange)
-    price = exchange.dict()[price_req.exchange].fetch_price(
-        price_req.base, price_req.quote
-    )
-    return price
+    exchange_name = price_req.exchange
+    if price_req.is_crypto and exchange_name != "BITHUMB":
+        quote = parse_quote(price_req.quote)
+        symbol = f"{price_req.base}/{quote}"
+        if price_req.is_futures:
+            symbol += f":{price_req.base}" if quote == "USD" else f":{quote}"
+        ticker = await get_async_client(exchange_name).fetch_ticker(symbol)
+        return ticker["last"]
+    elif price_req.is_crypto:
+        bot = await asyncio.to_thread(get_bot, exchange_name)
+        return await asyncio.to_thread(bot.fetch_price, price_req.base, price_req.quote)
+    else:
+        bot = await asyncio.to_thread(get_bot, exchange_name, 1)
+        return await bot.fetch_current_price_async(exchange_name, price_req.base)
 
 
 def log(exchange_name, result, order_info):
@@ -198,44 +357,117 @@ def log_error(error_message, order_info):
     log_alert_message(order_info, "실패")
 
 
+def log_duplicate(order_info):
+    log_message(
+        f"중복 주문 무시: {order_info.exchange} {order_info.base} {order_info.side} {order_info.amount}"
+        + (f" (client_order_id: {order_info.client_order_id})" if order_info.client_order_id else "")
+    )
+
+
+def execute_order(bot, order_info: MarketOrder):
+    """동기 거래소 어댑터로 주문 실행 (워커 스레드에서 호출)"""
+    bot.init_info(order_info)
+
+    if bot.order_info.is_crypto:
+        if bot.order_info.is_entry:
+            return bot.market_entry(bot.order_info)
+        elif bot.order_info.is_close:
+            return bot.market_close(bot.order_info)
+        elif bot.order_info.is_buy:
+            return bot.market_buy(bot.order_info)
+        elif bot.order_info.is_sell:
+            return bot.market_sell(bot.order_info)
+    elif bot.order_info.is_stock:
+        return bot.create_order(
+            bot.order_info.exchange,
+            bot.order_info.base,
+            order_info.type.lower(),
+            order_info.side.lower(),
+            order_info.amount,
+        )
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def get_raw_order(request: Request):
+    """주문 기록용 원본 요청 (FastAPI가 이미 읽어둔 body를 다시 사용)"""
+    try:
+        return orjson.loads(await request.body())
+    except Exception:
+        return None
+
+
+async def run_order(order_info: MarketOrder, latency: dict | None = None):
+    """이벤트 루프를 막지 않도록 주문을 스레드에서 실행
+
+    같은 봇을 쓰는 주문만 순서대로 처리하고, 다른 거래소/계좌의 주문은 병렬로 처리한다.
+    latency를 넘기면 잠금 대기/봇 조회/주문 실행 시간(ms)을 채운다.
+    """
+    latency = {} if latency is None else latency
+    exchange_name = order_info.exchange
+    kis_number = order_info.kis_number
+    start = time.perf_counter()
+    async with get_order_lock(get_bot_key(exchange_name, kis_number)):
+        latency["lock_wait_ms"] = elapsed_ms(start)
+        start = time.perf_counter()
+        bot = await asyncio.to_thread(get_bot, exchange_name, kis_number)
+        latency["bot_ms"] = elapsed_ms(start)
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(execute_order, bot, order_info)
+        finally:
+            latency["execute_ms"] = elapsed_ms(start)
+
+
 @app.post("/order")
 @app.post("/")
-async def order(order_info: MarketOrder, background_tasks: BackgroundTasks):
+async def order(order_info: MarketOrder, background_tasks: BackgroundTasks, request: Request):
+    start = time.perf_counter()
     order_result = None
+    latency = {}
+    raw_order = await get_raw_order(request)
+    idempotency_key, ttl = idempotency.key(order_info)
+    duplicate = idempotency.begin(idempotency_key, ttl)
+    if duplicate is None:
+        duplicate = await idempotency.recall(idempotency_key)
+    if duplicate is not None:
+        background_tasks.add_task(log_duplicate, order_info)
+        background_tasks.add_task(
+            journal.record, order_info, "duplicate", duplicate, request=raw_order
+        )
+        return {"result": "duplicate", "order": duplicate}
     try:
         exchange_name = order_info.exchange
-        bot = get_bot(exchange_name, order_info.kis_number)
-        bot.init_info(order_info)
-
-        if bot.order_info.is_crypto:
-            if bot.order_info.is_entry:
-                order_result = bot.market_entry(bot.order_info)
-            elif bot.order_info.is_close:
-                order_result = bot.market_close(bot.order_info)
-            elif bot.order_info.is_buy:
-                order_result = bot.market_buy(bot.order_info)
-            elif bot.order_info.is_sell:
-                order_result = bot.market_sell(bot.order_info)
-            background_tasks.add_task(log, exchange_name, order_result, order_info)
-        elif bot.order_info.is_stock:
-            order_result = bot.create_order(
-                bot.order_info.exchange,
-                bot.order_info.base,
-                order_info.type.lower(),
-                order_info.side.lower(),
-                order_info.amount,
-            )
-            background_tasks.add_task(log, exchange_name, order_result, order_info)
+        order_result = await run_order(order_info, latency)
+        idempotency.complete(idempotency_key, order_result)
+        background_tasks.add_task(idempotency.persist)
+        background_tasks.add_task(log, exchange_name, order_result, order_info)
+        background_tasks.add_task(
+            journal.record, order_info, "success", order_result,
+            latency=latency | {"total_ms": elapsed_ms(start)}, request=raw_order,
+        )
 
     except TypeError as e:
+        idempotency.release(idempotency_key)
         error_msg = get_error(e)
         background_tasks.add_task(
             log_order_error_message, "\n".join(error_msg), order_info
         )
+        background_tasks.add_task(
+            journal.record, order_info, "error", error=str(e),
+            latency=latency | {"total_ms": elapsed_ms(start)}, request=raw_order,
+        )
 
     except Exception as e:
+        idempotency.release(idempotency_key)
         error_msg = get_error(e)
         background_tasks.add_task(log_error, "\n".join(error_msg), order_info)
+        background_tasks.add_task(
+            journal.record, order_info, "error", error=getattr(e, "detail", None) or str(e),
+            latency=latency | {"total_ms": elapsed_ms(start)}, request=raw_order,
+        )
 
     else:
         return {"result": "success"}
@@ -244,114 +476,150 @@ async def order(order_info: MarketOrder, background_tasks: BackgroundTasks):
         pass
 
 
-def get_hedge_records(base):
-    records = pocket.get_full_list("kimp", query_params={"filter": f'base = "{base}"'})
-    binance_amount = 0.0
-    binance_records_id = []
-    upbit_amount = 0.0
-    upbit_records_id = []
-    for record in records:
-        if record.exchange == "BINANCE":
-            binance_amount += record.amount
-            binance_records_id.append(record.id)
-        elif record.exchange == "UPBIT":
-            upbit_amount += record.amount
-            upbit_records_id.append(record.id)
+async def run_order_group(orders: list[tuple[int, MarketOrder]]) -> list[tuple[int, object, dict]]:
+    """같은 봇(거래소/KIS 계좌)으로 가는 주문을 잠금 한 번 안에서 순서대로 실행
 
-    return {
-        "BINANCE": {"amount": binance_amount, "records_id": binance_records_id},
-        "UPBIT": {"amount": upbit_amount, "records_id": upbit_records_id},
-    }
+    주문 간격은 거래소별 호출 제한(rate limiter)이 맞춘다. 결과는 (원래 순서, 결과 또는 예외, 지연 시간) 목록.
+    """
+    exchange_name = orders[0][1].exchange
+    kis_number = orders[0][1].kis_number
+    results = []
+    start = time.perf_counter()
+    async with get_order_lock(get_bot_key(exchange_name, kis_number)):
+        group_latency = {"lock_wait_ms": elapsed_ms(start)}
+        start = time.perf_counter()
+        try:
+            bot = await asyncio.to_thread(get_bot, exchange_name, kis_number)
+        except Exception as e:
+            return [(index, e, group_latency) for index, _ in orders]
+        group_latency["bot_ms"] = elapsed_ms(start)
+        for index, order_info in orders:
+            start = time.perf_counter()
+            try:
+                order_result = await asyncio.to_thread(execute_order, bot, order_info)
+            except Exception as e:
+                order_result = e
+            results.append((index, order_result, group_latency | {"execute_ms": elapsed_ms(start)}))
+    return results
+
+
+@app.post("/orders/batch")
+async def batch_order(orders: list[MarketOrder], background_tasks: BackgroundTasks, request: Request):
+    """여러 주문을 한 번에 받아 봇별로 묶어 실행 (봇끼리는 병렬, 같은 봇 안에서는 순서대로)"""
+    start = time.perf_counter()
+    raw_orders = await get_raw_order(request)
+    if not isinstance(raw_orders, list) or len(raw_orders) != len(orders):
+        raw_orders = [None] * len(orders)
+    results = [None] * len(orders)
+    idempotency_keys = [None] * len(orders)
+    groups: dict[str, list[tuple[int, MarketOrder]]] = {}
+    for index, order_info in enumerate(orders):
+        idempotency_keys[index], ttl = idempotency.key(order_info)
+        duplicate = idempotency.begin(idempotency_keys[index], ttl)
+        if duplicate is None:
+            duplicate = await idempotency.recall(idempotency_keys[index])
+        if duplicate is not None:
+            background_tasks.add_task(log_duplicate, order_info)
+            results[index] = {"result": "duplicate", "order": duplicate}
+            background_tasks.add_task(
+                journal.record, order_info, "duplicate", duplicate, request=raw_orders[index]
+            )
+            continue
+        bot_key = get_bot_key(order_info.exchange, order_info.kis_number)
+        groups.setdefault(bot_key, []).append((index, order_info))
+
+    group_results = await asyncio.gather(*(run_order_group(group) for group in groups.values()))
+
+    for index, order_result, latency in (item for group in group_results for item in group):
+        order_info = orders[index]
+        latency["total_ms"] = elapsed_ms(start)
+        if isinstance(order_result, Exception):
+            idempotency.release(idempotency_keys[index])
+            error_msg = "\n".join(get_error(order_result))
+            if isinstance(order_result, TypeError):
+                background_tasks.add_task(log_order_error_message, error_msg, order_info)
+            else:
+                background_tasks.add_task(log_error, error_msg, order_info)
+            # 키 누락 등은 HTTPException으로 올라오므로 detail을 사용
+            results[index] = {"result": "error", "error": getattr(order_result, "detail", None) or str(order_result)}
+            background_tasks.add_task(
+                journal.record, order_info, "error", error=results[index]["error"],
+                latency=latency, request=raw_orders[index],
+            )
+        else:
+            idempotency.complete(idempotency_keys[index], order_result)
+            background_tasks.add_task(log, order_info.exchange, order_result, order_info)
+            background_tasks.add_task(
+                journal.record, order_info, "success", order_result,
+                latency=latency, request=raw_orders[index],
+            )
+            results[index] = {"result": "success"}
+    background_tasks.add_task(idempotency.persist)
+    for index, order_info in enumerate(orders):
+        results[index] |= {
+            "exchange": order_info.exchange,
+            "base": order_info.base,
+            "side": order_info.side,
+            "kis_number": order_info.kis_number if order_info.is_stock else None,
+        }
+
+    # 중복으로 건너뛴 주문은 이미 처리된 것이므로 성공으로 본다
+    succeeded = sum(result["result"] in ("success", "duplicate") for result in results)
+    if succeeded == len(results):
+        batch_result = "success"
+    elif succeeded == 0:
+        batch_result = "error"
+    else:
+        batch_result = "partial"
+    return {"result": batch_result, "orders": results}
+
+
+@app.get("/orders/journal")
+async def order_journal(
+    exchange: str | None = None,
+    symbol: str | None = None,
+    status: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    limit: int = 100,
+):
+    """주문 기록 조회 (since/until은 epoch 초, 최근 기록부터)"""
+    return await asyncio.to_thread(
+        journal.query, exchange and exchange.upper(), symbol, status, since, until, min(limit, 1000)
+    )
 
 
 @app.post("/hedge")
 async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
     exchange_name = hedge_data.exchange.upper()
-    bot = get_bot(exchange_name)
-    upbit = get_bot("UPBIT")
-
     base = hedge_data.base
     quote = hedge_data.quote
     amount = hedge_data.amount
     leverage = hedge_data.leverage
     hedge = hedge_data.hedge
 
-    foreign_order_info = OrderRequest(
-        exchange=exchange_name,
-        base=base,
-        quote=quote,
-        side="entry/sell",
-        type="market",
-        amount=amount,
-        leverage=leverage,
-    )
-    bot.init_info(foreign_order_info)
+    try:
+        await hedge_ledger.load()
+    except Exception as e:
+        background_tasks.add_task(
+            log_error_message, traceback.format_exc(), "헷지 원장 로드 에러"
+        )
+        return {"result": "error"}
     if hedge == "ON":
         try:
             if amount is None:
                 raise Exception("헷지할 수량을 요청하세요")
-            binance_order_result = bot.market_entry(foreign_order_info)
-            binance_order_amount = binance_order_result["amount"]
-            pocket.create(
-                "kimp",
-                {
-                    "exchange": "BINANCE",
-                    "base": base,
-                    "quote": quote,
-                    "amount": binance_order_amount,
-                },
+            # 두 거래소 주문을 동시에 보내고, 한쪽만 체결되면 엔진이 체결된 쪽을 되돌린다
+            hedge_result = await hedge_engine.open(exchange_name, base, quote, amount, leverage)
+            background_tasks.add_task(
+                log_hedge_message,
+                exchange_name,
+                base,
+                quote,
+                hedge_result["amount"][exchange_name],
+                hedge_result["amount"]["UPBIT"],
+                hedge,
             )
-            if leverage is None:
-                leverage = 1
-            try:
-                korea_order_info = OrderRequest(
-                    exchange="UPBIT",
-                    base=base,
-                    quote="KRW",
-                    side="buy",
-                    type="market",
-                    amount=binance_order_amount,
-                )
-                upbit.init_info(korea_order_info)
-                upbit_order_result = upbit.market_buy(korea_order_info)
-            except Exception as e:
-                hedge_records = get_hedge_records(base)
-                binance_records_id = hedge_records["BINANCE"]["records_id"]
-                binance_amount = hedge_records["BINANCE"]["amount"]
-                binance_order_result = bot.market_close(
-                    OrderRequest(
-                        exchange=exchange_name,
-                        base=base,
-                        quote=quote,
-                        side="close/buy",
-                        amount=binance_amount,
-                    )
-                )
-                for binance_record_id in binance_records_id:
-                    pocket.delete("kimp", binance_record_id)
-                log_message(
-                    "[헷지 실패] 업비트에서 에러가 발생하여 바이낸스 포지션을 종료합니다"
-                )
-            else:
-                upbit_order_info = upbit.get_order(upbit_order_result["id"])
-                upbit_order_amount = upbit_order_info["filled"]
-                pocket.create(
-                    "kimp",
-                    {
-                        "exchange": "UPBIT",
-                        "base": base,
-                        "quote": "KRW",
-                        "amount": upbit_order_amount,
-                    },
-                )
-                log_hedge_message(
-                    exchange_name,
-                    base,
-                    quote,
-                    binance_order_amount,
-                    upbit_order_amount,
-                    hedge,
-                )
 
         except Exception as e:
             # log_message(f"{e}")
@@ -360,52 +628,30 @@ async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
             )
             return {"result": "error"}
         else:
-            return {"result": "success"}
+            return {"result": "success", "skew_ms": hedge_result["skew_ms"]}
 
     elif hedge == "OFF":
         try:
-            records = pocket.get_full_list(
-                "kimp", query_params={"filter": f'base = "{base}"'}
-            )
-            binance_amount = 0.0
-            binance_records_id = []
-            upbit_amount = 0.0
-            upbit_records_id = []
-            for record in records:
-                if record.exchange == "BINANCE":
-                    binance_amount += record.amount
-                    binance_records_id.append(record.id)
-                elif record.exchange == "UPBIT":
-                    upbit_amount += record.amount
-                    upbit_records_id.append(record.id)
+            hedge_records = hedge_ledger.get(base)
+            binance_amount = hedge_records["BINANCE"]["amount"]
+            upbit_amount = hedge_records["UPBIT"]["amount"]
+            hedge_result = None
 
             if binance_amount > 0 and upbit_amount > 0:
-                # 바이낸스
-                order_info = OrderRequest(
-                    exchange="BINANCE",
-                    base=base,
-                    quote=quote,
-                    side="close/buy",
-                    amount=binance_amount,
-                )
-                binance_order_result = bot.market_close(order_info)
-                for binance_record_id in binance_records_id:
-                    pocket.delete("kimp", binance_record_id)
-                # 업비트
-                order_info = OrderRequest(
-                    exchange="UPBIT",
-                    base=base,
-                    quote="KRW",
-                    side="sell",
-                    amount=upbit_amount,
-                )
-                upbit_order_result = upbit.market_sell(order_info)
-                for upbit_record_id in upbit_records_id:
-                    pocket.delete("kimp", upbit_record_id)
-
-                log_hedge_message(
-                    exchange_name, base, quote, binance_amount, upbit_amount, hedge
-                )
+                # 엔진이 잠금 안에서 원장을 다시 읽으므로 그 사이 다른 요청이 종료했으면 None
+                hedge_result = await hedge_engine.close(exchange_name, base, quote)
+                if hedge_result is None:
+                    log_message(f"{base} 헷지가 이미 종료되었습니다")
+                else:
+                    background_tasks.add_task(
+                        log_hedge_message,
+                        exchange_name,
+                        base,
+                        quote,
+                        hedge_result["amount"][exchange_name],
+                        hedge_result["amount"]["UPBIT"],
+                        hedge,
+                    )
             elif binance_amount == 0 and upbit_amount == 0:
                 log_message(f"{exchange_name}, UPBIT에 종료할 수량이 없습니다")
             elif binance_amount == 0:
@@ -418,4 +664,4 @@ async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
             )
             return {"result": "error"}
         else:
-            return {"result": "success"}
+            return {"result": "success", "skew_ms": hedge_result["skew_ms"] if hedge_result else None}
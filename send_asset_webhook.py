@@ -9,6 +9,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from exchange.stock.kis_improved import ImprovedKoreaInvestment, AssetInfo
 from exchange.utility import settings
+from exchange.utility.fx import fx_rate
 
 def format_discord_message(balance_data: dict, kis_number: int) -> dict:
     """디스코드 웹훅에 보낼 메시지 포맷 생성 (공식 문서 기반 최종 수정)"""
@@ -140,7 +141,8 @@ def main():
         kis_number=kis_number
     )
     
-    balance_data = kis.get_balance()
+    rate = fx_rate.get()
+    balance_data = kis.get_balance(rate["rate"], rate["is_fallback"])
     kis.close()
     
     if balance_data: